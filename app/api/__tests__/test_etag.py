@@ -0,0 +1,36 @@
+from app.api import etag
+
+
+def test_document_etag_is_strong():
+    assert etag.document_etag(7, 3) == '"7-3"'
+
+
+def test_list_etag():
+    tag = etag.list_etag(4, 1, 0, 100, None)
+
+    assert tag.startswith('W/"4-')
+    assert tag == etag.list_etag(4, 1, 0, 100, None)
+    assert tag != etag.list_etag(5, 1, 0, 100, None)
+    assert tag != etag.list_etag(4, 1, 100, 100, None)
+
+
+def test_etag_matches():
+    assert etag.etag_matches('"7-3"', '"7-3"')
+    assert not etag.etag_matches('"7-2"', '"7-3"')
+    assert not etag.etag_matches(None, '"7-3"')
+    assert not etag.etag_matches("", '"7-3"')
+    assert etag.etag_matches(" * ", '"7-3"')
+    # Lists, and weak comparison either way
+    assert etag.etag_matches('"1-1", "7-3"', '"7-3"')
+    assert etag.etag_matches('W/"7-3"', '"7-3"')
+    assert etag.etag_matches('"4-abc"', 'W/"4-abc"')
+    assert not etag.etag_matches('"7-3', '"7-3"')
+
+
+def test_not_modified():
+    response = etag.not_modified('"7-3"')
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == '"7-3"'
+    assert response.headers["cache-control"] == etag.CACHE_CONTROL
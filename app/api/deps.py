@@ -1,13 +1,17 @@
-from typing import Generator, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Generator, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import crud, models, schemas
 from app.core import security
+from app.core.auth_cache import auth_cache
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.core.singleflight import SingleFlight
+from app.db.session import AsyncSessionLocal, SessionLocal, async_replicas, get_async_db, replicas
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -20,9 +24,40 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> models.User:
+# Read-only dependencies: a session on a healthy replica, or the request's
+# primary session when there is none. Sessions only connect when first used,
+# so an unused primary session costs nothing.
+def get_read_db(db: Session = Depends(get_db)) -> Generator:
+    replica = replicas.pick() if replicas else None
+    if replica is None:
+        yield db
+        return
+    read_db = SessionLocal(bind=replica)
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+async def get_async_read_db(db: AsyncSession = Depends(get_async_db)) -> AsyncGenerator:
+    replica = await async_replicas.pick_async() if async_replicas else None
+    if replica is None:
+        yield db
+        return
+    async with AsyncSessionLocal(bind=replica) as read_db:
+        yield read_db
+
+@asynccontextmanager
+async def async_read_session() -> AsyncIterator[AsyncSession]:
+    """A read session of its own, for work that outlives the request's dependencies."""
+    replica = await async_replicas.pick_async() if async_replicas else None
+    async with (AsyncSessionLocal(bind=replica) if replica else AsyncSessionLocal()) as db:
+        yield db
+
+def _token_subject(token: str) -> Optional[int]:
+    """The user id a token was issued for, verifying the token on a cache miss."""
+    subject = auth_cache.get_subject(token)
+    if subject is not None:
+        return subject
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -33,9 +68,44 @@ def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = crud.user.get(db, id=token_data.sub)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    if token_data.sub is not None:
+        auth_cache.set_subject(token, token_data.sub, expires_at=payload.get("exp"))
+    return token_data.sub
+
+# Concurrent cache misses for the same user share one lookup. The shared
+# result is the user's column values; every request gets its own User.
+user_loads = SingleFlight()
+
+def _load_user(db: Session, user_id: int) -> Optional[Dict[str, Any]]:
+    user = crud.user.get(db, id=user_id)
+    return auth_cache.set_user(user) if user else None
+
+async def _load_user_async(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]]:
+    user = await crud.user.get_async(db, id=user_id)
+    return auth_cache.set_user(user) if user else None
+
+def get_current_user(
+    db: Session = Depends(get_read_db), token: str = Depends(reusable_oauth2)
+) -> models.User:
+    user_id = _token_subject(token)
+    user = auth_cache.get_user(user_id)
+    if user is None:
+        values = user_loads.do(user_id, lambda: _load_user(db, user_id))
+        if values is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = auth_cache.detached_user(values)
+    return user
+
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_read_db), token: str = Depends(reusable_oauth2)
+) -> models.User:
+    user_id = _token_subject(token)
+    user = auth_cache.get_user(user_id)
+    if user is None:
+        values = await user_loads.do_async(user_id, lambda: _load_user_async(db, user_id))
+        if values is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user = auth_cache.detached_user(values)
     return user
 
 def get_current_active_user(
@@ -45,6 +115,13 @@ def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_active_user_async(
+    current_user: models.User = Depends(get_current_user_async),
+) -> models.User:
+    if not crud.user.is_active(current_user):
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
 def get_current_active_superuser(
     current_user: models.User = Depends(get_current_user),
 ) -> models.User:
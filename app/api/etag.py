@@ -0,0 +1,33 @@
+import hashlib
+from typing import Any, Optional
+from fastapi import Response
+
+# Per-user data: browsers may keep it, but must revalidate before reuse
+CACHE_CONTROL = "private, no-cache"
+
+def document_etag(id: int, version: int) -> str:
+    return f'"{id}-{version}"'
+
+def list_etag(generation: int, *params: Any) -> str:
+    """
+    Weak ETag of a list response: the user's document generation plus a hash
+    of the parameters that shaped it.
+    """
+    digest = hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()
+    return f'W/"{generation}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match calls for."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
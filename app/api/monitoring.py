@@ -0,0 +1,62 @@
+import hmac
+from typing import Dict, Optional
+from fastapi import APIRouter, Header, HTTPException, Response, status
+from app.api.deps import user_loads
+from app.core import metrics
+from app.core.config import settings
+from app.core.search_cache import search_cache
+from app.crud.crud_knowledge import document_reads
+
+router = APIRouter()
+
+# Shared calls, by the name of their SingleFlight
+_single_flights = {"document_reads": document_reads, "user_loads": user_loads}
+
+
+def _search_cache(key: str) -> Dict[metrics.Labels, float]:
+    return {(): search_cache.stats()[key]}
+
+
+def _single_flight(key: str) -> Dict[metrics.Labels, float]:
+    return {(name,): flight.stats()[key] for name, flight in _single_flights.items()}
+
+
+metrics.registry.register(metrics.Collected(
+    "nibblify_search_cache_hits_total", "Search cache lookups that found a result.",
+    type="counter", collect=lambda: _search_cache("hits"),
+))
+metrics.registry.register(metrics.Collected(
+    "nibblify_search_cache_misses_total", "Search cache lookups that found nothing.",
+    type="counter", collect=lambda: _search_cache("misses"),
+))
+metrics.registry.register(metrics.Collected(
+    "nibblify_singleflight_calls_total", "Calls made through each SingleFlight.",
+    ("name",), type="counter", collect=lambda: _single_flight("calls"),
+))
+metrics.registry.register(metrics.Collected(
+    "nibblify_singleflight_coalesced_total", "Calls that shared the result of an identical call in flight.",
+    ("name",), type="counter", collect=lambda: _single_flight("coalesced"),
+))
+
+
+def _check_metrics_token(authorization: Optional[str]) -> None:
+    if settings.METRICS_TOKEN is None:
+        return
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if authorization is None or not hmac.compare_digest(authorization.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics(authorization: Optional[str] = Header(None)) -> Response:
+    """
+    Metrics of this worker process in the Prometheus text format. Every
+    worker keeps its own: scrape each one, or run a single worker. Guarded
+    by METRICS_TOKEN when it is set.
+    """
+    _check_metrics_token(authorization)
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
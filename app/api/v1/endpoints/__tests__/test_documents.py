@@ -0,0 +1,70 @@
+import asyncio
+import json
+from typing import Any, Dict
+from app import crud, schemas
+from app.core import security
+from app.core.config import settings
+
+API = f"{settings.API_V1_STR}/knowledge"
+
+
+def send(request: Any) -> Any:
+    return asyncio.run(request)
+
+
+def test_document_etag(client: Any, auth: Dict[str, str], db: Any, user: Any):
+    document = crud.document.create_with_user(
+        db, obj_in=schemas.DocumentCreate(title="Notes", content="first"), user_id=user.id
+    )
+    path = f"{API}/documents/{document.id}"
+
+    first = send(client.get(path, headers=auth))
+    tag = first.headers["etag"]
+    assert first.status == 200
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    unchanged = send(client.get(path, headers={**auth, "if-none-match": tag}))
+    assert unchanged.status == 304
+    assert unchanged.body == b""
+    assert unchanged.headers["etag"] == tag
+
+    updated = send(client.request(
+        "PUT", path, headers={**auth, "content-type": "application/json"},
+        body=json.dumps({"content": "second"}).encode(),
+    ))
+    assert updated.status == 200
+    changed = send(client.get(path, headers={**auth, "if-none-match": tag}))
+    assert changed.status == 200
+    assert changed.headers["etag"] != tag
+    assert json.loads(changed.body)["content"] == "second"
+
+
+def test_document_etag_needs_ownership(client: Any, auth: Dict[str, str], db: Any, user: Any):
+    document = crud.document.create_with_user(
+        db, obj_in=schemas.DocumentCreate(title="Private", content="mine"), user_id=user.id
+    )
+    path = f"{API}/documents/{document.id}"
+    tag = send(client.get(path, headers=auth)).headers["etag"]
+    other = crud.user.create(db, obj_in=schemas.UserCreate(email=f"other{user.id}@example.com", password="secret"))
+    other_auth = {"authorization": f"Bearer {security.create_access_token(other.id)}"}
+
+    # A matching tag does not reveal the document to another user
+    assert send(client.get(path, headers={**other_auth, "if-none-match": tag})).status == 403
+
+
+def test_list_etag(client: Any, auth: Dict[str, str], db: Any, user: Any):
+    path = f"{API}/documents"
+    first = send(client.get(path, headers=auth))
+    tag = first.headers["etag"]
+    assert first.status == 200
+    assert tag.startswith("W/")
+
+    assert send(client.get(path, headers={**auth, "if-none-match": tag})).status == 304
+    # Other parameters, other representation
+    assert send(client.get(path, params={"limit": 5}, headers={**auth, "if-none-match": tag})).status == 200
+
+    crud.document.create_with_user(db, obj_in=schemas.DocumentCreate(title="New", content=""), user_id=user.id)
+    changed = send(client.get(path, headers={**auth, "if-none-match": tag}))
+    assert changed.status == 200
+    assert changed.headers["etag"] != tag
+    assert [document["title"] for document in json.loads(changed.body)] == ["New"]
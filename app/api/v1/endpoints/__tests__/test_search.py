@@ -0,0 +1,88 @@
+import asyncio
+import json
+import random
+import threading
+from typing import Any, List
+import pytest
+from app import crud, schemas
+from app.core.config import settings
+
+API = f"{settings.API_V1_STR}/knowledge"
+WORDS = [f"word{n}" for n in range(500)]
+
+
+@pytest.fixture
+def documents(db: Any, user: Any) -> List[int]:
+    """A few hundred documents of random words for the user."""
+    rng = random.Random(0)
+    return crud.document.create_many_with_user(db, objs_in=[
+        schemas.DocumentCreate(
+            title=" ".join(rng.choices(WORDS, k=4)), content=" ".join(rng.choices(WORDS, k=80))
+        )
+        for _ in range(300)
+    ], user_id=user.id)
+
+
+def gather(*requests: Any, timeout: float = 30) -> List[Any]:
+    """
+    Send requests concurrently on one event loop, as a server would. The loop
+    runs on a thread of its own, so a test fails rather than hangs when
+    something blocks it.
+    """
+    async def main() -> List[Any]:
+        return await asyncio.gather(*requests)
+
+    results: List[Any] = []
+    thread = threading.Thread(target=lambda: results.extend(asyncio.run(main())), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"requests still running after {timeout}s"
+    return results
+
+
+def test_concurrent_cold_searches_do_not_deadlock(client: Any, auth: Any, documents: List[int]):
+    # Both searches need the user's index, which neither has built yet
+    responses = gather(
+        client.post_json(f"{API}/documents/search", {"query": "word1"}, headers=auth),
+        client.post_json(f"{API}/documents/search", {"query": "word2"}, headers=auth),
+        client.get(f"{API}/documents/typeahead", params={"q": "word3"}, headers=auth),
+    )
+
+    assert [response.status for response in responses] == [200, 200, 200]
+
+
+def test_concurrent_cold_hybrid_searches_do_not_deadlock(client: Any, auth: Any, documents: List[int]):
+    # Hybrid searches need both the keyword index and the semantic one
+    responses = gather(*(
+        client.post_json(f"{API}/documents/search", {"query": f"word{n}", "mode": mode}, headers=auth)
+        for n, mode in enumerate(("hybrid", "hybrid", "semantic", "keyword"))
+    ))
+
+    assert [response.status for response in responses] == [200, 200, 200, 200]
+
+
+@pytest.mark.parametrize("mode", ["keyword", "semantic", "hybrid"])
+def test_has_more_ends_with_the_last_page(client: Any, auth: Any, documents: List[int], mode: str):
+    def page(number: int) -> Any:
+        [response] = gather(client.post_json(
+            f"{API}/documents/search", {"query": "word1 word2", "mode": mode, "page": number, "limit": 3},
+            headers=auth,
+        ))
+        assert response.status == 200
+        return json.loads(response.body)
+
+    seen: List[int] = []
+    number = 1
+    result = page(number)
+    while result["has_more"]:
+        assert len(result["documents"]) == 3
+        seen.extend(document["id"] for document in result["documents"])
+        number += 1
+        result = page(number)
+    seen.extend(document["id"] for document in result["documents"])
+
+    assert number > 1
+    assert len(seen) == len(set(seen))
+    # Hybrid pages end with both rankings, while their union can be longer than either
+    if mode != "hybrid":
+        assert page(number + 1)["documents"] == []
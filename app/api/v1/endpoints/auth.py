@@ -2,7 +2,7 @@ from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud, models, schemas
 from app.api import deps
 from app.core import security
@@ -11,16 +11,20 @@ from app.core.config import settings
 router = APIRouter()
 
 @router.post("/login/access-token", response_model=schemas.Token)
-def login_access_token(
-    db: Session = Depends(deps.get_db),
+async def login_access_token(
+    db: AsyncSession = Depends(deps.get_async_db),
+    read_db: AsyncSession = Depends(deps.get_async_read_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.user.authenticate(
-        db, email=form_data.username, password=form_data.password
-    )
+    try:
+        user = await crud.user.authenticate_async(
+            read_db, email=form_data.username, password=form_data.password, write_db=db
+        )
+    except security.HashingOverloaded:
+        raise _overloaded()
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not crud.user.is_active(user):
@@ -34,23 +38,33 @@ def login_access_token(
     }
 
 @router.post("/register", response_model=schemas.User)
-def register_user(
+async def register_user(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     user_in: schemas.UserCreate,
 ) -> Any:
     """
     Create new user.
     """
-    user = crud.user.get_by_email(db, email=user_in.email)
+    user = await crud.user.get_by_email_async(db, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
-    user = crud.user.create(db, obj_in=user_in)
+    try:
+        user = await crud.user.create_async(db, obj_in=user_in)
+    except security.HashingOverloaded:
+        raise _overloaded()
     return user
 
+def _overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many password operations in progress, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.get("/me", response_model=schemas.User)
 def read_users_me(
     current_user: models.User = Depends(deps.get_current_active_user),
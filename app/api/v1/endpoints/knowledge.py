@@ -1,153 +1,566 @@
-from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+import logging
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import crud, models, schemas
-from app.api import deps
+from app.api import deps, etag
 import os
-import uuid
+import zlib
+from starlette.concurrency import run_in_threadpool
+from app.core import ndjson
 from app.core.config import settings
+from app.core.storage import UploadTooLarge, blob_store
+from app.crud.crud_knowledge import DuplicateDocument
+from app.db.pagination import cursor_for
+from app.ingest.pipeline import ingestion
+from app.models.knowledge import IngestStatus
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Import errors listed in the response; the rest are only counted
+IMPORT_MAX_ERRORS = 100
+
+OnDuplicate = Literal["allow", "flag", "reject", "merge"]
+
 # Document endpoints
+def _duplicate(e: DuplicateDocument) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={
+            "message": f"Near-duplicate of document {e.duplicate_of}",
+            "duplicate_of": e.duplicate_of,
+            "similarity": e.similarity,
+        },
+    )
+
 @router.post("/documents", response_model=schemas.Document)
-def create_document(
+async def create_document(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     document_in: schemas.DocumentCreate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    on_duplicate: OnDuplicate = "flag",
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Create new document.
+
+    When it near-duplicates an existing document, `on_duplicate=flag` (the
+    default) sets `duplicate_of`, `reject` answers 409, `merge` updates and
+    returns the existing document instead, and `allow` skips the check.
     """
-    document = crud.document.create_with_user(
-        db=db, obj_in=document_in, user_id=current_user.id
-    )
+    try:
+        document = await crud.document.create_with_user_async(
+            db=db, obj_in=document_in, user_id=current_user.id, on_duplicate=on_duplicate
+        )
+    except DuplicateDocument as e:
+        raise _duplicate(e)
     return document
 
 @router.post("/documents/upload", response_model=schemas.Document)
 async def upload_document(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     file: UploadFile = File(...),
     title: str = Form(...),
-    current_user: models.User = Depends(deps.get_current_active_user),
+    on_duplicate: OnDuplicate = "flag",
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Upload a document file.
+
+    `on_duplicate` applies as for document creation to an earlier upload of
+    the same file. Near-duplicate text is only known after extraction, and is
+    then flagged.
     """
-    # Create upload directory if it doesn't exist
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    
-    # Generate unique filename
     file_ext = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
+
+    # Store the file under its content hash
+    try:
+        pending = await blob_store.receive(file)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+
     # Create document
     document_in = schemas.DocumentCreate(
         title=title,
-        file_path=file_path,
         file_type=file_ext[1:],  # Remove the dot
     )
-    
-    document = crud.document.create_with_user(
-        db=db, obj_in=document_in, user_id=current_user.id
-    )
+
+    try:
+        document = await crud.document.create_with_user_async(
+            db=db, obj_in=document_in, user_id=current_user.id, blob=pending.blob,
+            on_duplicate=on_duplicate,
+        )
+    except DuplicateDocument as e:
+        blob_store.discard(pending)
+        raise _duplicate(e)
+    except BaseException:
+        blob_store.discard(pending)
+        raise
+    await run_in_threadpool(blob_store.publish, pending)
+    if document.ingest_status == IngestStatus.pending.value:
+        # Extraction happens in the background; the document starts out "pending"
+        if not ingestion.submit(document.id):
+            logger.warning("Ingestion queue is full, document %s waits for the next sweep", document.id)
     return document
 
-@router.get("/documents", response_model=List[schemas.Document])
-def read_documents(
-    db: Session = Depends(deps.get_db),
+def _check_batch_size(size: int) -> None:
+    if size > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.BULK_MAX_ITEMS} items per request"
+        )
+
+def _validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()
+    )
+
+def _bulk_result(results: List[schemas.BulkItemResult]) -> schemas.BulkResult:
+    succeeded = sum(result.ok for result in results)
+    return schemas.BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+def _bulk_ids_result(ids: List[int], done: List[int]) -> schemas.BulkResult:
+    done_ids = set(done)
+    return _bulk_result([
+        schemas.BulkItemResult(index=index, id=id, ok=True)
+        if id in done_ids
+        else schemas.BulkItemResult(index=index, id=id, ok=False, error="Document not found")
+        for index, id in enumerate(ids)
+    ])
+
+@router.post("/documents/bulk", response_model=schemas.BulkResult)
+async def create_documents_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    batch: schemas.DocumentBulkCreate,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Create many documents in one transaction.
+
+    Invalid items are reported by index and the others are still created.
+    """
+    _check_batch_size(len(batch.documents))
+    results: List[Optional[schemas.BulkItemResult]] = [None] * len(batch.documents)
+    valid = []
+    for index, item in enumerate(batch.documents):
+        try:
+            valid.append((index, schemas.DocumentCreate.parse_obj(item)))
+        except ValidationError as e:
+            results[index] = schemas.BulkItemResult(index=index, ok=False, error=_validation_error(e))
+    ids = await crud.document.create_many_with_user_async(
+        db=db, objs_in=[document_in for _, document_in in valid], user_id=current_user.id
+    )
+    for (index, _), id in zip(valid, ids):
+        results[index] = schemas.BulkItemResult(index=index, id=id, ok=True)
+    return _bulk_result(results)
+
+@router.patch("/documents/bulk", response_model=schemas.BulkResult)
+async def update_documents_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    batch: schemas.DocumentBulkUpdate,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Update many documents in one transaction. Each item holds an `id` and
+    the fields to change.
+    """
+    _check_batch_size(len(batch.documents))
+    results: List[Optional[schemas.BulkItemResult]] = [None] * len(batch.documents)
+    items = {}
+    for index, item in enumerate(batch.documents):
+        try:
+            item_in = schemas.DocumentBulkUpdateItem.parse_obj(item)
+        except ValidationError as e:
+            results[index] = schemas.BulkItemResult(index=index, ok=False, error=_validation_error(e))
+            continue
+        if item_in.id in items:
+            results[index] = schemas.BulkItemResult(
+                index=index, id=item_in.id, ok=False, error="Duplicate id in batch"
+            )
+            continue
+        changes = jsonable_encoder(item_in.dict(exclude_unset=True, exclude={"id"}))
+        items[item_in.id] = (index, changes)
+    updated = set(await crud.document.update_many_with_user_async(
+        db=db,
+        items=[(id, changes) for id, (_, changes) in items.items()],
+        user_id=current_user.id,
+    ))
+    for id, (index, _) in items.items():
+        if id in updated:
+            results[index] = schemas.BulkItemResult(index=index, id=id, ok=True)
+        else:
+            results[index] = schemas.BulkItemResult(index=index, id=id, ok=False, error="Document not found")
+    return _bulk_result(results)
+
+@router.post("/documents/bulk/archive", response_model=schemas.BulkResult)
+async def archive_documents_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    batch: schemas.DocumentBulkArchive,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Archive (or, with `is_archived: false`, unarchive) many documents.
+    """
+    _check_batch_size(len(batch.ids))
+    updated = await crud.document.set_archived_many_async(
+        db=db, ids=batch.ids, user_id=current_user.id, is_archived=batch.is_archived
+    )
+    return _bulk_ids_result(batch.ids, updated)
+
+@router.post("/documents/bulk/delete", response_model=schemas.BulkResult)
+async def delete_documents_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    batch: schemas.DocumentBulkIds,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Delete many documents in one transaction.
+    """
+    _check_batch_size(len(batch.ids))
+    deleted, files = await crud.document.remove_many_with_user_async(
+        db=db, ids=batch.ids, user_id=current_user.id
+    )
+    # Stored blobs are left to garbage collection; old-style files are removed after the response
+    if files:
+        background_tasks.add_task(crud.document.remove_files, files)
+    return _bulk_ids_result(batch.ids, deleted)
+
+@router.get("/documents/typeahead", response_model=List[schemas.TitleSuggestion])
+async def typeahead(
+    *,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    include_archived: bool = False,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Title suggestions for a search box: the most recent documents whose title
+    has a word starting with each word of `q`.
+    """
+    return await crud.document.suggest_titles_async(
+        db, user_id=current_user.id, prefix=q, limit=limit, include_archived=include_archived
+    )
+
+@router.get("/documents/tags", response_model=List[schemas.TagCount])
+async def read_tags(
+    *,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    The automatic tags of the user's documents, most used first. Search for
+    a tag's documents with the "tag" search filter.
+    """
+    return await crud.tag.get_multi_by_user_async(db, user_id=current_user.id, limit=limit)
+
+@router.get("/documents/export")
+async def export_documents(
+    *,
+    gzip: bool = False,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Download all documents as NDJSON, one document per line, optionally gzip-compressed.
+    """
+    user_id = current_user.id
+
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        # The stream is consumed after the endpoint returns, so it uses its own session
+        async with deps.async_read_session() as db:
+            async for record in crud.document.stream_export_async(
+                db, user_id=user_id, batch_size=settings.EXPORT_BATCH_SIZE
+            ):
+                yield record
+
+    filename = "documents.ndjson.gz" if gzip else "documents.ndjson"
+    return StreamingResponse(
+        ndjson.encode(records(), compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/documents/import", response_model=schemas.ImportResult)
+async def import_documents(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Import documents from an NDJSON export; send `Content-Encoding: gzip` for a compressed one.
+
+    Lines are inserted in batches of IMPORT_BATCH_SIZE, each in its own
+    transaction, while the body is still being received.
+    """
+    compressed = request.headers.get("content-encoding", "").lower() == "gzip"
+    imported = 0
+    errors: List[schemas.ImportLineError] = []
+    failed = 0
+    batch: List[schemas.DocumentImport] = []
+
+    async def flush() -> int:
+        ids = await crud.document.import_many_with_user_async(
+            db=db, objs_in=batch, user_id=current_user.id
+        )
+        batch.clear()
+        return len(ids)
+
+    try:
+        async for line, value in ndjson.decode(
+            request.stream(), compressed=compressed, max_line=settings.MAX_UPLOAD_SIZE
+        ):
+            error = None
+            if isinstance(value, ValueError):
+                error = "Invalid JSON"
+            else:
+                try:
+                    batch.append(schemas.DocumentImport.parse_obj(value))
+                except ValidationError as e:
+                    error = _validation_error(e)
+            if error:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append(schemas.ImportLineError(line=line, error=error))
+            if len(batch) >= settings.IMPORT_BATCH_SIZE:
+                imported += await flush()
+        imported += await flush()
+    except ndjson.LineTooLong:
+        raise HTTPException(
+            status_code=413, detail=f"Line too long; {imported} documents were imported before it"
+        )
+    except zlib.error:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid gzip data; {imported} documents were imported before it"
+        )
+    return schemas.ImportResult(imported=imported, failed=failed, errors=errors)
+
+def _selected_fields(view: str, fields: Optional[List[str]]) -> Optional[List[str]]:
+    """The fields to return besides `id`, or None for full documents."""
+    if fields is None:
+        return list(schemas.SUMMARY_FIELDS) if view == "summary" else None
+    names = [name.strip() for name in fields if name.strip()]
+    unknown = set(names) - set(schemas.DOCUMENT_FIELDS) - {"id"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in dict.fromkeys(names) if name != "id"]
+
+@router.get(
+    "/documents",
+    response_model=List[schemas.DocumentPartial],
+    response_model_exclude_unset=True,
+)
+async def read_documents(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    fields: Optional[str] = None,
+    include_archived: bool = True,
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
-    Retrieve documents.
+    Retrieve documents, newest first; `include_archived=false` leaves out archived ones.
+
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    `view=summary` leaves out the content; `fields=title,created_at` returns
+    just those fields (and `id`). Only the selected columns are read.
+
+    Responses carry a weak ETag that changes with any write to the user's
+    documents; send it as If-None-Match to get a 304 while nothing changed.
     """
-    documents = crud.document.get_multi_by_user(
-        db=db, user_id=current_user.id, skip=skip, limit=limit
-    )
+    selected = _selected_fields(view, fields.split(",") if fields is not None else None)
+    # Read before the page itself, so a concurrent write can only make the ETag too old, never too new
+    generation = await crud.document.get_generation_async(db, user_id=current_user.id)
+    list_tag = etag.list_etag(generation, current_user.id, skip, limit, cursor, selected, include_archived)
+    if etag.etag_matches(if_none_match, list_tag):
+        return etag.not_modified(list_tag)
+    etag.set_etag(response, list_tag)
+    try:
+        documents = await crud.document.get_multi_by_user_async(
+            db=db, user_id=current_user.id, skip=skip, limit=limit + 1, cursor=cursor,
+            fields=selected, include_archived=include_archived, generation=generation,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(documents) > limit:
+        documents = documents[:limit]
+        response.headers["X-Next-Cursor"] = cursor_for(documents[-1])
+    if selected is not None:
+        return [{name: row._mapping[name] for name in ("id", *selected)} for row in documents]
     return documents
 
 @router.get("/documents/{document_id}", response_model=schemas.Document)
-def read_document(
+async def read_document(
     *,
-    db: Session = Depends(deps.get_db),
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
     document_id: int,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Get document by ID.
+
+    The response carries a strong ETag; send it as If-None-Match to get a 304,
+    decided without loading the document, while it is unchanged.
     """
-    document = crud.document.get(db=db, id=document_id)
+    if if_none_match:
+        current = await crud.document.get_version_async(db, id=document_id)
+        if current is not None and current.user_id == current_user.id:
+            document_tag = etag.document_etag(document_id, current.version)
+            if etag.etag_matches(if_none_match, document_tag):
+                return etag.not_modified(document_tag)
+    document = await crud.document.get_shared_async(db=db, id=document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     if document.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
+    etag.set_etag(response, etag.document_etag(document.id, document.version))
     return document
 
+@router.get(
+    "/documents/{document_id}/similar",
+    response_model=List[schemas.SearchHitPartial],
+    response_model_exclude_unset=True,
+)
+async def similar_documents(
+    *,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    document_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Documents closest in meaning to this one, most similar first; `rank` is
+    their cosine similarity. Returns the summary fields.
+    """
+    # Ownership only: the document itself is not loaded
+    current = await crud.document.get_version_async(db, id=document_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if current.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    similar = await crud.document.similar_async(db, id=document_id, user_id=current_user.id, limit=limit)
+    return [
+        {"id": hit.id, **{name: getattr(hit, name) for name in schemas.SUMMARY_FIELDS}, "rank": score}
+        for hit, score in similar
+    ]
+
+@router.get("/documents/{document_id}/tags", response_model=List[schemas.DocumentTagScore])
+async def read_document_tags(
+    *,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    document_id: int,
+    current_user: models.User = Depends(deps.get_current_active_user_async),
+) -> Any:
+    """
+    Keyphrases extracted from the document as tags, best first. Uploads are
+    tagged once their text has been extracted.
+    """
+    current = await crud.document.get_version_async(db, id=document_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if current.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return await crud.tag.get_by_document_async(db, document_id=document_id)
+
 @router.put("/documents/{document_id}", response_model=schemas.Document)
-def update_document(
+async def update_document(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     document_id: int,
     document_in: schemas.DocumentUpdate,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Update a document.
     """
-    document = crud.document.get(db=db, id=document_id)
+    document = await crud.document.get_async(db=db, id=document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     if document.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    document = crud.document.update_with_user(
+    document = await crud.document.update_with_user_async(
         db=db, db_obj=document, obj_in=document_in
     )
     return document
 
 @router.delete("/documents/{document_id}", response_model=schemas.Document)
-def delete_document(
+async def delete_document(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     document_id: int,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Delete a document.
     """
-    document = crud.document.get(db=db, id=document_id)
+    document = await crud.document.get_async(db=db, id=document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     if document.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
-    document = crud.document.remove_with_user(db=db, id=document_id, user_id=current_user.id)
+    document = await crud.document.remove_with_user_async(
+        db=db, id=document_id, user_id=current_user.id
+    )
     return document
 
-@router.post("/documents/search", response_model=schemas.SearchResult)
-def search_documents(
+@router.post(
+    "/documents/search",
+    response_model=schemas.SearchResult,
+    response_model_exclude_unset=True,
+)
+async def search_documents(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_read_db),
     query: schemas.SearchQuery,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    current_user: models.User = Depends(deps.get_current_active_user_async),
 ) -> Any:
     """
     Search documents.
+
+    `view` and `fields` narrow the returned documents as for the document list;
+    `rank` and `snippet` are always included. `filters` is described by
+    SearchFilters; `facets: true` adds match counts for a filter sidebar.
     """
-    result = crud.document.search(
-        db=db,
-        user_id=current_user.id,
-        query=query.query,
-        filters=query.filters,
-        page=query.page,
-        limit=query.limit
-    )
+    selected = _selected_fields(query.view, query.fields)
+    try:
+        result = await crud.document.search_async(
+            db=db,
+            user_id=current_user.id,
+            query=query.query,
+            filters=query.filters and query.filters.dict(exclude_none=True),
+            page=query.page,
+            limit=query.limit,
+            include_content=query.include_content and (selected is None or "content" in selected),
+            count=query.count,
+            sort=query.sort,
+            cursor=query.cursor,
+            mode=query.mode,
+            facets=query.facets,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if selected is not None:
+        # The result may be cached: trim a copy
+        result = {**result, "documents": [
+            {name: hit[name] for name in ("id", *selected, "rank", "snippet")}
+            for hit in result["documents"]
+        ]}
     return result 
\ No newline at end of file
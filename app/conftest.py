@@ -0,0 +1,73 @@
+"""
+Test setup: the application runs on a throwaway SQLite database, with scratch
+directories and the in-process search engine. The environment is set here,
+before any test imports the application.
+"""
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator
+
+_workdir = tempfile.mkdtemp(prefix="nibblify-tests-")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+# Never read from the replicas of a real deployment configured in .env
+os.environ["SQLALCHEMY_REPLICA_URIS"] = "[]"
+os.environ["UPLOAD_DIR"] = os.path.join(_workdir, "uploads")
+os.environ["SEARCH_CACHE_DIR"] = os.path.join(_workdir, "search_cache")
+os.environ["AUTH_CACHE_INVALIDATION_FILE"] = os.path.join(_workdir, "auth_invalidations")
+os.environ["SEARCH_BACKEND"] = "memory"
+# Every request reaches the search engines
+os.environ["SEARCH_CACHE_BACKEND"] = "none"
+
+import pytest
+
+# A script run against a live server (python test_api.py), not a pytest module
+collect_ignore = ["api/v1/endpoints/__tests__/test_api.py"]
+
+
+@pytest.fixture(scope="session")
+def engine() -> Iterator[Any]:
+    from app.db import base  # noqa: F401 (registers the models)
+    from app.db.migrate import migrate
+    from app.db.session import engine
+
+    migrate(engine)
+    yield engine
+    engine.dispose()
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def db(engine: Any) -> Iterator[Any]:
+    from app.db.session import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def user(db: Any) -> Any:
+    """A new user, with no documents."""
+    from app import crud, schemas
+
+    count = db.query(crud.user.model).count()
+    return crud.user.create(db, obj_in=schemas.UserCreate(email=f"user{count}@example.com", password="secret"))
+
+
+@pytest.fixture
+def auth(user: Any) -> Dict[str, str]:
+    from app.core import security
+
+    return {"authorization": f"Bearer {security.create_access_token(user.id)}"}
+
+
+@pytest.fixture
+def client(engine: Any) -> Any:
+    from app.main import app
+    from app.search import search_backend, semantic_index
+    from benchmarks.asgi import ASGIClient
+
+    # Every test starts with cold in-process indexes
+    search_backend.clear()
+    semantic_index.clear()
+    return ASGIClient(app)
@@ -0,0 +1,79 @@
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.core.cache import InvalidationBackend, TTLCache, create_invalidation_backend
+from app.core.config import settings
+from app.models.user import User
+
+
+class AuthCache:
+    """
+    Caches verified access tokens and the users they belong to.
+
+    Tokens map to their subject until the cache TTL or the token's own expiry,
+    whichever comes first. Users are cached as plain column values and turned
+    into a fresh detached User for every request, so that endpoints can still
+    add them to a session. CRUDUser invalidates a user whenever it is changed
+    or removed; the invalidation backend passes that on to other workers.
+    """
+
+    def __init__(self, invalidations: InvalidationBackend, *, max_entries: int = 10_000, ttl: float = 60):
+        self.invalidations = invalidations
+        self._tokens: TTLCache[int] = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._users: TTLCache[Dict[str, Any]] = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def get_subject(self, token: str) -> Optional[int]:
+        return self._tokens.get(token)
+
+    def set_subject(self, token: str, subject: int, *, expires_at: Optional[float] = None) -> None:
+        ttl = None
+        if expires_at is not None:
+            ttl = min(self._tokens.ttl, expires_at - time.time())
+            if ttl <= 0:
+                return
+        self._tokens.set(token, subject, ttl=ttl)
+
+    def get_user(self, id: int) -> Optional[User]:
+        self._apply_invalidations()
+        values = self._users.get(id)
+        if values is None:
+            return None
+        return self.detached_user(values)
+
+    def set_user(self, user: User) -> Dict[str, Any]:
+        """Cache a user; returns the cached values for `detached_user`."""
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        self._users.set(user.id, values)
+        return values
+
+    @staticmethod
+    def detached_user(values: Dict[str, Any]) -> User:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def invalidate_user(self, id: int) -> None:
+        self._users.delete(id)
+        self.invalidations.publish(str(id))
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._users.clear()
+
+    def _apply_invalidations(self) -> None:
+        keys = self.invalidations.poll()
+        if keys is None:
+            self._users.clear()
+            return
+        for key in keys:
+            self._users.delete(int(key))
+
+
+auth_cache = AuthCache(
+    create_invalidation_backend(
+        settings.AUTH_CACHE_BACKEND, path=settings.AUTH_CACHE_INVALIDATION_FILE
+    ),
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL,
+)
@@ -0,0 +1,258 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, *, max_entries: int = 10_000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V, *, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class InvalidationBackend:
+    """
+    Carries cache invalidations between the worker processes of a deployment.
+
+    `publish` announces that a key changed; `poll` returns the keys announced
+    since the previous poll, or None when invalidations may have been missed
+    and the whole cache has to be dropped.
+    """
+
+    def publish(self, key: str) -> None:
+        pass
+
+    def poll(self) -> Optional[List[str]]:
+        return []
+
+
+class LocalInvalidationBackend(InvalidationBackend):
+    """Single-process deployments: invalidations are applied locally only."""
+
+
+class FileInvalidationBackend(InvalidationBackend):
+    """
+    Stand-in for a pub/sub channel shared by the workers of one host.
+
+    Invalidated keys are appended, one per line, to a shared log file and
+    every process reads the lines added since its last poll; a poll costs a
+    single stat() when nothing changed. Appends of a short line are atomic
+    with O_APPEND. Truncating the file makes every process drop its cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # History from before this process started is irrelevant to an empty cache
+        self._offset = self._size()
+
+    def _size(self) -> int:
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def publish(self, key: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as log:
+            log.write(f"{key}\n")
+
+    def poll(self) -> Optional[List[str]]:
+        size = self._size()
+        with self._lock:
+            if size == self._offset:
+                return []
+            if size < self._offset:
+                self._offset = size
+                return None
+            with open(self.path, "rb") as log:
+                log.seek(self._offset)
+                data = log.read(size - self._offset)
+            # Leave a partially written last line for the next poll
+            complete = data.rfind(b"\n") + 1
+            self._offset += complete
+        return data[:complete].decode("utf-8").split()
+
+
+class CacheStore(ABC):
+    """
+    Where a cache keeps its values: `get` returns None on a miss.
+
+    Keys are strings and values must be JSON-serializable, so that a store
+    can be shared by the worker processes of a deployment.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+class NullCacheStore(CacheStore):
+    """Caching disabled: every lookup misses."""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LocalCacheStore(CacheStore):
+    """Per-process LRU/TTL store."""
+
+    def __init__(self, *, max_entries: int = 10_000, ttl: float = 60):
+        self._entries: TTLCache[Any] = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries.set(key, value)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class FileCacheStore(CacheStore):
+    """
+    Stand-in for a shared cache server used by the workers of one host.
+
+    Every value is a JSON file named after the hash of its key; a file older
+    than `ttl` seconds is a miss. Files are written to a temporary name and
+    renamed, so readers never see a partial value. The directory is pruned
+    back to `max_entries` files, oldest first, every `max_entries // 10`
+    writes of a process.
+    """
+
+    def __init__(self, path: str, *, max_entries: int = 10_000, ttl: float = 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = itertools.count(1)
+        self._prune_every = max(1, max_entries // 10)
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        file_path = self._file(key)
+        try:
+            if os.stat(file_path).st_mtime + self.ttl <= time.time():
+                return None
+            with open(file_path, "r", encoding="utf-8") as f:
+                stored_key, value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Guards against hash collisions
+        return value if stored_key == key else None
+
+    def set(self, key: str, value: Any) -> None:
+        file_path = self._file(key)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump([key, value], f, separators=(",", ":"))
+        os.replace(temp_path, file_path)
+        if next(self._writes) % self._prune_every == 0:
+            self._prune()
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".json"):
+                self._unlink(entry.path)
+
+    def _prune(self) -> None:
+        entries = [entry for entry in os.scandir(self.path) if entry.name.endswith(".json")]
+        if len(entries) <= self.max_entries:
+            return
+        oldest = sorted(entries, key=self._mtime)[: len(entries) - self.max_entries]
+        for entry in oldest:
+            self._unlink(entry.path)
+
+    @staticmethod
+    def _mtime(entry: os.DirEntry) -> float:
+        try:
+            return entry.stat().st_mtime
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _unlink(file_path: str) -> None:
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def create_cache_store(
+    name: str, *, path: Optional[str] = None, max_entries: int = 10_000, ttl: float = 60
+) -> CacheStore:
+    if name == "none":
+        return NullCacheStore()
+    if name == "local":
+        return LocalCacheStore(max_entries=max_entries, ttl=ttl)
+    if name == "file":
+        return FileCacheStore(path, max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown cache store: {name!r}")
+
+
+def create_invalidation_backend(name: str, *, path: Optional[str] = None) -> InvalidationBackend:
+    if name == "local":
+        return LocalInvalidationBackend()
+    if name == "file":
+        return FileInvalidationBackend(path)
+    raise ValueError(f"Unknown cache invalidation backend: {name!r}")
@@ -5,12 +5,26 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Nibblify"
+    # Tracebacks in 500 responses, and Server-Timing headers with each request's database time
+    DEBUG: bool = False
+    # When set, GET /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_TOKEN: Optional[str] = None
     
     POSTGRES_SERVER: str = "localhost"
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_DB: str = "nibblify"
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    # Read-only queries (listing, search, lookups) go to a healthy replica when any are set
+    SQLALCHEMY_REPLICA_URIS: List[str] = []
+
+    # Connection Pool Settings
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 30 * 60  # seconds; -1 keeps connections forever
+    DB_POOL_TIMEOUT: int = 30
+    DB_REPLICA_CHECK_INTERVAL: int = 30
+    DB_REPLICA_CONNECT_TIMEOUT: int = 2
 
     # OpenAI settings
     OPENAI_API_KEY: Optional[str] = None
@@ -21,9 +35,62 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
 
+    # Verified tokens and current users are cached for up to AUTH_CACHE_TTL seconds
+    AUTH_CACHE_TTL: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10_000
+    # "local" for a single process, "file" to share invalidations between workers on one host
+    AUTH_CACHE_BACKEND: str = "local"
+    AUTH_CACHE_INVALIDATION_FILE: str = ".auth_invalidations"
+
+    # Password Hashing Settings
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    # Hashing requests beyond this many in flight are rejected with 503
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+
     # File Upload Settings
     UPLOAD_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB
+    # Unreferenced files are kept this long before garbage collection removes them
+    BLOB_GC_GRACE_SECONDS: int = 60 * 60
+
+    # Largest batch accepted by the bulk document endpoints
+    BULK_MAX_ITEMS: int = 1000
+    # Rows fetched per round trip by the NDJSON export, and inserted per transaction by the import
+    EXPORT_BATCH_SIZE: int = 500
+    IMPORT_BATCH_SIZE: int = 500
+
+    # Ingestion Settings
+    INGEST_WORKERS: int = 2
+    INGEST_QUEUE_SIZE: int = 1000
+    INGEST_BATCH_SIZE: int = 16
+    INGEST_MAX_CONTENT_CHARS: int = 2_000_000
+    # Seconds after which an unfinished extraction is retried, possibly by another worker
+    INGEST_CLAIM_TIMEOUT: int = 600
+    # Seconds between sweeps for uploads that are not queued or whose claim timed out
+    INGEST_SWEEP_INTERVAL: int = 60
+
+    # Search Settings
+    SEARCH_BACKEND: str = "auto"  # "postgres", "memory" or "auto"
+    SEARCH_MEMORY_MAX_USERS: int = 1000
+    SEARCH_SNIPPET_MAX_WORDS: int = 35
+    SEARCH_SNIPPET_MIN_WORDS: int = 15
+    SEARCH_SNIPPET_MAX_FRAGMENTS: int = 2
+    # Semantic search: embedding dimensions, and the document count from which a
+    # user's vectors are searched through an approximate (LSH) index instead of exactly
+    SEARCH_EMBEDDING_DIM: int = 256
+    SEARCH_ANN_MIN_DOCUMENTS: int = 2000
+    # Estimated share of common 5-word shingles from which documents count as near-duplicates
+    DEDUP_THRESHOLD: float = 0.8
+    # Automatic tags: keyphrases extracted per document (see app.search.keyphrases)
+    TAGS_PER_DOCUMENT: int = 5
+    # Search results are cached per user until one of their documents changes or the TTL passes.
+    # "local" caches in each process, "file" shares SEARCH_CACHE_DIR between workers, "none" disables it
+    SEARCH_CACHE_BACKEND: str = "local"
+    SEARCH_CACHE_DIR: str = ".search_cache"
+    SEARCH_CACHE_TTL: int = 300
+    SEARCH_CACHE_MAX_ENTRIES: int = 1000
 
     # First superuser
     FIRST_SUPERUSER: str = "admin@example.com"
@@ -0,0 +1,242 @@
+import bisect
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from starlette.datastructures import MutableHeaders
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = tuple(1024 * 4 ** n for n in range(8))  # 1 KiB to 16 MiB
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """(name, label names, label values, value) of every sample."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(
+            f"{name}{_format_labels(names, values)} {_format_value(value)}"
+            for name, names, values, value in self.samples()
+        )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, self.labelnames, labels, value) for labels, value in values]
+
+
+class Histogram(Metric):
+    """Counts of observations per bucket (cumulative, as Prometheus expects), their sum and count."""
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), *, buckets: Sequence[float]
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Labels -> [count per bucket (the last one is +Inf)], sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        with self._lock:
+            values = sorted((labels, list(counts), total[0]) for labels, (counts, total) in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", names, (*labels, _format_value(bound)), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, total
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+
+class Collected(Metric):
+    """Values read when the metrics are scraped, e.g. the stats() of an existing object."""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), *, type: str = "gauge",
+        collect: Callable[[], Dict[Labels, float]]
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.collect = collect
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        return [(self.name, self.labelnames, labels, value) for labels, value in sorted(self.collect().items())]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "nibblify_http_request_duration_seconds", "Time to answer HTTP requests, per route.",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS,
+))
+request_queries = registry.register(Histogram(
+    "nibblify_http_request_db_queries", "Database queries run per HTTP request, per route.",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS,
+))
+request_db_duration = registry.register(Histogram(
+    "nibblify_http_request_db_duration_seconds", "Time spent in database queries per HTTP request, per route.",
+    ("method", "route"), buckets=LATENCY_BUCKETS,
+))
+db_queries = registry.register(Counter(
+    "nibblify_db_queries_total", "Database queries run, including outside of requests (e.g. ingestion).",
+))
+db_query_duration = registry.register(Counter(
+    "nibblify_db_query_duration_seconds_total", "Time spent in database queries.",
+))
+pool_wait = registry.register(Histogram(
+    "nibblify_db_pool_checkout_wait_seconds", "Time taken to check a connection out of a pool.",
+    ("pool",), buckets=LATENCY_BUCKETS,
+))
+upload_size = registry.register(Histogram(
+    "nibblify_upload_size_bytes", "Size of uploaded files.", buckets=SIZE_BUCKETS,
+))
+
+
+class RequestStats:
+    """Database work done on behalf of the current request."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def add_query(self, seconds: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+
+# Set by MetricsMiddleware; copied into threadpool calls and AsyncSession greenlets with the context
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_query(seconds: float) -> None:
+    db_queries.inc()
+    db_query_duration.inc(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add_query(seconds)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database query count and database time of every
+    request per route, and with server_timing adds them to the response as a
+    Server-Timing header (shown by browser developer tools). The header only
+    counts the queries run before the response started.
+    """
+
+    def __init__(self, app: Any, *, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+        # Endpoint -> path template of its route, built on the first request
+        self._route_paths: Optional[Dict[Any, str]] = None
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        """The path template of the matched route: raw paths would make a time series per document."""
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    elapsed = (time.perf_counter() - start) * 1000
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing",
+                        f'db;dur={stats.db_seconds * 1000:.1f};desc="queries={stats.queries}", app;dur={elapsed:.1f}',
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            method = scope["method"]
+            route = self._route(scope)
+            request_duration.observe(time.perf_counter() - start, (method, route, f"{status // 100}xx"))
+            request_queries.observe(stats.queries, (method, route))
+            request_db_duration.observe(stats.db_seconds, (method, route))
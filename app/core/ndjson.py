@@ -0,0 +1,81 @@
+"""
+Incremental NDJSON encoding and decoding, optionally gzip-compressed.
+
+Both directions work on async iterators and hold at most one output chunk
+(or one input line) in memory, whatever the size of the whole stream.
+"""
+import json
+import zlib
+from typing import Any, AsyncIterator, Dict, Tuple
+
+# Output is flushed in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+class LineTooLong(Exception):
+    pass
+
+
+async def encode(records: AsyncIterator[Dict[str, Any]], *, compress: bool = False) -> AsyncIterator[bytes]:
+    # wbits=31: gzip container rather than raw zlib
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    async for record in records:
+        buffer += json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+        buffer += b"\n"
+        if len(buffer) >= CHUNK_SIZE:
+            chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+            if chunk:
+                yield chunk
+    tail = compressor.compress(bytes(buffer)) + compressor.flush() if compressor else bytes(buffer)
+    if tail:
+        yield tail
+
+
+async def decode(
+    chunks: AsyncIterator[bytes], *, compressed: bool = False, max_line: int = 10 * 1024 * 1024
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (line number, parsed value) for every non-blank line. Lines that
+    are not valid JSON yield a ValueError in place of the value.
+    """
+    buffer = b""
+    number = 0
+    async for chunk in (_inflate(chunks) if compressed else chunks):
+        buffer += chunk
+        if b"\n" not in chunk:
+            if len(buffer) > max_line:
+                raise LineTooLong()
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if len(line) > max_line:
+                raise LineTooLong()
+            if line.strip():
+                yield number, _parse(line)
+    if buffer.strip():
+        yield number + 1, _parse(buffer)
+
+
+async def _inflate(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # wbits=47: accept both gzip and zlib headers. Output is bounded per call,
+    # so a small, highly compressed body cannot expand all at once.
+    decompressor = zlib.decompressobj(wbits=47)
+    async for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, CHUNK_SIZE)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def _parse(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
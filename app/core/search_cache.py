@@ -0,0 +1,63 @@
+import json
+import threading
+from typing import Any, Dict, Optional
+from fastapi.encoders import jsonable_encoder
+from app.core.cache import CacheStore, create_cache_store
+from app.core.config import settings
+
+
+class SearchCache:
+    """
+    Caches search results per user.
+
+    Keys include the user's document generation (User.document_generation),
+    which CRUDDocument bumps in the same transaction as every write to the
+    user's documents. A write therefore makes all of the user's cached
+    results unreachable at once, in every worker, and they age out of the
+    store. Results are stored in their JSON form.
+    """
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user_id: int, generation: int, params: Dict[str, Any]) -> str:
+        encoded = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return f"search:{user_id}:{generation}:{encoded}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self.store.get(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a result and return it as the JSON form a hit returns."""
+        encoded = jsonable_encoder(result)
+        self.store.set(key, encoded)
+        return encoded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+search_cache = SearchCache(
+    create_cache_store(
+        settings.SEARCH_CACHE_BACKEND,
+        path=settings.SEARCH_CACHE_DIR,
+        max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+        ttl=settings.SEARCH_CACHE_TTL,
+    )
+)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def on_event_loop() -> bool:
+    """Whether an event loop runs on this thread, e.g. under AsyncSession.run_sync."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical calls share one execution and its result.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is in flight wait for it and get the same result (or
+    exception) instead of running their own. The result may therefore be as
+    old as the start of the shared call, and it is shared: callers must not
+    modify it. `calls` counts all calls, `coalesced` the ones that waited.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _count(self, coalesced: bool) -> None:
+        self.calls += 1
+        if coalesced:
+            self.coalesced += 1
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        For threadpool callers only, e.g. sync dependencies. Waiting blocks the
+        thread, so on an event loop thread (including code under
+        AsyncSession.run_sync) it could wait on a call that needs that very
+        loop to finish: it raises RuntimeError there, use `do_async` instead.
+        """
+        if on_event_loop():
+            raise RuntimeError("SingleFlight.do() called on an event loop thread; use do_async()")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """For coroutines on one event loop."""
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            # A task of its own: a cancelled caller must not cancel the call for the others
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        with self._lock:
+            self._count(not leader)
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even when every caller was cancelled
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from app.core import metrics
+from app.core.config import settings
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StoredBlob(NamedTuple):
+    digest: str
+    size: int
+    path: str
+
+
+class PendingBlob(NamedTuple):
+    blob: StoredBlob
+    tmp_path: str
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_chunk(buffer: Any, hasher: Optional[Any], chunk: bytes) -> None:
+    if hasher is not None:
+        hasher.update(chunk)
+    buffer.write(chunk)
+
+
+async def save_upload(
+    upload: UploadFile, path: str, *, max_size: int = settings.MAX_UPLOAD_SIZE,
+    hasher: Optional[Any] = None
+) -> int:
+    """
+    Copy an uploaded file to path in UPLOAD_CHUNK_SIZE pieces without blocking
+    the event loop, and return its size. Every chunk is also fed to hasher
+    when one is given.
+
+    Raises UploadTooLarge as soon as more than max_size bytes have been read.
+    The partially written file is removed on any failure, including the
+    request being cancelled.
+    """
+    size = 0
+    buffer = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge()
+            await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+    except BaseException:
+        # Plain calls: a cancelled task cannot await the threadpool any more
+        buffer.close()
+        _remove_quietly(path)
+        raise
+    await run_in_threadpool(buffer.close)
+    return size
+
+
+class UploadLimitMiddleware:
+    """
+    Caps the request body of the given paths while it is being received,
+    before the multipart parser spools it to a temporary file: requests whose
+    Content-Length is over the limit are answered with 413 straight away, and
+    the others (chunked, or with a wrong Content-Length) fail with 413 as soon
+    as more bytes than the limit have arrived.
+    """
+
+    def __init__(self, app: Any, *, limits: Dict[str, int]):
+        self.app = app
+        # Path -> maximum body size in bytes
+        self.limits = limits
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": "File too large"}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def receive_limited() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the endpoint's body parsing, where it becomes the response
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="File too large",
+                    )
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+class BlobStore:
+    """
+    Content-addressed file storage.
+
+    Files are stored once, under the SHA-256 of their content, in two levels of
+    sharded directories (blobs/ab/cd/abcd...). Incoming uploads are written to
+    tmp/ first and only moved into place with `publish` once the database
+    holds a reference to them; see CRUDBlob for the reference counting and
+    garbage collection rules.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest[2:4], digest)
+
+    async def receive(
+        self, upload: UploadFile, *, max_size: int = settings.MAX_UPLOAD_SIZE
+    ) -> PendingBlob:
+        """Stream an upload into a temporary file, hashing it on the way."""
+        await run_in_threadpool(os.makedirs, self.tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = await save_upload(upload, tmp_path, max_size=max_size, hasher=hasher)
+        metrics.upload_size.observe(size)
+        digest = hasher.hexdigest()
+        return PendingBlob(StoredBlob(digest, size, self.path_for(digest)), tmp_path)
+
+    def publish(self, pending: PendingBlob) -> None:
+        """Move a received file to its content address; duplicates are simply dropped."""
+        path = pending.blob.path
+        if os.path.exists(path):
+            _remove_quietly(pending.tmp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(pending.tmp_path, path)
+
+    def discard(self, pending: PendingBlob) -> None:
+        _remove_quietly(pending.tmp_path)
+
+    def delete(self, digest: str) -> None:
+        _remove_quietly(self.path_for(digest))
+
+    def remove_stale_tmp_files(self, older_than: float) -> int:
+        """Remove temporary files left behind by uploads that never finished."""
+        if not os.path.isdir(self.tmp_dir):
+            return 0
+        cutoff = time.time() - older_than
+        removed = 0
+        for entry in os.scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                _remove_quietly(entry.path)
+                removed += 1
+        return removed
+
+blob_store = BlobStore(settings.UPLOAD_DIR)
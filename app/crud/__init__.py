@@ -1,7 +1,9 @@
 from app.crud.crud_user import user
 from app.crud.crud_knowledge import document
+from app.crud.crud_blob import blob
+from app.crud.crud_tag import tag
 
 # Export all CRUD operations
-__all__ = ["user", "document"]
+__all__ = ["user", "document", "blob", "tag"]
 
 # This file is intentionally left empty to make the directory a Python package 
\ No newline at end of file
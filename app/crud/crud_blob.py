@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+from pydantic import BaseModel
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.core.storage import BlobStore, StoredBlob
+from app.crud.base import CRUDBase
+from app.models.blob import Blob
+
+class CRUDBlob(CRUDBase[Blob, BaseModel, BaseModel]):
+    """
+    Reference counting for content-addressed files.
+
+    References are added and released in the same transaction as the Document
+    rows that hold them; neither method commits. A file is only deleted by
+    `collect_garbage`, once its count has stayed at zero for a grace period.
+    Uploads add their reference before moving the file into place, so a
+    collection racing with an upload of the same content can only remove a
+    file that is about to be written again.
+    """
+
+    def add_reference(self, db: Session, *, blob: StoredBlob) -> None:
+        dialect = db.get_bind().dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(Blob).values(digest=blob.digest, size=blob.size, ref_count=1)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Blob.digest],
+                set_={"ref_count": Blob.ref_count + 1, "updated_at": func.now()},
+            )
+        )
+
+    def release(self, db: Session, *, digest: str) -> None:
+        db.execute(
+            update(Blob)
+            .where(Blob.digest == digest)
+            .values(ref_count=Blob.ref_count - 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    def release_many(self, db: Session, *, counts: Dict[str, int]) -> None:
+        """Release several references at once, given per digest."""
+        if not counts:
+            return
+        # A Core (table) statement: one executemany rather than ORM bulk-by-primary-key
+        table = Blob.__table__
+        db.execute(
+            update(table)
+            .where(table.c.digest == bindparam("b_digest"))
+            .values(ref_count=table.c.ref_count - bindparam("b_count")),
+            [{"b_digest": digest, "b_count": count} for digest, count in counts.items()],
+        )
+
+    def collect_garbage(
+        self, db: Session, *, store: BlobStore, grace_seconds: int = 3600, batch_size: int = 500
+    ) -> int:
+        """Delete unreferenced blobs and stale temporary files; returns the number of blobs removed."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+        removed = 0
+        while True:
+            # Row locks make concurrent uploads of the same content wait for this batch
+            query = (
+                db.query(Blob)
+                .filter(Blob.ref_count <= 0, Blob.updated_at < cutoff)
+                .order_by(Blob.id)
+                .limit(batch_size)
+            )
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            blobs = query.all()
+            if not blobs:
+                break
+            for unreferenced in blobs:
+                store.delete(unreferenced.digest)
+                db.delete(unreferenced)
+            db.commit()
+            removed += len(blobs)
+        store.remove_stale_tmp_files(older_than=grace_seconds)
+        return removed
+
+blob = CRUDBlob(Blob)
@@ -1,27 +1,102 @@
-from typing import List, Optional, Union, Dict, Any
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple, Union, Dict, Any
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, bindparam, delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.core.config import settings
+from app.core.search_cache import search_cache
+from app.core.singleflight import SingleFlight
+from app.core.storage import StoredBlob
 from app.crud.base import CRUDBase
-from app.models.knowledge import Document
-from app.schemas.knowledge import DocumentCreate, DocumentUpdate
+from app.crud.crud_blob import blob as crud_blob
+from app.crud.crud_tag import tag as crud_tag
+from app.db.pagination import apply_cursor
+from app.models.knowledge import Document, DocumentBand, IngestStatus
+from app.models.user import User
+from app.schemas.knowledge import DocumentCreate, DocumentImport, DocumentUpdate
+from app.search import embeddings, minhash, search_backend, semantic_index
+from app.search.filters import url_domain
+from app.search.base import search_hit
+from app.search.semantic import reciprocal_rank_fusion
+from app.search.tokenizer import analyze, highlight
 import os
 
+# Columns written by the NDJSON export; the import reads the DocumentImport fields back
+EXPORT_FIELDS = (
+    "id", "title", "content", "file_type", "url", "is_archived", "created_at", "updated_at",
+)
+
+# Identical concurrent reads through the *_async read methods share one query
+document_reads = SingleFlight()
+
+class DuplicateDocument(Exception):
+    """A new document near-duplicates an existing one and on_duplicate is "reject"."""
+
+    def __init__(self, duplicate_of: int, similarity: float):
+        super().__init__(duplicate_of, similarity)
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+
 class CRUDDocument(CRUDBase[Document, DocumentCreate, DocumentUpdate]):
     def create_with_user(
-        self, db: Session, *, obj_in: DocumentCreate, user_id: int
+        self, db: Session, *, obj_in: DocumentCreate, user_id: int,
+        blob: Optional[StoredBlob] = None, on_duplicate: str = "allow"
     ) -> Document:
+        """
+        `on_duplicate` decides what happens when the new document is a
+        near-duplicate of an existing one (or, for an upload, has the same file):
+        "allow" does not check, "flag" sets duplicate_of, "reject" raises
+        DuplicateDocument and "merge" applies the new values to the existing
+        document and returns it instead.
+        """
         # Create document
         db_obj = Document(
             title=obj_in.title,
             content=obj_in.content,
             file_path=obj_in.file_path,
             file_type=obj_in.file_type,
-            url=obj_in.url,
+            # HttpUrl values are not strings
+            url=obj_in.url and str(obj_in.url),
+            url_domain=url_domain(obj_in.url),
             user_id=user_id,
             is_archived=obj_in.is_archived
         )
+        if blob:
+            db_obj.blob_digest = blob.digest
+            db_obj.file_path = blob.path
+            # Text is extracted later by the ingestion pipeline
+            db_obj.ingest_status = IngestStatus.pending.value
+        sig = self._set_minhash(db_obj)
+        if on_duplicate != "allow":
+            match = self._find_duplicate(
+                db, user_id=user_id, sig=sig, blob_digest=blob.digest if blob else None
+            )
+            if match and on_duplicate == "reject":
+                raise DuplicateDocument(*match)
+            if match and on_duplicate == "merge":
+                return self.update_with_user(
+                    db, db_obj=db.get(self.model, match[0]),
+                    obj_in=obj_in.dict(exclude_unset=True, exclude={"file_path"}),
+                )
+            if match:
+                db_obj.duplicate_of = match[0]
+        if blob:
+            # Reference the stored file in the same transaction as the document
+            crud_blob.add_reference(db, blob=blob)
+        self._set_search_vector(db, db_obj)
+        self._set_embedding(db_obj)
         db.add(db_obj)
+        db.flush()
+        self._set_bands(db, [(db_obj.id, user_id, sig)])
+        if db_obj.ingest_status not in self._EXTRACTING:
+            crud_tag.index_documents(db, user_id=user_id, added=[(db_obj.id, db_obj.title, db_obj.content)])
+        generations = self._bump_generation(db, [user_id])
         db.commit()
         db.refresh(db_obj)
+        search_backend.index_document(db_obj, generation=generations[user_id])
         return db_obj
     
     def update_with_user(
@@ -31,38 +106,821 @@ class CRUDDocument(CRUDBase[Document, DocumentCreate, DocumentUpdate]):
             update_data = obj_in
         else:
             update_data = obj_in.dict(exclude_unset=True)
+        # The text the tag statistics counted the document with
+        counted = (db_obj.id, db_obj.title, db_obj.content)
         
         # Update document
-        document = super().update(db, db_obj=db_obj, obj_in=update_data)
-        return document
+        for field, value in update_data.items():
+            if hasattr(self.model, field):
+                setattr(db_obj, field, value)
+        if "url" in update_data:
+            db_obj.url = update_data["url"] and str(update_data["url"])
+            db_obj.url_domain = url_domain(db_obj.url)
+        if "title" in update_data or "content" in update_data:
+            self._set_search_vector(db, db_obj)
+            self._set_embedding(db_obj)
+            self._set_bands(db, [(db_obj.id, db_obj.user_id, self._set_minhash(db_obj))])
+            if db_obj.ingest_status not in self._EXTRACTING:
+                crud_tag.index_documents(
+                    db, user_id=db_obj.user_id,
+                    added=[(db_obj.id, db_obj.title, db_obj.content)], removed=[counted],
+                )
+        db.add(db_obj)
+        generations = self._bump_generation(db, [db_obj.user_id])
+        db.commit()
+        db.refresh(db_obj)
+        search_backend.index_document(db_obj, generation=generations[db_obj.user_id])
+        return db_obj
     
     def remove_with_user(self, db: Session, *, id: int, user_id: int) -> Document:
         obj = db.query(self.model).filter(self.model.id == id, self.model.user_id == user_id).first()
         if obj:
-            # Delete file if exists
-            if obj.file_path and os.path.exists(obj.file_path):
+            if obj.blob_digest:
+                # Shared file: drop our reference, garbage collection removes the file
+                crud_blob.release(db, digest=obj.blob_digest)
+            elif obj.file_path and self._is_legacy_upload(obj.file_path):
                 os.remove(obj.file_path)
             
             # Delete from database
+            self._forget_duplicates(db, ids=[id], user_id=user_id)
+            if obj.ingest_status not in self._EXTRACTING:
+                crud_tag.index_documents(db, user_id=user_id, removed=[(id, obj.title, obj.content)])
             db.delete(obj)
+            generations = self._bump_generation(db, [user_id])
             db.commit()
+            search_backend.remove_document(id=id, user_id=user_id, generation=generations[user_id])
         return obj
     
+    def list_statement(
+        self, *, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None, include_archived: bool = True
+    ) -> Select:
+        """
+        The page of the user's documents, newest first, read in the order of
+        ix_document_user_created (or, without archived documents, of its
+        partial twin). With a cursor, skip is ignored and the page starts
+        right after the cursor (see app.db.pagination).
+        """
+        query = select(*self._columns(fields)) if fields is not None else select(self.model)
+        query = query.filter(self.model.user_id == user_id)
+        if not include_archived:
+            # Same predicate as the partial index
+            query = query.filter(self.model.is_archived.isnot(True))
+        query = query.order_by(self.model.created_at.desc(), self.model.id.desc())
+        if cursor:
+            query = apply_cursor(query, self.model, cursor)
+        else:
+            query = query.offset(skip)
+        return query.limit(limit)
+
     def get_multi_by_user(
-        self, db: Session, *, user_id: int, skip: int = 0, limit: int = 100
-    ) -> List[Document]:
-        return (
-            db.query(self.model)
-            .filter(self.model.user_id == user_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        self, db: Session, *, user_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, fields: Optional[Sequence[str]] = None,
+        include_archived: bool = True
+    ) -> List[Any]:
+        """
+        See list_statement. With fields, only those columns (plus id and
+        created_at) are selected and plain rows are returned instead of
+        Documents.
+        """
+        result = db.execute(self.list_statement(
+            user_id=user_id, skip=skip, limit=limit, cursor=cursor, fields=fields,
+            include_archived=include_archived,
+        ))
+        return list(result) if fields is not None else list(result.scalars())
     
     def search(
         self, db: Session, *, user_id: int, query: str, filters: Optional[Dict[str, Any]] = None,
-        page: int = 1, limit: int = 20
+        page: int = 1, limit: int = 20, include_content: bool = True, count: str = "exact",
+        sort: str = "relevance", cursor: Optional[str] = None, mode: str = "keyword",
+        facets: bool = False
     ) -> Dict[str, Any]:
-        return Document.search(db, user_id, query, filters, page, limit)
+        """
+        `mode` is "keyword" (the full-text backend), "semantic" (nearest
+        embeddings) or "hybrid" (both rankings merged by reciprocal rank
+        fusion). Semantic and hybrid results are ranked by relevance and have
+        no total count or cursors; without a query they fall back to keyword
+        mode. Their facets count the keyword matches.
+        """
+        if mode == "keyword" or not query.strip():
+            return search_backend.search(
+                db,
+                user_id=user_id,
+                query=query,
+                filters=filters,
+                page=page,
+                limit=limit,
+                include_content=include_content,
+                count=count,
+                sort=sort,
+                cursor=cursor,
+                facets=facets,
+            )
+        if cursor:
+            raise ValueError("Cursors are only supported for keyword search")
+        window = page * limit
+        # One extra match from each ranking tells whether there is a next page
+        ranked = semantic_index.nearest(
+            db, user_id=user_id, vector=embeddings.embed_query(query), limit=window + 1, filters=filters
+        )
+        has_more = len(ranked) > window
+        snippets: Dict[int, Optional[str]] = {}
+        keyword = None
+        if mode == "hybrid" or facets:
+            keyword = search_backend.search(
+                db, user_id=user_id, query=query, filters=filters, page=1,
+                limit=window + 1 if mode == "hybrid" else 1,
+                include_content=False, count="none", facets=facets,
+            )
+        if mode == "hybrid":
+            snippets = {hit["id"]: hit["snippet"] for hit in keyword["documents"]}
+            # Not len(ranked) after the merge: the union of two windows is almost always longer than one
+            has_more = has_more or len(snippets) > window
+            ranked = reciprocal_rank_fusion(list(snippets), [id for id, _ in ranked])
+        page_ranked = ranked[(page - 1) * limit:window]
+        rows = {
+            document.id: document
+            for document in db.query(self.model).filter(self.model.id.in_([id for id, _ in page_ranked]))
+        }
+        terms = set(analyze(query))
+        documents = []
+        for id, rank in page_ranked:
+            document = rows.get(id)
+            if document is None:
+                continue
+            snippet = snippets.get(id)
+            if snippet is None:
+                snippet = highlight(document.content or "", terms, settings.SEARCH_SNIPPET_MAX_WORDS)
+            documents.append(search_hit(document, rank, snippet, include_content))
+        result = {
+            "documents": documents,
+            "total": None,
+            "total_is_estimate": False,
+            "has_more": has_more,
+            "next_cursor": None,
+            "page": page,
+            "limit": limit,
+        }
+        if facets:
+            result["facets"] = keyword["facets"]
+        return result
+
+    def similar(
+        self, db: Session, *, id: int, user_id: int, limit: int = 10
+    ) -> List[Tuple[Document, float]]:
+        """The user's documents closest in meaning to document `id`, with their cosine similarity."""
+        vector = semantic_index.vector(db, user_id=user_id, id=id)
+        if vector is None:
+            return []
+        ranked = semantic_index.nearest(db, user_id=user_id, vector=vector, limit=limit, exclude=id)
+        rows = {
+            row.id: row for row in db.query(self.model).filter(self.model.id.in_([id for id, _ in ranked]))
+        }
+        return [(rows[id], score) for id, score in ranked if id in rows]
+
+    async def similar_async(
+        self, db: AsyncSession, *, id: int, user_id: int, limit: int = 10
+    ) -> List[Tuple[Document, float]]:
+        await semantic_index.prepare_async(db, user_id=user_id)
+        return await db.run_sync(
+            lambda session: self.similar(session, id=id, user_id=user_id, limit=limit)
+        )
+
+    async def create_with_user_async(
+        self, db: AsyncSession, *, obj_in: DocumentCreate, user_id: int,
+        blob: Optional[StoredBlob] = None, on_duplicate: str = "allow"
+    ) -> Document:
+        return await db.run_sync(
+            lambda session: self.create_with_user(
+                session, obj_in=obj_in, user_id=user_id, blob=blob, on_duplicate=on_duplicate
+            )
+        )
+
+    async def update_with_user_async(
+        self, db: AsyncSession, *, db_obj: Document, obj_in: Union[DocumentUpdate, Dict[str, Any]]
+    ) -> Document:
+        return await db.run_sync(
+            lambda session: self.update_with_user(session, db_obj=db_obj, obj_in=obj_in)
+        )
+
+    async def remove_with_user_async(self, db: AsyncSession, *, id: int, user_id: int) -> Document:
+        return await db.run_sync(
+            lambda session: self.remove_with_user(session, id=id, user_id=user_id)
+        )
+
+    async def get_shared_async(self, db: AsyncSession, *, id: int) -> Optional[Document]:
+        """
+        `get_async` shared with identical concurrent calls. For read-only use:
+        the document may belong to another request's session.
+        """
+        return await document_reads.do_async(("get", id), lambda: self.get_async(db, id=id))
+
+    async def get_multi_by_user_async(
+        self, db: AsyncSession, *, user_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, fields: Optional[Sequence[str]] = None,
+        include_archived: bool = True, generation: Optional[int] = None
+    ) -> List[Any]:
+        """
+        Pass the user's current document generation to share the query with
+        identical concurrent calls; the result is then read-only.
+        """
+        if generation is not None:
+            key = (
+                "list", user_id, generation, skip, limit, cursor, fields and tuple(fields), include_archived
+            )
+            return await document_reads.do_async(key, lambda: self.get_multi_by_user_async(
+                db, user_id=user_id, skip=skip, limit=limit, cursor=cursor, fields=fields,
+                include_archived=include_archived,
+            ))
+        result = await db.execute(self.list_statement(
+            user_id=user_id, skip=skip, limit=limit, cursor=cursor, fields=fields,
+            include_archived=include_archived,
+        ))
+        return list(result) if fields is not None else list(result.scalars())
+
+    async def search_async(self, db: AsyncSession, *, user_id: int, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Cached `search`. The result is shared with other requests and must not
+        be modified.
+        """
+        # Read the generation first: a concurrent write can only make the cached result stale
+        generation = await self.get_generation_async(db, user_id=user_id)
+        key = search_cache.key(user_id, generation, kwargs)
+        result = search_cache.get(key)
+        if result is None:
+            result = await document_reads.do_async(
+                ("search", key), lambda: self._search_and_cache(db, key, user_id=user_id, **kwargs)
+            )
+        return result
+
+    async def suggest_titles_async(
+        self, db: AsyncSession, *, user_id: int, prefix: str, limit: int = 10,
+        include_archived: bool = False
+    ) -> List[Dict[str, Any]]:
+        await search_backend.prepare_async(db, user_id=user_id)
+        return await db.run_sync(lambda session: search_backend.suggest(
+            session, user_id=user_id, prefix=prefix, limit=limit, include_archived=include_archived
+        ))
+
+    async def _search_and_cache(
+        self, db: AsyncSession, key: str, *, user_id: int, **kwargs: Any
+    ) -> Dict[str, Any]:
+        await search_backend.prepare_async(db, user_id=user_id)
+        if kwargs.get("mode", "keyword") != "keyword" and kwargs.get("query", "").strip():
+            await semantic_index.prepare_async(db, user_id=user_id)
+        # Search backends issue dialect-specific queries through the sync Session API
+        result = await db.run_sync(lambda session: self.search(session, user_id=user_id, **kwargs))
+        return search_cache.set(key, result)
+
+    def create_many_with_user(
+        self, db: Session, *, objs_in: List[DocumentCreate], user_id: int
+    ) -> List[int]:
+        """Insert a batch with one multi-row INSERT in a single transaction; returns the ids in order."""
+        return self._insert_many(
+            db, rows=[jsonable_encoder(obj_in) for obj_in in objs_in], user_id=user_id
+        )
+
+    def import_many_with_user(
+        self, db: Session, *, objs_in: List[DocumentImport], user_id: int
+    ) -> List[int]:
+        """Like create_many_with_user, keeping the creation dates of exported documents."""
+        now = datetime.now(timezone.utc)
+        rows = [
+            dict(jsonable_encoder(obj_in, exclude={"created_at"}), created_at=obj_in.created_at or now)
+            for obj_in in objs_in
+        ]
+        return self._insert_many(db, rows=rows, user_id=user_id)
+
+    def _insert_many(self, db: Session, *, rows: List[Dict[str, Any]], user_id: int) -> List[int]:
+        if not rows:
+            return []
+        sigs = []
+        for row in rows:
+            row["user_id"] = user_id
+            row["url_domain"] = url_domain(row.get("url"))
+            row["embedding"] = embeddings.to_bytes(embeddings.embed(row.get("title"), row.get("content")))
+            sigs.append(minhash.signature(row.get("title"), row.get("content")))
+            row["minhash"] = minhash.to_bytes(sigs[-1]) if sigs[-1] is not None else None
+        ids = list(db.scalars(
+            insert(self.model).returning(self.model.id, sort_by_parameter_order=True), rows
+        ))
+        self._set_search_vectors(db, ids)
+        self._set_bands(db, [(id, user_id, sig) for id, sig in zip(ids, sigs)])
+        crud_tag.index_documents(
+            db, user_id=user_id,
+            added=[(id, row.get("title"), row.get("content")) for id, row in zip(ids, rows)],
+        )
+        generations = self._bump_generation(db, [user_id])
+        db.commit()
+        search_backend.refresh_documents(db, user_id=user_id, ids=ids, generation=generations[user_id])
+        return ids
+
+    def update_many_with_user(
+        self, db: Session, *, items: List[Tuple[int, Dict[str, Any]]], user_id: int
+    ) -> List[int]:
+        """
+        Apply (id, changes) pairs in a single transaction and return the ids
+        that were updated; ids the user does not own are skipped.
+        """
+        owned = {
+            id for (id,) in db.query(self.model.id).filter(
+                self.model.id.in_([id for id, _ in items]), self.model.user_id == user_id
+            )
+        }
+        rows = [dict(changes, id=id) for id, changes in items if id in owned]
+        if not rows:
+            return []
+        for row in rows:
+            if "url" in row:
+                row["url_domain"] = url_domain(row["url"])
+        changed = [row["id"] for row in rows if "title" in row or "content" in row]
+        counted = self._counted_texts(db, changed)
+        # ORM bulk UPDATE by primary key: one executemany per distinct set of changed columns
+        db.execute(update(self.model), rows)
+        self._set_search_vectors(db, changed)
+        self.set_embeddings(db, changed)
+        self.set_minhashes(db, changed)
+        crud_tag.index_documents(
+            db, user_id=user_id,
+            added=self._counted_texts(db, [id for id, _, _ in counted]), removed=counted,
+        )
+        generations = self._bump_generation(db, [user_id])
+        db.commit()
+        ids = [row["id"] for row in rows]
+        search_backend.refresh_documents(db, user_id=user_id, ids=ids, generation=generations[user_id])
+        return ids
+
+    def set_archived_many(
+        self, db: Session, *, ids: List[int], user_id: int, is_archived: bool
+    ) -> List[int]:
+        rows = db.execute(
+            update(self.model)
+            .where(self.model.id.in_(ids), self.model.user_id == user_id)
+            .values(is_archived=is_archived)
+            .returning(self.model.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        generations = self._bump_generation(db, [user_id] if rows else [])
+        db.commit()
+        updated = [id for (id,) in rows]
+        if updated:
+            search_backend.refresh_documents(db, user_id=user_id, ids=updated, generation=generations[user_id])
+        return updated
+
+    def remove_many_with_user(
+        self, db: Session, *, ids: List[int], user_id: int
+    ) -> Tuple[List[int], List[str]]:
+        """
+        Delete a batch in a single transaction. Returns the deleted ids and the
+        legacy upload files to pass to remove_files once the response is sent.
+        """
+        self._forget_duplicates(db, ids=ids, user_id=user_id)
+        crud_tag.index_documents(db, user_id=user_id, removed=self._counted_texts(db, ids, user_id=user_id))
+        rows = db.execute(
+            delete(self.model)
+            .where(self.model.id.in_(ids), self.model.user_id == user_id)
+            .returning(self.model.id, self.model.blob_digest, self.model.file_path)
+            .execution_options(synchronize_session=False)
+        ).all()
+        crud_blob.release_many(db, counts=Counter(digest for _, digest, _ in rows if digest))
+        generations = self._bump_generation(db, [user_id] if rows else [])
+        db.commit()
+        for id, _, _ in rows:
+            search_backend.remove_document(id=id, user_id=user_id, generation=generations[user_id])
+        files = [file_path for _, digest, file_path in rows if not digest and file_path]
+        return [id for id, _, _ in rows], files
+
+    def remove_files(self, file_paths: List[str]) -> None:
+        for file_path in file_paths:
+            if self._is_legacy_upload(file_path):
+                os.remove(file_path)
+
+    async def get_version_async(self, db: AsyncSession, *, id: int) -> Optional[Any]:
+        """(user_id, version) of a document, without loading it."""
+        return await document_reads.do_async(("version", id), lambda: self._get_version(db, id))
+
+    async def _get_version(self, db: AsyncSession, id: int) -> Optional[Any]:
+        result = await db.execute(
+            select(self.model.user_id, self.model.version).filter(self.model.id == id)
+        )
+        return result.first()
+
+    async def get_generation_async(self, db: AsyncSession, *, user_id: int) -> int:
+        generation = await db.scalar(select(User.document_generation).filter(User.id == user_id))
+        return generation or 0
+
+    async def create_many_with_user_async(
+        self, db: AsyncSession, *, objs_in: List[DocumentCreate], user_id: int
+    ) -> List[int]:
+        return await db.run_sync(
+            lambda session: self.create_many_with_user(session, objs_in=objs_in, user_id=user_id)
+        )
+
+    async def import_many_with_user_async(
+        self, db: AsyncSession, *, objs_in: List[DocumentImport], user_id: int
+    ) -> List[int]:
+        return await db.run_sync(
+            lambda session: self.import_many_with_user(session, objs_in=objs_in, user_id=user_id)
+        )
+
+    async def stream_export_async(
+        self, db: AsyncSession, *, user_id: int, batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        A user's documents as plain dicts, oldest first, read through a
+        server-side cursor so that memory use does not grow with their number.
+        """
+        columns = [getattr(self.model, name) for name in EXPORT_FIELDS]
+        result = await db.stream(
+            select(*columns)
+            .filter(self.model.user_id == user_id)
+            .order_by(self.model.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            yield {
+                name: value.isoformat() if isinstance(value, datetime) else value
+                for name, value in row._mapping.items()
+            }
+
+    async def update_many_with_user_async(
+        self, db: AsyncSession, *, items: List[Tuple[int, Dict[str, Any]]], user_id: int
+    ) -> List[int]:
+        return await db.run_sync(
+            lambda session: self.update_many_with_user(session, items=items, user_id=user_id)
+        )
+
+    async def set_archived_many_async(
+        self, db: AsyncSession, *, ids: List[int], user_id: int, is_archived: bool
+    ) -> List[int]:
+        return await db.run_sync(
+            lambda session: self.set_archived_many(
+                session, ids=ids, user_id=user_id, is_archived=is_archived
+            )
+        )
+
+    async def remove_many_with_user_async(
+        self, db: AsyncSession, *, ids: List[int], user_id: int
+    ) -> Tuple[List[int], List[str]]:
+        return await db.run_sync(
+            lambda session: self.remove_many_with_user(session, ids=ids, user_id=user_id)
+        )
+
+    def _needs_ingestion(
+        self, *, claimed_before: Optional[datetime], created_before: Optional[datetime] = None
+    ) -> Any:
+        """
+        Uploads still to extract: pending ones (created before created_before),
+        and ones whose extraction was claimed before claimed_before but never
+        finished. None means any time.
+        """
+        pending = self.model.ingest_status == IngestStatus.pending.value
+        if created_before is not None:
+            pending = and_(pending, self.model.created_at < created_before)
+        abandoned = self.model.ingest_status == IngestStatus.extracting.value
+        if claimed_before is not None:
+            abandoned = and_(abandoned, or_(
+                self.model.ingest_claimed_at.is_(None), self.model.ingest_claimed_at < claimed_before
+            ))
+        return or_(pending, abandoned)
+
+    def get_ids_pending_ingestion(
+        self, db: Session, *, claimed_before: Optional[datetime] = None,
+        created_before: Optional[datetime] = None, limit: int = 10000
+    ) -> List[int]:
+        """
+        Uploads whose extraction never finished, e.g. because the process
+        stopped or the queue was full; see _needs_ingestion.
+        """
+        rows = (
+            db.query(self.model.id)
+            .filter(self._needs_ingestion(claimed_before=claimed_before, created_before=created_before))
+            .order_by(self.model.id)
+            .limit(limit)
+            .all()
+        )
+        return [id for (id,) in rows]
+
+    def claim_for_ingestion(
+        self, db: Session, *, ids: List[int], claimed_before: Optional[datetime] = None
+    ) -> List[Tuple[int, str, str]]:
+        """
+        Mark documents as being extracted and return (id, file_path, file_type)
+        for those that still needed it. Documents claimed since claimed_before
+        are left to the worker extracting them.
+        """
+        rows = db.execute(
+            update(self.model)
+            .where(self.model.id.in_(ids), self._needs_ingestion(claimed_before=claimed_before))
+            .values(
+                ingest_status=IngestStatus.extracting.value,
+                ingest_claimed_at=datetime.now(timezone.utc),
+                updated_at=self.model.updated_at,
+            )
+            .returning(self.model.id, self.model.file_path, self.model.file_type, self.model.user_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        generations = self._bump_generation(db, [row.user_id for row in rows])
+        db.commit()
+        for user_id, generation in generations.items():
+            search_backend.refresh_documents(db, user_id=user_id, ids=[], generation=generation)
+        return [(row.id, row.file_path, row.file_type) for row in rows]
+
+    def save_extracted(
+        self, db: Session, *, results: List[Tuple[int, Optional[str], Optional[str]]]
+    ) -> None:
+        """
+        Write back a batch of (id, content, error) extraction results in one
+        transaction and update the search index.
+        """
+        by_id = {id: (content, error) for id, content, error in results}
+        documents = db.query(self.model).filter(self.model.id.in_(by_id)).all()
+        extracted: Dict[int, List[Tuple[int, Optional[str], Optional[str]]]] = {}
+        for db_obj in documents:
+            content, error = by_id[db_obj.id]
+            if error is None:
+                db_obj.content = content
+                db_obj.ingest_status = IngestStatus.indexed.value
+                db_obj.ingest_error = None
+                self._set_search_vector(db, db_obj)
+                self._set_embedding(db_obj)
+                sig = self._set_minhash(db_obj)
+                # The upload has returned: near-duplicates can only be flagged now
+                if db_obj.duplicate_of is None:
+                    match = self._find_duplicate(db, user_id=db_obj.user_id, sig=sig, exclude=db_obj.id)
+                    db_obj.duplicate_of = match and match[0]
+                self._set_bands(db, [(db_obj.id, db_obj.user_id, sig)])
+                extracted.setdefault(db_obj.user_id, []).append((db_obj.id, db_obj.title, db_obj.content))
+            else:
+                db_obj.ingest_status = IngestStatus.failed.value
+                db_obj.ingest_error = error
+        db.flush()
+        for user_id, added in extracted.items():
+            crud_tag.index_documents(db, user_id=user_id, added=added)
+        generations = self._bump_generation(db, [db_obj.user_id for db_obj in documents])
+        db.commit()
+        # One query per user; users whose extractions all failed only move to the new generation
+        for user_id, generation in generations.items():
+            search_backend.refresh_documents(
+                db, user_id=user_id, ids=[id for id, _, _ in extracted.get(user_id, [])], generation=generation
+            )
+
+    def _columns(self, fields: Sequence[str]) -> List[Any]:
+        # id and created_at are needed for the keyset cursor of the next page
+        names = dict.fromkeys(("id", "created_at", *fields))
+        return [getattr(self.model, name) for name in names]
+
+    def _is_legacy_upload(self, file_path: str) -> bool:
+        # Files saved before the blob store, directly in UPLOAD_DIR
+        upload_dir = os.path.realpath(settings.UPLOAD_DIR)
+        return (
+            os.path.dirname(os.path.realpath(file_path)) == upload_dir
+            and os.path.isfile(file_path)
+        )
+
+    def _bump_generation(self, db: Session, user_ids: List[int]) -> Dict[int, int]:
+        """
+        Record a change to these users' documents and return their new
+        generations, to pass to the search index hooks; list ETags are derived
+        from the generation. Call it last before committing, so that user rows
+        are always locked after document rows.
+        """
+        ids = sorted(set(user_ids))
+        if not ids:
+            return {}
+        db.flush()
+        return dict(db.execute(
+            update(User)
+            .where(User.id.in_(ids))
+            .values(document_generation=User.document_generation + 1)
+            .returning(User.id, User.document_generation)
+            .execution_options(synchronize_session=False)
+        ).all())
+
+    def _set_search_vectors(self, db: Session, ids: List[int]) -> None:
+        # Set-based counterpart of _set_search_vector for bulk writes
+        if not ids or db.get_bind().dialect.name != "postgresql":
+            return
+        db.execute(
+            update(self.model)
+            .where(self.model.id.in_(ids))
+            .values(
+                search_vector=Document.search_vector_expression(Document.title, Document.content),
+                updated_at=self.model.updated_at,
+                version=self.model.version,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def set_embeddings(self, db: Session, ids: List[int]) -> None:
+        """
+        Recompute the embeddings of these documents without counting it as a
+        change to them; the bulk counterpart of _set_embedding, also used by
+        the reindex command. Does not commit.
+        """
+        if not ids:
+            return
+        table = Document.__table__
+        rows = db.execute(select(table.c.id, table.c.title, table.c.content).where(table.c.id.in_(ids)))
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("e_id"))
+            .values(
+                embedding=bindparam("e_embedding"),
+                updated_at=table.c.updated_at,
+                version=table.c.version,
+            ),
+            [
+                {"e_id": id, "e_embedding": embeddings.to_bytes(embeddings.embed(title, content))}
+                for id, title, content in rows
+            ],
+        )
+
+    def set_minhashes(self, db: Session, ids: List[int]) -> None:
+        """
+        Recompute the MinHash signatures and band hashes of these documents
+        without counting it as a change to them. Does not commit.
+        """
+        if not ids:
+            return
+        table = Document.__table__
+        rows = db.execute(
+            select(table.c.id, table.c.user_id, table.c.title, table.c.content, table.c.ingest_status)
+            .where(table.c.id.in_(ids))
+        ).all()
+        sigs = [
+            None if row.ingest_status in self._EXTRACTING else minhash.signature(row.title, row.content)
+            for row in rows
+        ]
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("m_id"))
+            .values(minhash=bindparam("m_minhash"), updated_at=table.c.updated_at, version=table.c.version),
+            [
+                {"m_id": row.id, "m_minhash": minhash.to_bytes(sig) if sig is not None else None}
+                for row, sig in zip(rows, sigs)
+            ],
+        )
+        self._set_bands(db, [(row.id, row.user_id, sig) for row, sig in zip(rows, sigs)])
+
+    def flag_duplicates(self, db: Session, *, originals: Dict[int, int], user_id: int) -> None:
+        """Set duplicate_of from a {duplicate id: original id} map, skipping unchanged rows."""
+        table = Document.__table__
+        current = dict(db.execute(
+            select(table.c.id, table.c.duplicate_of)
+            .where(table.c.id.in_(list(originals)), table.c.user_id == user_id)
+        ).all())
+        changes = [
+            {"d_id": id, "d_original": original}
+            for id, original in originals.items() if id in current and current[id] != original
+        ]
+        if changes:
+            db.execute(
+                update(table).where(table.c.id == bindparam("d_id")).values(duplicate_of=bindparam("d_original")),
+                changes,
+            )
+        generations = self._bump_generation(db, [user_id] if changes else [])
+        db.commit()
+        if changes:
+            search_backend.refresh_documents(db, user_id=user_id, ids=[], generation=generations[user_id])
+
+    def retag_with_user(self, db: Session, *, user_id: int, batch_size: int = 500) -> int:
+        """
+        Rebuild the user's tag statistics from their documents, then re-tag
+        every document against them. Commits; returns the number of documents.
+        """
+        crud_tag.clear_statistics(db, user_id=user_id)
+        for batch in self._text_batches(db, user_id=user_id, batch_size=batch_size):
+            crud_tag.count_documents(db, user_id=user_id, documents=batch)
+        # The statistics are complete before any document is tagged against them
+        db.commit()
+        tagged = 0
+        for batch in self._text_batches(db, user_id=user_id, batch_size=batch_size):
+            crud_tag.tag_documents(db, user_id=user_id, documents=batch)
+            db.commit()
+            tagged += len(batch)
+        crud_tag.remove_unused(db, user_id=user_id)
+        generations = self._bump_generation(db, [user_id])
+        db.commit()
+        search_backend.refresh_documents(db, user_id=user_id, ids=[], generation=generations[user_id])
+        return tagged
+
+    def _text_batches(
+        self, db: Session, *, user_id: int, batch_size: int
+    ) -> Iterator[List[Tuple[int, Optional[str], Optional[str]]]]:
+        last_id = 0
+        while True:
+            ids = db.execute(
+                select(self.model.id)
+                .where(self.model.user_id == user_id, self.model.id > last_id)
+                .order_by(self.model.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return
+            last_id = ids[-1]
+            batch = self._counted_texts(db, ids)
+            if batch:
+                yield batch
+
+    # Uploads whose text is not known yet: their title alone must neither make them
+    # duplicates nor be counted in the tag statistics
+    _EXTRACTING = (IngestStatus.pending.value, IngestStatus.extracting.value)
+
+    def _counted_texts(
+        self, db: Session, ids: List[int], user_id: Optional[int] = None
+    ) -> List[Tuple[int, Optional[str], Optional[str]]]:
+        """(id, title, content) of those documents that are counted in the tag statistics."""
+        if not ids:
+            return []
+        query = select(self.model.id, self.model.title, self.model.content, self.model.ingest_status).where(
+            self.model.id.in_(ids)
+        )
+        if user_id is not None:
+            query = query.where(self.model.user_id == user_id)
+        return [
+            (row.id, row.title, row.content)
+            for row in db.execute(query) if row.ingest_status not in self._EXTRACTING
+        ]
+
+    def _set_minhash(self, db_obj: Document) -> Optional[Any]:
+        sig = None
+        if db_obj.ingest_status not in self._EXTRACTING:
+            sig = minhash.signature(db_obj.title, db_obj.content)
+        db_obj.minhash = minhash.to_bytes(sig) if sig is not None else None
+        return sig
+
+    def _set_bands(self, db: Session, items: List[Tuple[int, int, Optional[Any]]]) -> None:
+        """Replace the LSH band hashes of (id, user_id, signature) items."""
+        if not items:
+            return
+        db.execute(delete(DocumentBand).where(DocumentBand.document_id.in_([id for id, _, _ in items])))
+        rows = [
+            {"document_id": id, "band": band, "user_id": user_id, "hash": band_hash}
+            for id, user_id, sig in items if sig is not None
+            for band, band_hash in enumerate(minhash.band_hashes(sig))
+        ]
+        if rows:
+            db.execute(insert(DocumentBand), rows)
+
+    def _find_duplicate(
+        self, db: Session, *, user_id: int, sig: Optional[Any], blob_digest: Optional[str] = None,
+        exclude: Optional[int] = None
+    ) -> Optional[Tuple[int, float]]:
+        """
+        The user's document that is the closest near-duplicate (by MinHash, at
+        least DEDUP_THRESHOLD) or has the same file. Returns (id, similarity),
+        resolving duplicates of duplicates to the original.
+        """
+        match = None
+        if blob_digest:
+            id = db.scalar(
+                select(self.model.id)
+                .where(self.model.user_id == user_id, self.model.blob_digest == blob_digest)
+                .order_by(self.model.id)
+                .limit(1)
+            )
+            match = id and (id, 1.0)
+        if match is None and sig is not None:
+            candidates = select(DocumentBand.document_id).where(
+                DocumentBand.user_id == user_id,
+                or_(*(
+                    and_(DocumentBand.band == band, DocumentBand.hash == band_hash)
+                    for band, band_hash in enumerate(minhash.band_hashes(sig))
+                )),
+            )
+            query = select(self.model.id, self.model.minhash).where(self.model.id.in_(candidates))
+            if exclude is not None:
+                query = query.where(self.model.id != exclude)
+            match = minhash.best_match(
+                sig,
+                ((row.id, minhash.from_bytes(row.minhash)) for row in db.execute(query) if row.minhash),
+                settings.DEDUP_THRESHOLD,
+            )
+        if match is None:
+            return None
+        original = db.scalar(select(self.model.duplicate_of).where(self.model.id == match[0]))
+        return (original or match[0], match[1])
+
+    def _forget_duplicates(self, db: Session, *, ids: List[int], user_id: int) -> None:
+        # The foreign keys do this on PostgreSQL; SQLite does not enforce them
+        db.execute(delete(DocumentBand).where(
+            DocumentBand.document_id.in_(ids), DocumentBand.user_id == user_id
+        ))
+        db.execute(
+            update(self.model)
+            .where(self.model.duplicate_of.in_(ids), self.model.user_id == user_id)
+            .values(duplicate_of=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _set_embedding(self, db_obj: Document) -> None:
+        db_obj.embedding = embeddings.to_bytes(embeddings.embed(db_obj.title, db_obj.content))
+
+    def _set_search_vector(self, db: Session, db_obj: Document) -> None:
+        # The stored tsvector only exists on PostgreSQL
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        db_obj.search_vector = Document.search_vector_expression(db_obj.title, db_obj.content)
 
 document = CRUDDocument(Document) 
\ No newline at end of file
@@ -0,0 +1,176 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud.base import CRUDBase
+from app.models.tag import DocumentTag, Tag, TermStat
+from app.search import keyphrases
+
+# Terms per statement when reading document frequencies
+_TERM_BATCH = 1000
+
+class CRUDTag(CRUDBase[Tag, BaseModel, BaseModel]):
+    """
+    Automatic tags and the term statistics they are computed from.
+
+    CRUDDocument calls `index_documents` in the same transaction as every
+    write that changes documents' text; it does not commit. Document
+    frequencies are updated by the difference only, so a write costs one
+    upsert per distinct term of the documents written, whatever the size of
+    the library. Tags of other documents are not recomputed when the
+    statistics drift; `python -m app.db.retag` does that for a whole library.
+    """
+
+    def index_documents(
+        self, db: Session, *, user_id: int,
+        added: Sequence[Tuple[int, Optional[str], Optional[str]]] = (),
+        removed: Sequence[Tuple[int, Optional[str], Optional[str]]] = (),
+    ) -> None:
+        """
+        Count the (id, title, content) documents `added` and no longer count
+        the `removed` ones (with the text they were counted with), then tag
+        the added documents. An updated document is in both.
+        """
+        analyses = self._analyze(added)
+        self._count(db, user_id=user_id, added=analyses, removed=removed)
+        self._tag(db, user_id=user_id, analyses=analyses, untag=[id for id, _, _ in removed])
+
+    def count_documents(
+        self, db: Session, *, user_id: int, documents: Sequence[Tuple[int, Optional[str], Optional[str]]]
+    ) -> None:
+        """Count documents in the statistics without tagging them, for rebuilds."""
+        self._count(db, user_id=user_id, added=self._analyze(documents), removed=())
+
+    def tag_documents(
+        self, db: Session, *, user_id: int, documents: Sequence[Tuple[int, Optional[str], Optional[str]]]
+    ) -> None:
+        """Replace the tags of already counted documents."""
+        self._tag(db, user_id=user_id, analyses=self._analyze(documents))
+
+    def document_frequencies(
+        self, db: Session, *, user_id: int, terms: Sequence[str]
+    ) -> Tuple[int, Dict[str, int]]:
+        """The user's document count and the document frequency of each of terms."""
+        terms = sorted(terms)
+        documents = db.scalar(
+            select(TermStat.df).where(TermStat.user_id == user_id, TermStat.term == "")
+        )
+        df: Dict[str, int] = {}
+        for start in range(0, len(terms), _TERM_BATCH):
+            df.update(db.execute(
+                select(TermStat.term, TermStat.df)
+                .where(TermStat.user_id == user_id, TermStat.term.in_(terms[start:start + _TERM_BATCH]))
+            ).all())
+        return documents or 0, df
+
+    def clear_statistics(self, db: Session, *, user_id: int) -> None:
+        db.execute(delete(TermStat).where(TermStat.user_id == user_id))
+
+    def remove_unused(self, db: Session, *, user_id: int) -> None:
+        """Delete the user's tags that no document carries any more."""
+        db.execute(
+            delete(Tag)
+            .where(Tag.user_id == user_id, ~select(DocumentTag.tag_id).where(DocumentTag.tag_id == Tag.id).exists())
+            .execution_options(synchronize_session=False)
+        )
+
+    def get_multi_by_user(self, db: Session, *, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """The user's tags with their number of documents, most used first."""
+        documents = func.count(DocumentTag.document_id)
+        rows = db.execute(
+            select(Tag.name, documents.label("documents"))
+            .join(DocumentTag, DocumentTag.tag_id == Tag.id)
+            .where(Tag.user_id == user_id)
+            .group_by(Tag.name)
+            .order_by(documents.desc(), Tag.name)
+            .limit(limit)
+        )
+        return [row._asdict() for row in rows]
+
+    def get_by_document(self, db: Session, *, document_id: int) -> List[Dict[str, Any]]:
+        rows = db.execute(
+            select(Tag.name, DocumentTag.score)
+            .join(DocumentTag, DocumentTag.tag_id == Tag.id)
+            .where(DocumentTag.document_id == document_id)
+            .order_by(DocumentTag.score.desc())
+        )
+        return [row._asdict() for row in rows]
+
+    async def get_multi_by_user_async(
+        self, db: AsyncSession, *, user_id: int, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        return await db.run_sync(lambda session: self.get_multi_by_user(session, user_id=user_id, limit=limit))
+
+    async def get_by_document_async(self, db: AsyncSession, *, document_id: int) -> List[Dict[str, Any]]:
+        return await db.run_sync(lambda session: self.get_by_document(session, document_id=document_id))
+
+    def _analyze(
+        self, documents: Sequence[Tuple[int, Optional[str], Optional[str]]]
+    ) -> List[Tuple[int, keyphrases.DocumentTerms]]:
+        return [(id, keyphrases.analyze_document(title, content)) for id, title, content in documents]
+
+    def _count(
+        self, db: Session, *, user_id: int, added: List[Tuple[int, keyphrases.DocumentTerms]],
+        removed: Sequence[Tuple[int, Optional[str], Optional[str]]]
+    ) -> None:
+        counts: Counter = Counter({"": len(added) - len(removed)})
+        for _, analysis in added:
+            counts.update(analysis.frequencies.keys())
+        for _, title, content in removed:
+            counts.subtract(keyphrases.analyze_document(title, content).frequencies.keys())
+        # Sorted, so that concurrent writers lock the rows in the same order
+        rows = [
+            {"user_id": user_id, "term": term, "df": count}
+            for term, count in sorted(counts.items()) if count
+        ]
+        if not rows:
+            return
+        stmt = self._upsert(db)(TermStat)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[TermStat.user_id, TermStat.term],
+                set_={"df": TermStat.df + stmt.excluded.df},
+            ),
+            rows,
+        )
+
+    def _tag(
+        self, db: Session, *, user_id: int, analyses: List[Tuple[int, keyphrases.DocumentTerms]],
+        untag: Sequence[int] = ()
+    ) -> None:
+        ids = [*untag, *(id for id, _ in analyses)]
+        if ids:
+            db.execute(delete(DocumentTag).where(DocumentTag.document_id.in_(ids)))
+        if not analyses:
+            return
+        documents, df = self.document_frequencies(
+            db, user_id=user_id, terms={term for _, analysis in analyses for term in analysis.frequencies}
+        )
+        tags = {
+            id: keyphrases.extract(analysis, df, documents, settings.TAGS_PER_DOCUMENT)
+            for id, analysis in analyses
+        }
+        names = sorted({name for document_tags in tags.values() for name, _ in document_tags})
+        if not names:
+            return
+        db.execute(
+            self._upsert(db)(Tag).on_conflict_do_nothing(index_elements=[Tag.user_id, Tag.name]),
+            [{"user_id": user_id, "name": name} for name in names],
+        )
+        tag_ids = dict(db.execute(
+            select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+        ).all())
+        db.execute(insert(DocumentTag), [
+            {"document_id": id, "tag_id": tag_ids[name], "score": score}
+            for id, document_tags in tags.items()
+            for name, score in document_tags
+        ])
+
+    def _upsert(self, db: Session) -> Any:
+        return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+tag = CRUDTag(Tag)
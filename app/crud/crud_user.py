@@ -1,18 +1,28 @@
 from typing import Any, Dict, Optional, Union
+from sqlalchemy import func, select, update
+from sqlalchemy.sql import Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.security import get_password_hash, verify_password
+from app.core.auth_cache import auth_cache
+from app.core.security import get_password_hash, hash_password_async, verify_password, verify_password_async
 from app.crud.base import CRUDBase
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
 
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
+    def email_statement(self, email: str) -> Select:
+        """The user with this email, compared case-insensitively (indexed by ix_user_email_lower)."""
+        return select(User).where(func.lower(User.email) == email.lower()).limit(1)
+
     def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
-        return db.query(User).filter(User.email == email).first()
+        return db.scalar(self.email_statement(email))
 
-    def create(self, db: Session, *, obj_in: UserCreate) -> User:
+    def create(
+        self, db: Session, *, obj_in: UserCreate, hashed_password: Optional[str] = None
+    ) -> User:
         db_obj = User(
             email=obj_in.email,
-            hashed_password=get_password_hash(obj_in.password),
+            hashed_password=hashed_password or get_password_hash(obj_in.password),
             full_name=obj_in.full_name,
             is_superuser=obj_in.is_superuser,
         )
@@ -32,7 +42,14 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             hashed_password = get_password_hash(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
-        return super().update(db, db_obj=db_obj, obj_in=update_data)
+        user = super().update(db, db_obj=db_obj, obj_in=update_data)
+        auth_cache.invalidate_user(user.id)
+        return user
+
+    def remove(self, db: Session, *, id: int) -> User:
+        user = super().remove(db, id=id)
+        auth_cache.invalidate_user(id)
+        return user
 
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
         user = self.get_by_email(db, email=email)
@@ -42,10 +59,62 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             return None
         return user
 
+    # Async variants hash in the password hashing pool instead of the event loop
+
+    async def get_by_email_async(self, db: AsyncSession, *, email: str) -> Optional[User]:
+        return await db.scalar(self.email_statement(email))
+
+    async def create_async(self, db: AsyncSession, *, obj_in: UserCreate) -> User:
+        hashed_password = await hash_password_async(obj_in.password)
+        return await db.run_sync(
+            lambda session: self.create(session, obj_in=obj_in, hashed_password=hashed_password)
+        )
+
+    async def update_async(
+        self, db: AsyncSession, *, db_obj: User, obj_in: Union[UserUpdate, Dict[str, Any]]
+    ) -> User:
+        if isinstance(obj_in, dict):
+            update_data = dict(obj_in)
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+        if update_data.get("password"):
+            update_data["hashed_password"] = await hash_password_async(update_data.pop("password"))
+        return await db.run_sync(
+            lambda session: self.update(session, db_obj=db_obj, obj_in=update_data)
+        )
+
+    async def authenticate_async(
+        self, db: AsyncSession, *, email: str, password: str,
+        write_db: Optional[AsyncSession] = None
+    ) -> Optional[User]:
+        """
+        Like authenticate, and upgrades the stored hash when it was made with
+        outdated parameters. write_db is used for that upgrade when db is a
+        read replica.
+        """
+        user = await self.get_by_email_async(db, email=email)
+        if not user:
+            return None
+        valid, new_hash = await verify_password_async(password, user.hashed_password)
+        if not valid:
+            return None
+        if new_hash:
+            write_db = write_db or db
+            # Only replace the hash that was verified, never a concurrently changed password
+            await write_db.execute(
+                update(User)
+                .where(User.id == user.id, User.hashed_password == user.hashed_password)
+                .values(hashed_password=new_hash)
+                .execution_options(synchronize_session=False)
+            )
+            await write_db.commit()
+            auth_cache.invalidate_user(user.id)
+        return user
+
     def is_active(self, user: User) -> bool:
         return user.is_active
 
     def is_superuser(self, user: User) -> bool:
         return user.is_superuser
 
-user = CRUDUser(User) 
\ No newline at end of file
+user = CRUDUser(User)
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import pytest
+from sqlalchemy import select
+from app.db.pagination import apply_cursor, cursor_for, decode_cursor, encode_cursor
+from app.models.knowledge import Document
+
+
+@pytest.mark.parametrize("created_at", [
+    datetime(2024, 2, 29, 23, 59, 59, 999999, tzinfo=timezone.utc),
+    datetime(2024, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=-5))),
+    datetime(2024, 1, 1, 12, 0),
+])
+def test_round_trip(created_at: datetime):
+    cursor = encode_cursor(created_at, 12345)
+
+    assert decode_cursor(cursor) == (created_at, 12345)
+    assert decode_cursor(cursor)[0].utcoffset() == created_at.utcoffset()
+    # URL-safe and unpadded
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "", "not a cursor", "W10", encode_cursor(datetime(2024, 1, 1), 1)[:-3],
+    # Valid base64 of JSON that is not [created_at, id]
+    "eyJhIjoxfQ", "WyJ5ZXN0ZXJkYXkiLDFd", "WyIyMDI0LTAxLTAxIiwieCJd",
+])
+def test_invalid_cursors(cursor: str):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_follow_each_other(db: Any, user: Any):
+    # Pairs of documents share a creation date, so pages must also order by id
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db.add_all([
+        Document(title=f"Document {n}", content="", user_id=user.id, created_at=start + timedelta(minutes=n // 2))
+        for n in range(25)
+    ])
+    db.commit()
+    query = (
+        select(Document)
+        .where(Document.user_id == user.id)
+        .order_by(Document.created_at.desc(), Document.id.desc())
+    )
+    everything = db.scalars(query).all()
+
+    pages = []
+    cursor = None
+    while True:
+        page = db.scalars((apply_cursor(query, Document, cursor) if cursor else query).limit(4)).all()
+        if not page:
+            break
+        pages.extend(page)
+        cursor = cursor_for(page[-1])
+
+    assert [document.id for document in pages] == [document.id for document in everything]
+    assert len(pages) == 25
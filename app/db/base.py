@@ -2,4 +2,6 @@
 # imported by Alembic
 from app.db.base_class import Base  # noqa
 from app.models.user import User  # noqa
-from app.models.knowledge import Document  # noqa 
\ No newline at end of file
+from app.models.knowledge import Document, DocumentBand  # noqa 
+from app.models.blob import Blob  # noqa
+from app.models.tag import Tag, DocumentTag, TermStat  # noqa
@@ -0,0 +1,29 @@
+"""
+Remove stored files that no document references any more.
+
+Usage:
+    python -m app.db.collect_blobs
+    python -m app.db.collect_blobs --grace-seconds 600
+"""
+import argparse
+from app import crud
+from app.core.config import settings
+from app.core.storage import blob_store
+from app.db.session import SessionLocal
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Garbage-collect unreferenced upload blobs")
+    parser.add_argument("--grace-seconds", type=int, default=settings.BLOB_GC_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        removed = crud.blob.collect_garbage(db, store=blob_store, grace_seconds=args.grace_seconds)
+    finally:
+        db.close()
+    print(f"Removed {removed} unreferenced blobs")
+
+
+if __name__ == "__main__":
+    main()
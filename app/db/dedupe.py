@@ -0,0 +1,115 @@
+"""
+Find near-duplicate documents in existing libraries.
+
+Computes the missing MinHash signatures, then flags every document that
+near-duplicates an earlier document of the same user (sets duplicate_of to
+the earliest one). With --delete, flagged documents are deleted instead.
+
+Usage:
+    python -m app.db.dedupe                  # flag duplicates of every user
+    python -m app.db.dedupe --user-id 42     # one user only
+    python -m app.db.dedupe --delete         # delete duplicates instead of flagging them
+"""
+import argparse
+from typing import Any, Dict, List, Optional
+from sqlalchemy import distinct, select
+from sqlalchemy.orm import Session
+from app import crud
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge import Document
+from app.search import minhash
+
+
+def backfill_signatures(db: Session, *, batch_size: int = 1000) -> int:
+    """Compute missing signatures in id-ordered batches; returns the number of documents."""
+    updated = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(Document.id)
+            .where(Document.id > last_id, Document.minhash.is_(None))
+            .order_by(Document.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        crud.document.set_minhashes(db, ids)
+        db.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    return updated
+
+
+def find_duplicates(db: Session, *, user_id: int, threshold: float) -> Dict[int, int]:
+    """
+    Map each of the user's near-duplicate documents to the earliest document
+    it duplicates. Uses an in-memory LSH index over the whole library, built
+    in id order, so every document is compared with earlier ones only.
+    """
+    index = minhash.LshIndex()
+    signatures: Dict[int, Any] = {}
+    originals: Dict[int, int] = {}
+    rows = db.execute(
+        select(Document.id, Document.minhash)
+        .where(Document.user_id == user_id, Document.minhash.isnot(None))
+        .order_by(Document.id)
+        .execution_options(yield_per=1000)
+    )
+    for id, data in rows:
+        sig = minhash.from_bytes(data)
+        if sig is None:
+            continue
+        match = minhash.best_match(
+            sig, ((candidate, signatures[candidate]) for candidate in index.candidates(sig)), threshold
+        )
+        if match is not None:
+            originals[id] = match[0]
+        else:
+            # Only originals are indexed: duplicates resolve to them anyway
+            index.add(id, sig)
+            signatures[id] = sig
+    return originals
+
+
+def dedupe_user(db: Session, *, user_id: int, delete: bool = False, threshold: Optional[float] = None) -> int:
+    """Flag (or delete) the user's near-duplicates; returns how many were found."""
+    originals = find_duplicates(
+        db, user_id=user_id, threshold=settings.DEDUP_THRESHOLD if threshold is None else threshold
+    )
+    if not originals:
+        return 0
+    if delete:
+        ids: List[int] = list(originals)
+        _, files = crud.document.remove_many_with_user(db, ids=ids, user_id=user_id)
+        crud.document.remove_files(files)
+        return len(ids)
+    crud.document.flag_duplicates(db, originals=originals, user_id=user_id)
+    return len(originals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Flag or delete near-duplicate documents")
+    parser.add_argument("--user-id", type=int, help="only this user's documents")
+    parser.add_argument("--delete", action="store_true", help="delete duplicates instead of flagging them")
+    parser.add_argument("--threshold", type=float, help=f"similarity threshold (default {settings.DEDUP_THRESHOLD})")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Computed {backfill_signatures(db, batch_size=args.batch_size)} missing signatures")
+        if args.user_id is not None:
+            user_ids = [args.user_id]
+        else:
+            user_ids = db.execute(select(distinct(Document.user_id))).scalars().all()
+        found = 0
+        for user_id in user_ids:
+            found += dedupe_user(db, user_id=user_id, delete=args.delete, threshold=args.threshold)
+    finally:
+        db.close()
+    print(f"{'Deleted' if args.delete else 'Flagged'} {found} near-duplicate documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Check the query plans of the main queries.
+
+Runs the real code paths behind login, document reads, listing, search,
+typeahead and search filters for one user, inside a transaction that is
+rolled back, and EXPLAINs every SELECT they issue. A plan has a problem
+when it scans a whole document or user table, or sorts a listing page that
+an index should return in order. Plans can be saved as a baseline; against
+a baseline, only problems the baseline did not have are regressions.
+
+Exits with status 1 when there are regressions, so that it can run in CI.
+Run it against a database of production size (or a copy): PostgreSQL
+rightly prefers sequential scans and sorts for small tables.
+--prefer-indexes turns both off where an index can replace them, which
+shows whether an index could serve each query on a small database too.
+
+Usage:
+    python -m app.db.explain                           # report problems
+    python -m app.db.explain --save plans.json         # record a baseline
+    python -m app.db.explain --baseline plans.json     # report regressions only
+    python -m app.db.explain --user-id 42 --verbose    # print every plan
+"""
+import argparse
+import json
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app import crud
+from app.db.pagination import encode_cursor
+from app.db.session import SessionLocal
+from app.models.knowledge import Document
+from app.models.user import User
+from app.search import PostgresSearchBackend
+from app.search import filters as search_filters
+from app.search.tokenizer import words
+
+# Tables that must never be scanned whole
+_LARGE_TABLES = ("document", "user")
+
+
+@contextmanager
+def _capture(conn: Connection) -> Iterator[List[Tuple[str, Any]]]:
+    """Collect the SELECT statements run on conn, as sent to the driver."""
+    statements: List[Tuple[str, Any]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(conn, "before_cursor_execute", before_cursor_execute)
+
+
+def _plan(conn: Connection, statement: str, parameters: Any) -> List[str]:
+    """The plan as one line per step, outermost first."""
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        steps: List[str] = []
+        _walk(plan[0]["Plan"], steps, 0)
+        return steps
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def _walk(node: Dict[str, Any], steps: List[str], depth: int) -> None:
+    step = node["Node Type"]
+    if "Index Name" in node:
+        step += f" using {node['Index Name']}"
+    if "Relation Name" in node:
+        step += f" on {node['Relation Name']}"
+    if node["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" not in node:
+        # Reads the whole index, e.g. only for its order
+        step = "Full " + step
+    steps.append("  " * depth + step)
+    for child in node.get("Plans", ()):
+        _walk(child, steps, depth + 1)
+
+
+def _problems(steps: List[str], *, ordered: bool) -> List[str]:
+    """
+    What is wrong with a plan. Ordered queries should read their page in
+    index order: a sort feeding a LIMIT means all matching rows were read
+    (sorting the page itself after a join is fine).
+    """
+    problems = []
+    for parent, step in zip(["", *steps], steps):
+        for table in _LARGE_TABLES:
+            # SQLite: "SCAN user", "SCAN document USING INDEX ..."
+            if step.strip() == f"Seq Scan on {table}" or step.strip().startswith(f"SCAN {table}") or (
+                step.strip().startswith("Full ") and step.endswith(f" on {table}")
+            ):
+                problems.append(f"full scan of {table}")
+        top_n = parent.strip() == "Limit" and step.strip() == "Sort"
+        if ordered and (top_n or step.startswith("USE TEMP B-TREE FOR ORDER BY")):
+            problems.append("sort")
+    return sorted(set(problems))
+
+
+def _operations(db: Session, *, user_id: int) -> List[Tuple[str, bool, Callable[[], Any]]]:
+    """(name, ordered, call) of the queries to check, with values taken from the user's data."""
+    user = db.get(User, user_id)
+    newest = db.scalars(
+        crud.document.list_statement(user_id=user_id, limit=1)
+    ).first()
+    word = next(iter(words(newest.title if newest and newest.title else "")), "document")
+    cursor = encode_cursor(newest.created_at, newest.id) if newest else encode_cursor(
+        datetime.now(timezone.utc), 0
+    )
+    domain_key = db.scalar(
+        select(Document.url_domain).where(Document.user_id == user_id, Document.url_domain.isnot(None)).limit(1)
+    )
+    domain = ".".join(reversed(domain_key.split("."))) if domain_key else "example.com"
+    tags = crud.tag.get_multi_by_user(db, user_id=user_id, limit=1)
+    operations = [
+        ("login", False, lambda: crud.user.get_by_email(db, email=user.email)),
+        ("get", False, lambda: crud.document.get(db, id=newest.id if newest else 0)),
+        ("list", True, lambda: crud.document.get_multi_by_user(db, user_id=user_id, limit=101)),
+        ("list_cursor", True, lambda: crud.document.get_multi_by_user(
+            db, user_id=user_id, limit=101, cursor=cursor
+        )),
+        ("list_active", True, lambda: crud.document.get_multi_by_user(
+            db, user_id=user_id, limit=101, include_archived=False
+        )),
+        ("filter_domain", False, lambda: search_filters.matching_ids(
+            db, user_id=user_id, filters={"domain": domain}
+        )),
+        ("filter_tag", False, lambda: search_filters.matching_ids(
+            db, user_id=user_id, filters={"tag": tags[0]["name"] if tags else "example"}
+        )),
+    ]
+    if db.get_bind().dialect.name == "postgresql":
+        backend = PostgresSearchBackend()
+        operations += [
+            ("search", False, lambda: backend.search(db, user_id=user_id, query=word, count="estimate")),
+            ("search_recent", True, lambda: backend.search(
+                db, user_id=user_id, query="", sort="recent", count="none"
+            )),
+            ("typeahead", False, lambda: backend.suggest(db, user_id=user_id, prefix=word[:3])),
+        ]
+    return operations
+
+
+def explain(db: Session, *, user_id: int, prefer_indexes: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Plans and problems of every operation: {name: {"plans": [[step]], "problems": [...]}}."""
+    conn = db.connection()
+    if prefer_indexes and conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        conn.exec_driver_sql("SET LOCAL enable_sort = off")
+    report: Dict[str, Dict[str, Any]] = {}
+    try:
+        for name, ordered, call in _operations(db, user_id=user_id):
+            with _capture(conn) as statements:
+                call()
+            plans = [_plan(conn, statement, parameters) for statement, parameters in statements]
+            report[name] = {
+                "plans": plans,
+                "problems": sorted({problem for plan in plans for problem in _problems(plan, ordered=ordered)}),
+            }
+    finally:
+        db.rollback()
+    return report
+
+
+def regressions(
+    report: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, List[str]]:
+    """Problems of each operation that the baseline did not have (all of them without a baseline)."""
+    found = {}
+    for name, result in report.items():
+        known = set(baseline[name]["problems"]) if baseline and name in baseline else set()
+        new = [problem for problem in result["problems"] if problem not in known]
+        if new:
+            found[name] = new
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report query plan regressions")
+    parser.add_argument("--user-id", type=int, help="whose data to query (default: the user with most documents)")
+    parser.add_argument("--baseline", help="compare with plans saved by --save")
+    parser.add_argument("--save", help="write the plans to this file")
+    parser.add_argument("--prefer-indexes", action="store_true", help="avoid sequential scans and sorts (PostgreSQL)")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user_id = args.user_id
+        if user_id is None:
+            user_id = db.scalar(
+                select(Document.user_id).group_by(Document.user_id).order_by(func.count().desc()).limit(1)
+            ) or db.scalar(select(func.min(User.id)))
+        if user_id is None:
+            sys.exit("No users to query")
+        report = explain(db, user_id=user_id, prefer_indexes=args.prefer_indexes)
+    finally:
+        db.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    found = regressions(report, baseline)
+    for name, result in report.items():
+        changed = baseline is not None and name in baseline and baseline[name]["plans"] != result["plans"]
+        status = "REGRESSION: " + ", ".join(found[name]) if name in found else "ok"
+        print(f"{name:<16}{status}{' (plan changed)' if changed else ''}")
+        if args.verbose or name in found:
+            for plan in result["plans"]:
+                print("\n".join(f"    {step}" for step in plan))
+                print()
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
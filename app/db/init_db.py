@@ -1,14 +1,13 @@
 from sqlalchemy.orm import Session
 from app import crud, schemas
 from app.core.config import settings
-from app.db import base  # noqa: F401
+from app.db.migrate import migrate
 from app.db.session import engine
-from app.db.base_class import Base
 
 
 def init_db(db: Session) -> None:
-    # Create tables
-    Base.metadata.create_all(bind=engine)
+    # Create missing tables, columns and indexes (see app.db.migrate)
+    migrate(engine)
 
     user = crud.user.get_by_email(db, email=settings.FIRST_SUPERUSER)
     if not user:
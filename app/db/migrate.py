@@ -0,0 +1,125 @@
+"""
+Bring an existing database up to date with the models.
+
+`create_all` only creates missing tables, so databases created by an earlier
+release lack the columns and indexes added since. `migrate` compares the
+models with the database and adds what is missing:
+
+- missing tables, with their indexes;
+- missing columns, nullable or with their server default;
+- missing indexes, on PostgreSQL with CREATE INDEX CONCURRENTLY so that
+  writes go on while a large table is indexed.
+
+Nothing is ever dropped or altered, so it is safe to run on every deploy.
+Values of new columns are backfilled by the separate commands
+(app.db.reindex, app.db.dedupe, app.db.retag). An index build that was
+interrupted leaves an INVALID index on PostgreSQL; drop it for the next run
+to build it again.
+
+Usage:
+    python -m app.db.migrate              # apply
+    python -m app.db.migrate --dry-run    # print the statements only
+"""
+import argparse
+import re
+from typing import Any, List, Set
+from sqlalchemy import create_mock_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+from app.db import base  # noqa: F401
+from app.db.base_class import Base
+from app.db.session import engine
+
+
+def _model_ddl(bind: Engine) -> List[Any]:
+    """CreateTable and CreateIndex elements of a fresh create_all, in order, for bind's dialect."""
+    statements: List[Any] = []
+    mock = create_mock_engine(bind.url, lambda sql, *multiparams, **params: statements.append(sql))
+    # The mock engine applies Index.ddl_if() conditions exactly like create_all
+    Base.metadata.create_all(mock, checkfirst=False)
+    return statements
+
+
+def _index_names(bind: Engine) -> Set[str]:
+    # Read from the catalog: the inspector skips expression indexes on SQLite
+    if bind.dialect.name == "postgresql":
+        query = "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    else:
+        query = "SELECT name FROM sqlite_master WHERE type = 'index'"
+    with bind.connect() as conn:
+        return set(conn.execute(text(query)).scalars())
+
+
+def _add_column(bind: Engine, column: Any) -> str:
+    preparer = bind.dialect.identifier_preparer
+    ddl = f"ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN {CreateColumn(column).compile(dialect=bind.dialect)}"
+    for fk in column.foreign_keys:
+        ddl += f" REFERENCES {preparer.format_table(fk.column.table)} ({preparer.quote(fk.column.name)})"
+        if fk.ondelete:
+            ddl += f" ON DELETE {fk.ondelete}"
+    return ddl
+
+
+def plan(bind: Engine) -> List[str]:
+    """The statements that bring the database up to date, in order; empty when it is."""
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    indexes = _index_names(bind)
+    created: List[str] = []
+    columns: List[str] = []
+    new_indexes: List[str] = []
+    for element in _model_ddl(bind):
+        if isinstance(element, CreateTable):
+            table = element.element
+            if table.name not in tables:
+                created.append(str(element.compile(dialect=bind.dialect)).strip())
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            columns.extend(_add_column(bind, column) for column in table.columns if column.name not in existing)
+        elif isinstance(element, CreateIndex):
+            index = element.element
+            if index.table.name not in tables:
+                # Created with its new table
+                created.append(str(element.compile(dialect=bind.dialect)))
+            elif index.name not in indexes:
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=bind.dialect))
+                if bind.dialect.name == "postgresql":
+                    ddl = re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", ddl)
+                new_indexes.append(ddl)
+    return created + columns + new_indexes
+
+
+def migrate(bind: Engine, *, dry_run: bool = False) -> List[str]:
+    """Apply `plan`; returns the statements (only returns them with dry_run)."""
+    statements = plan(bind)
+    if dry_run or not statements:
+        return statements
+    concurrent = [ddl for ddl in statements if "INDEX CONCURRENTLY" in ddl]
+    with bind.begin() as conn:
+        for ddl in statements:
+            if ddl not in concurrent:
+                conn.exec_driver_sql(ddl)
+    if concurrent:
+        # CONCURRENTLY cannot run inside a transaction block
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for ddl in concurrent:
+                conn.exec_driver_sql(ddl)
+    return statements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add missing tables, columns and indexes")
+    parser.add_argument("--dry-run", action="store_true", help="print the statements without running them")
+    args = parser.parse_args()
+
+    statements = migrate(engine, dry_run=args.dry_run)
+    for ddl in statements:
+        print(f"{ddl.strip()};")
+    if not statements:
+        print("Database is up to date")
+    elif not args.dry_run:
+        print(f"Applied {len(statements)} statements")
+
+
+if __name__ == "__main__":
+    main()
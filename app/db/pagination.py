@@ -0,0 +1,46 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are ordered by ``created_at DESC, id DESC``. A cursor identifies the last
+row of a page and is opaque to clients: it is the URL-safe base64 encoding,
+without padding, of the JSON array ``[created_at, id]`` where ``created_at`` is
+an ISO-8601 timestamp. The next page holds the rows that come strictly after
+that pair in the ordering above, so every page costs one index range scan no
+matter how deep into the result set it is.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple, TypeVar
+from sqlalchemy import literal, tuple_
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything that is not a cursor produced by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def cursor_for(obj: Any) -> str:
+    return encode_cursor(obj.created_at, obj.id)
+
+
+# A legacy Query or a 2.0-style Select; both provide filter()
+QueryType = TypeVar("QueryType")
+
+
+def apply_cursor(query: QueryType, model: Any, cursor: str) -> QueryType:
+    """Restrict a query ordered by (created_at DESC, id DESC) to rows after the cursor."""
+    created_at, id = decode_cursor(cursor)
+    # Bind with the column types so values are rendered in the column's storage format
+    bound = tuple_(literal(created_at, model.created_at.type), literal(id, model.id.type))
+    return query.filter(tuple_(model.created_at, model.id) < bound)
@@ -0,0 +1,115 @@
+"""
+Backfill / rebuild the stored full-text search vectors, semantic search
+embeddings and URL domains (for domain filters) of documents, after adding
+the columns that existing databases lack.
+
+Usage:
+    python -m app.db.reindex              # only rows without a vector
+    python -m app.db.reindex --all        # recompute every row
+    python -m app.db.reindex --batch-size 5000
+"""
+import argparse
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from app import crud
+from app.db.migrate import migrate
+from app.db.session import SessionLocal, engine
+from app.models.knowledge import Document
+from app.search.filters import url_domain
+
+
+def reindex_documents(db: Session, *, batch_size: int = 1000, only_missing: bool = True) -> int:
+    """
+    Recompute search vectors in id-ordered batches, committing after each batch
+    so that locks stay short. Returns the number of updated rows.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return 0
+    updated = 0
+    last_id = 0
+    while True:
+        batch = select(Document.id).where(Document.id > last_id)
+        if only_missing:
+            batch = batch.where(Document.search_vector.is_(None))
+        ids = db.execute(batch.order_by(Document.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        db.execute(
+            update(Document)
+            .where(Document.id.in_(ids))
+            .values(
+                search_vector=Document.search_vector_expression(Document.title, Document.content),
+                # A backfill is not a content change
+                updated_at=Document.updated_at,
+                version=Document.version,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    return updated
+
+
+def reindex_embeddings(db: Session, *, batch_size: int = 1000, only_missing: bool = True) -> int:
+    """Like reindex_documents, for the embeddings; works on every database."""
+    updated = 0
+    last_id = 0
+    while True:
+        batch = select(Document.id).where(Document.id > last_id)
+        if only_missing:
+            batch = batch.where(Document.embedding.is_(None))
+        ids = db.execute(batch.order_by(Document.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        crud.document.set_embeddings(db, ids)
+        db.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    return updated
+
+
+def reindex_domains(db: Session, *, batch_size: int = 1000, only_missing: bool = True) -> int:
+    """Like reindex_documents, for the URL domains of documents with a URL."""
+    updated = 0
+    last_id = 0
+    while True:
+        batch = select(Document.id, Document.url).where(Document.id > last_id, Document.url.isnot(None))
+        if only_missing:
+            batch = batch.where(Document.url_domain.is_(None))
+        rows = db.execute(batch.order_by(Document.id).limit(batch_size)).all()
+        if not rows:
+            break
+        table = Document.__table__
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("u_id"))
+            .values(url_domain=bindparam("u_domain"), updated_at=table.c.updated_at, version=table.c.version),
+            [{"u_id": id, "u_domain": url_domain(url)} for id, url in rows],
+        )
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the document search index")
+    parser.add_argument("--all", action="store_true", help="recompute every document, not only missing ones")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("Migrating the schema")
+    migrate(engine)
+    db = SessionLocal()
+    try:
+        count = reindex_documents(db, batch_size=args.batch_size, only_missing=not args.all)
+        embedded = reindex_embeddings(db, batch_size=args.batch_size, only_missing=not args.all)
+        domains = reindex_domains(db, batch_size=args.batch_size, only_missing=not args.all)
+    finally:
+        db.close()
+    print(f"Reindexed {count} documents, embedded {embedded} documents, {domains} URL domains")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Generic, List, Optional, TypeVar
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+EngineType = TypeVar("EngineType", Engine, AsyncEngine)
+
+
+class ReplicaSet(Generic[EngineType]):
+    """
+    Round-robin choice among read replicas that are currently reachable.
+
+    A replica is probed with ``SELECT 1`` when it is picked and its last probe
+    is more than `check_interval` seconds old; a replica that fails the probe
+    is skipped until the interval has passed again. `pick` returns None when
+    no replica is available and the caller should read from the primary.
+    """
+
+    def __init__(self, engines: List[EngineType], *, check_interval: float = 30, timeout: float = 2):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._healthy = [True] * len(engines)
+        self._checked_at = [float("-inf")] * len(engines)
+        self._turn = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def _candidates(self) -> List[int]:
+        start = next(self._turn)
+        count = len(self.engines)
+        return [(start + offset) % count for offset in range(count)]
+
+    def _due(self, i: int) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at[i] < self.check_interval:
+            return False
+        # Claim the probe so concurrent requests keep using the last known state
+        self._checked_at[i] = now
+        return True
+
+    def _record(self, i: int, healthy: bool) -> None:
+        if healthy != self._healthy[i]:
+            engine = self.engines[i]
+            if healthy:
+                logger.info("Read replica %s is available again", engine.url.host)
+            else:
+                logger.warning("Read replica %s is unavailable, reading from the primary", engine.url.host)
+        self._healthy[i] = healthy
+
+    def pick(self) -> Optional[Engine]:
+        for i in self._candidates():
+            if self._due(i):
+                try:
+                    with self.engines[i].connect() as connection:
+                        connection.execute(text("SELECT 1"))
+                    self._record(i, True)
+                except Exception:
+                    self._record(i, False)
+            if self._healthy[i]:
+                return self.engines[i]
+        return None
+
+    async def pick_async(self) -> Optional[AsyncEngine]:
+        for i in self._candidates():
+            if self._due(i):
+                try:
+                    await asyncio.wait_for(self._probe_async(self.engines[i]), self.timeout)
+                    self._record(i, True)
+                except Exception:
+                    self._record(i, False)
+            if self._healthy[i]:
+                return self.engines[i]
+        return None
+
+    @staticmethod
+    async def _probe_async(engine: AsyncEngine) -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
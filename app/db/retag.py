@@ -0,0 +1,41 @@
+"""
+Rebuild automatic tags.
+
+Writes keep the tag statistics current and tag the documents they write,
+but tags of other documents are not recomputed as a library grows. This
+recounts the statistics of each library from scratch and re-tags every
+document against them; it also tags documents written before tagging existed.
+
+Usage:
+    python -m app.db.retag                  # every user
+    python -m app.db.retag --user-id 42     # one user only
+"""
+import argparse
+from sqlalchemy import distinct, select
+from app import crud
+from app.db.session import SessionLocal
+from app.models.knowledge import Document
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild tag statistics and re-tag documents")
+    parser.add_argument("--user-id", type=int, help="only this user's documents")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.user_id is not None:
+            user_ids = [args.user_id]
+        else:
+            user_ids = db.execute(select(distinct(Document.user_id))).scalars().all()
+        tagged = 0
+        for user_id in user_ids:
+            tagged += crud.document.retag_with_user(db, user_id=user_id, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Tagged {tagged} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,136 @@
-from sqlalchemy import create_engine
+import time
+from typing import Any, Dict, Type
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from app.core import metrics
 from app.core.config import settings
+from app.db.replicas import ReplicaSet
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+# asyncio drivers for the sync database URLs used by scripts and the ingestion pipeline
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def async_database_uri(uri: str) -> str:
+    url = make_url(uri)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No asyncio driver known for {url.get_backend_name()!r}")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+def timed_pool(pool_class: Type[Pool], name: str) -> Type[Pool]:
+    """pool_class, recording how long each checkout waits (e.g. for a free connection) as pool `name`."""
+    class TimedPool(pool_class):
+        def connect(self) -> Any:
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                metrics.pool_wait.observe(time.perf_counter() - start, (name,))
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def engine_options(uri: str, *, name: str = "primary", is_async: bool = False) -> Dict[str, Any]:
+    options: Dict[str, Any] = {"pool_pre_ping": True}
+    # SQLite connections are cheap and SQLAlchemy picks its own pool for them
+    if make_url(uri).get_backend_name() != "sqlite":
+        options.update(
+            poolclass=timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return options
+
+def replica_options(uri: str, *, name: str, is_async: bool) -> Dict[str, Any]:
+    options = engine_options(uri, name=name, is_async=is_async)
+    # Fail fast on an unreachable replica instead of holding the request up
+    if make_url(uri).get_backend_name() == "postgresql":
+        timeout = settings.DB_REPLICA_CONNECT_TIMEOUT
+        options["connect_args"] = {"timeout": timeout} if is_async else {"connect_timeout": timeout}
+    return options
+
+# Engines by pool name, for the pool metrics
+instrumented_engines: Dict[str, Engine] = {}
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started_at = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    metrics.record_query(time.perf_counter() - context._query_started_at)
+
+def _handle_error(exception_context) -> None:
+    # Failed queries count too: a lock timeout is time the request spent in the database
+    started_at = getattr(exception_context.execution_context, "_query_started_at", None)
+    if started_at is not None:
+        metrics.record_query(time.perf_counter() - started_at)
+
+def instrument(engine: Engine, name: str) -> None:
+    """Count the queries of engine (the sync_engine of an AsyncEngine) and their time in app.core.metrics."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    instrumented_engines[name] = engine
+
+def _pool_connections() -> Dict[metrics.Labels, float]:
+    values: Dict[metrics.Labels, float] = {}
+    for name, engine in instrumented_engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            values[(name, "checked_out")] = pool.checkedout()
+            values[(name, "idle")] = pool.checkedin()
+    return values
+
+metrics.registry.register(metrics.Collected(
+    "nibblify_db_pool_connections", "Connections of each pool, checked out or idle (not for SQLite).",
+    ("pool", "state"), collect=_pool_connections,
+))
+
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, **engine_options(settings.SQLALCHEMY_DATABASE_URI))
+instrument(engine, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    async_database_uri(settings.SQLALCHEMY_DATABASE_URI),
+    **engine_options(settings.SQLALCHEMY_DATABASE_URI, name="primary_async", is_async=True),
+)
+instrument(async_engine.sync_engine, "primary_async")
+# Objects stay loaded after commit: lazy loads are not possible once the response is being built
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+replicas = ReplicaSet(
+    [
+        create_engine(uri, **replica_options(uri, name=f"replica{i}", is_async=False))
+        for i, uri in enumerate(settings.SQLALCHEMY_REPLICA_URIS)
+    ],
+    check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+    timeout=settings.DB_REPLICA_CONNECT_TIMEOUT,
+)
+async_replicas = ReplicaSet(
+    [
+        create_async_engine(async_database_uri(uri), **replica_options(uri, name=f"replica{i}_async", is_async=True))
+        for i, uri in enumerate(settings.SQLALCHEMY_REPLICA_URIS)
+    ],
+    check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+    timeout=settings.DB_REPLICA_CONNECT_TIMEOUT,
+)
+for i, (replica, async_replica) in enumerate(zip(replicas.engines, async_replicas.engines)):
+    instrument(replica, f"replica{i}")
+    instrument(async_replica.sync_engine, f"replica{i}_async")
+
 # Dependency
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
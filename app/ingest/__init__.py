@@ -0,0 +1,2 @@
+# This file is intentionally left empty to make the directory a Python package
+# Worker processes import app.ingest.extractors, so keep this package light
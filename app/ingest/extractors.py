@@ -0,0 +1,98 @@
+"""
+Plain-text extraction for uploaded files.
+
+Everything here is a module-level function of (path, file_type) so that it can
+run in a worker process.
+"""
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List
+from pypdf import PdfReader
+
+
+class UnsupportedFileType(Exception):
+    pass
+
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+_MARKDOWN_SYNTAX = [
+    (re.compile(r"^```.*$", re.MULTILINE), ""),                  # code fences
+    (re.compile(r"!?\[([^\]]*)\]\([^)]*\)"), r"\1"),             # links and images
+    (re.compile(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", re.MULTILINE), ""),  # headings, quotes, lists
+    (re.compile(r"(\*\*|__|\*|_|`)"), ""),                       # emphasis and inline code
+]
+
+
+def extract_markdown(path: str) -> str:
+    text = _read_text(path)
+    for pattern, replacement in _MARKDOWN_SYNTAX:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class _HTMLText(HTMLParser):
+    SKIP = {"script", "style", "noscript", "template", "head"}
+    BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def extract_html(path: str) -> str:
+    parser = _HTMLText()
+    parser.feed(_read_text(path))
+    parser.close()
+    return "".join(parser.parts)
+
+
+def extract_pdf(path: str) -> str:
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    "txt": _read_text,
+    "text": _read_text,
+    "csv": _read_text,
+    "md": extract_markdown,
+    "markdown": extract_markdown,
+    "html": extract_html,
+    "htm": extract_html,
+    "pdf": extract_pdf,
+}
+
+
+def extract_text(path: str, file_type: str, max_chars: int) -> str:
+    """Extract the text of a file, normalising whitespace and capping its length."""
+    extractor = EXTRACTORS.get((file_type or "").lower())
+    if extractor is None:
+        raise UnsupportedFileType(f"Unsupported file type: {file_type!r}")
+    # PostgreSQL text columns cannot hold NUL characters
+    text = extractor(path).replace("\x00", "")
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+    return text[:max_chars]
@@ -0,0 +1,210 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from app import crud
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.ingest.extractors import extract_text
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestionPipeline:
+    """
+    Extracts the text of uploaded documents off the request path.
+
+    Uploads call `submit` with the new document id and return immediately. A
+    coordinator thread drains the bounded queue in batches: it claims the
+    batch (status "extracting"), fans the extraction out to a pool of
+    `workers` processes, and writes the results back in a single transaction
+    (status "indexed" or "failed").
+
+    Every `sweep_interval` seconds the coordinator requeues the uploads that
+    fell through: pending ones older than `claim_timeout` (or all of them
+    after the queue was full), and claimed ones whose extraction has not
+    finished `claim_timeout` seconds after it was claimed (the batch failed,
+    a worker process died, or the process stopped). Other processes' recent
+    claims are left alone, so several app processes can share the work.
+    `requeue_pending` also runs on startup to recover work interrupted by a
+    restart.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        workers: int = 2,
+        queue_size: int = 1000,
+        batch_size: int = 16,
+        max_chars: int = 2_000_000,
+        claim_timeout: float = 600,
+        sweep_interval: float = 60,
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.claim_timeout = claim_timeout
+        self.sweep_interval = sweep_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        # Set when submit found the queue full: the next sweep then requeues every pending upload
+        self._overflowed = False
+        self._executor: Optional[Executor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._executor = self._create_executor()
+        self._thread = threading.Thread(target=self._run, name="ingestion", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+        self._executor = None
+
+    def _create_executor(self) -> Executor:
+        # Spawned, not forked: children must not inherit the parent's database connections
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _restart_executor(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+
+    def submit(self, document_id: int) -> bool:
+        """Queue a document for extraction; False if it has to wait for the next sweep."""
+        try:
+            self._queue.put_nowait(document_id)
+        except queue.Full:
+            self._overflowed = True
+            return False
+        return True
+
+    def requeue_pending(self, *, pending_age: float = 0) -> int:
+        """
+        Queue the pending uploads at least pending_age seconds old and the
+        ones whose claim timed out; returns how many were queued.
+        """
+        now = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            ids = crud.document.get_ids_pending_ingestion(
+                db,
+                claimed_before=self._claimed_before(),
+                created_before=now - timedelta(seconds=pending_age) if pending_age else None,
+                limit=self._queue.maxsize,
+            )
+        finally:
+            db.close()
+        return sum(self.submit(id) for id in ids)
+
+    def _claimed_before(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.claim_timeout)
+
+    def _sweep(self) -> None:
+        # Recent pending uploads are normally still queued, unless the queue was full
+        overflowed, self._overflowed = self._overflowed, False
+        self.requeue_pending(pending_age=0 if overflowed else self.claim_timeout)
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self.sweep_interval
+        while True:
+            batch = self._next_batch(timeout=max(0.0, next_sweep - time.monotonic()))
+            if batch is None:
+                return
+            if batch:
+                try:
+                    self.process(batch)
+                except Exception:
+                    # The batch stays claimed and is retried once its claim times out
+                    logger.exception("Ingestion of documents %s failed", batch)
+            if time.monotonic() >= next_sweep:
+                try:
+                    self._sweep()
+                except Exception:
+                    logger.exception("Requeueing unfinished uploads failed")
+                next_sweep = time.monotonic() + self.sweep_interval
+
+    def _next_batch(self, timeout: Optional[float] = None) -> Optional[List[int]]:
+        """
+        Wait up to timeout for one id, then take whatever else is queued, up
+        to batch_size; an empty batch when nothing came, None once stopped.
+        """
+        try:
+            first = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        if first is _STOP:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def process(self, ids: List[int]) -> None:
+        db = self.session_factory()
+        try:
+            claimed = crud.document.claim_for_ingestion(db, ids=ids, claimed_before=self._claimed_before())
+            futures = {
+                self._executor.submit(extract_text, file_path, file_type, self.max_chars): id
+                for id, file_path, file_type in claimed
+            }
+            wait(futures)
+            results = []
+            for future, id in futures.items():
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    # A worker died (e.g. out of memory); leave the document claimed, to retry once the claim times out
+                    continue
+                if error is None:
+                    results.append((id, future.result(), None))
+                else:
+                    results.append((id, None, str(error) or type(error).__name__))
+            if len(results) < len(futures):
+                self._restart_executor()
+            if results:
+                crud.document.save_extracted(db, results=results)
+        finally:
+            db.close()
+
+
+def create_pipeline() -> IngestionPipeline:
+    return IngestionPipeline(
+        SessionLocal,
+        workers=settings.INGEST_WORKERS,
+        queue_size=settings.INGEST_QUEUE_SIZE,
+        batch_size=settings.INGEST_BATCH_SIZE,
+        max_chars=settings.INGEST_MAX_CONTENT_CHARS,
+        claim_timeout=settings.INGEST_CLAIM_TIMEOUT,
+        sweep_interval=settings.INGEST_SWEEP_INTERVAL,
+    )
+
+
+ingestion = create_pipeline()
@@ -2,12 +2,29 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.v1.api import api_router
+from app.api import monitoring
+from app.core.metrics import MetricsMiddleware
+from app.core.security import password_hasher
+from app.core.storage import UploadLimitMiddleware
+from app.db.session import async_engine
+from app.ingest.pipeline import ingestion
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    debug=settings.DEBUG,
 )
 
+# Cap upload bodies while they are received, leaving room for the multipart
+# framing and the other form fields
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={f"{settings.API_V1_STR}/knowledge/documents/upload": settings.MAX_UPLOAD_SIZE + 64 * 1024},
+)
+
+# Request latency and database time per route (see /metrics)
+app.add_middleware(MetricsMiddleware, server_timing=settings.DEBUG)
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -16,9 +33,29 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
     )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(monitoring.router)
+
+@app.on_event("startup")
+def start_ingestion() -> None:
+    ingestion.start()
+    # Pick up uploads whose extraction was interrupted by a restart
+    ingestion.requeue_pending()
+
+@app.on_event("shutdown")
+def stop_ingestion() -> None:
+    ingestion.stop(timeout=10)
+
+@app.on_event("shutdown")
+async def close_async_engine() -> None:
+    await async_engine.dispose()
+
+@app.on_event("shutdown")
+def stop_password_hasher() -> None:
+    password_hasher.shutdown()
 
 @app.get("/")
 async def root():
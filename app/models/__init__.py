@@ -1,7 +1,9 @@
 from app.models.user import User
-from app.models.knowledge import Document
+from app.models.knowledge import Document, DocumentBand
+from app.models.blob import Blob
+from app.models.tag import Tag, DocumentTag, TermStat
 
 # Export all models
-__all__ = ["User", "Document"]
+__all__ = ["User", "Document", "DocumentBand", "Blob", "Tag", "DocumentTag", "TermStat"]
 
 # This file is intentionally left empty to make the directory a Python package
\ No newline at end of file
@@ -0,0 +1,13 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class Blob(Base):
+    """A stored file, shared by every Document whose upload had the same content."""
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Last time ref_count changed; garbage collection waits for a grace period after it
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
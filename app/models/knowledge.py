@@ -1,51 +1,105 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, func, text
-from sqlalchemy.orm import relationship
+import enum
+from sqlalchemy import BigInteger, Column, Integer, LargeBinary, SmallInteger, String, Text, DateTime, ForeignKey, Boolean, Index, cast, func, literal_column, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
+# Text search configuration used for both the stored vector and the queries
+SEARCH_CONFIG = "english"
+
+# SQLite stores CURRENT_TIMESTAMP without microseconds; binding parameters in the
+# same format keeps (created_at, id) cursor comparisons exact there too
+_Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
+def title_words_expression(title):
+    """
+    Title words for typeahead matching, unstemmed and with stop words kept.
+    Built from literals only, so that queries match the expression index.
+    """
+    return func.to_tsvector(literal_column("'simple'::regconfig"), func.coalesce(title, literal_column("''")))
+
+class IngestStatus(str, enum.Enum):
+    pending = "pending"
+    extracting = "extracting"
+    indexed = "indexed"
+    failed = "failed"
+
 class Document(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     content = Column(Text)
     file_path = Column(String, nullable=True)
+    blob_digest = Column(String(64), ForeignKey('blob.digest'), nullable=True, index=True)
     file_type = Column(String(50))
     url = Column(String(512))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Host of url with its labels reversed ("com.example.docs"), so that a domain and its
+    # subdomains share an index prefix; maintained by CRUDDocument
+    url_domain = Column(String(255), nullable=True)
+    created_at = Column(_Timestamp, server_default=func.now())
+    updated_at = Column(_Timestamp, onupdate=func.now())
     user_id = Column(Integer, ForeignKey('user.id'))
     is_archived = Column(Boolean, default=False)
-    
+    # Bumped by every UPDATE unless the statement sets it itself (see CRUDDocument); used for ETags
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+    # Text extraction state of uploaded files, see IngestStatus; None for other documents
+    ingest_status = Column(String(20), nullable=True, index=True)
+    ingest_error = Column(Text, nullable=True)
+    # When the extraction was last claimed: a claim older than INGEST_CLAIM_TIMEOUT was abandoned
+    ingest_claimed_at = Column(_Timestamp, nullable=True)
+
+    # Weighted full-text vector (title 'A', content 'B'), maintained by CRUDDocument.
+    # Deferred so that regular reads never ship it to the application.
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+    # float16 semantic search vector (see app.search.embeddings), maintained by CRUDDocument
+    embedding = deferred(Column(LargeBinary, nullable=True))
+    # MinHash signature (see app.search.minhash) and, for a near-duplicate, the document it duplicates
+    minhash = deferred(Column(LargeBinary, nullable=True))
+    duplicate_of = Column(Integer, ForeignKey('document.id', ondelete="SET NULL"), nullable=True, index=True)
+
+    __table_args__ = (
+        Index("ix_document_search_vector", "search_vector", postgresql_using="gin").ddl_if(
+            dialect="postgresql"
+        ),
+        Index("ix_document_title_words", title_words_expression(title), postgresql_using="gin").ddl_if(
+            dialect="postgresql"
+        ),
+        # Listing pages: a user's documents newest first, read in index order without a sort
+        Index("ix_document_user_created", user_id, created_at.desc(), id.desc()),
+        # The same for active documents only (listing with include_archived=false, typeahead)
+        Index(
+            "ix_document_user_created_active", user_id, created_at.desc(), id.desc(),
+            postgresql_where=is_archived.isnot(True), sqlite_where=is_archived.isnot(True),
+        ),
+        # text_pattern_ops lets LIKE 'prefix%' use the index whatever the collation
+        Index("ix_document_user_domain", "user_id", "url_domain", postgresql_ops={"url_domain": "text_pattern_ops"}),
+    )
+
     # Relationships
     user = relationship("User", back_populates="documents")
 
     @classmethod
-    def search(cls, db, user_id: int, query: str, filters: dict = None, page: int = 1, limit: int = 20):
-        """Search documents using PostgreSQL full-text search"""
-        # Base query
-        search_query = db.query(cls).filter(cls.user_id == user_id)
-        
-        # Add text search if query is provided
-        if query:
-            search_query = search_query.filter(
-                text("to_tsvector('english', title || ' ' || content) @@ plainto_tsquery('english', :query)")
-            ).params(query=query)
-        
-        # Add filters if provided
-        if filters:
-            if "file_type" in filters:
-                search_query = search_query.filter(cls.file_type == filters["file_type"])
-            if "is_archived" in filters:
-                search_query = search_query.filter(cls.is_archived == filters["is_archived"])
-        
-        # Get total count
-        total = search_query.count()
-        
-        # Apply pagination
-        documents = search_query.order_by(cls.created_at.desc()).offset((page - 1) * limit).limit(limit).all()
-        
-        return {
-            "documents": documents,
-            "total": total,
-            "page": page,
-            "limit": limit
-        } 
\ No newline at end of file
+    def search_vector_expression(cls, title, content):
+        """Build the weighted tsvector for a title/content pair (values or columns)"""
+        config = cast(SEARCH_CONFIG, REGCONFIG)
+        return func.setweight(
+            func.to_tsvector(config, func.coalesce(title, "")), literal_column("'A'")
+        ).op("||")(
+            func.setweight(func.to_tsvector(config, func.coalesce(content, "")), literal_column("'B'"))
+        )
+
+
+class DocumentBand(Base):
+    """
+    One LSH band hash of a document's MinHash signature; documents sharing a
+    band hash are near-duplicate candidates.
+    """
+    document_id = Column(Integer, ForeignKey('document.id', ondelete="CASCADE"), primary_key=True)
+    band = Column(SmallInteger, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    hash = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_documentband_lookup", "user_id", "band", "hash"),
+    )
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String
+from app.db.base_class import Base
+
+class Tag(Base):
+    """A tag name, stored once per user."""
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False)
+    name = Column(String(64), nullable=False)
+
+    __table_args__ = (
+        Index("ix_tag_user_name", "user_id", "name", unique=True),
+    )
+
+class DocumentTag(Base):
+    """A tag of a document, with the keyphrase score it was extracted with."""
+    document_id = Column(Integer, ForeignKey('document.id', ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey('tag.id', ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Tag filters look documents up by tag
+        Index("ix_documenttag_tag", "tag_id", "document_id"),
+    )
+
+class TermStat(Base):
+    """
+    Number of a user's documents containing a term, kept current by every
+    document write. The row with the empty term counts the documents.
+    """
+    user_id = Column(Integer, ForeignKey('user.id', ondelete="CASCADE"), primary_key=True)
+    term = Column(String(128), primary_key=True)
+    df = Column(Integer, nullable=False, default=0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, Index, Integer, String, func
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
@@ -9,6 +9,13 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean(), default=True)
     is_superuser = Column(Boolean(), default=False)
+    # Incremented by every write to the user's documents, see CRUDDocument._bump_generation
+    document_generation = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Knowledge Base Relationships
-    documents = relationship("Document", back_populates="user") 
\ No newline at end of file
+    documents = relationship("Document", back_populates="user")
+
+    __table_args__ = (
+        # Logins look users up by email case-insensitively, see CRUDUser.get_by_email
+        Index("ix_user_email_lower", func.lower(email)),
+    ) 
\ No newline at end of file
@@ -1,11 +1,25 @@
 from app.schemas.user import User, UserCreate, UserUpdate, Token, TokenPayload
-from app.schemas.knowledge import Document, DocumentCreate, DocumentUpdate, SearchQuery, SearchResult
+from app.schemas.knowledge import (
+    Document, DocumentCreate, DocumentUpdate, SearchQuery, SearchHit, SearchResult,
+    DocumentBulkCreate, DocumentBulkUpdate, DocumentBulkUpdateItem, DocumentBulkIds,
+    DocumentBulkArchive, BulkItemResult, BulkResult,
+    DocumentImport, ImportLineError, ImportResult,
+    DocumentPartial, SearchHitPartial, DOCUMENT_FIELDS, SUMMARY_FIELDS,
+    TitleSuggestion, TagCount, DocumentTagScore,
+    DateRange, SearchFilters, FacetCount, SearchFacets,
+)
 
 # Export all schemas
 __all__ = [
     "User", "UserCreate", "UserUpdate", "Token", "TokenPayload",
     "Document", "DocumentCreate", "DocumentUpdate", 
-    "SearchQuery", "SearchResult"
+    "SearchQuery", "SearchHit", "SearchResult",
+    "DocumentBulkCreate", "DocumentBulkUpdate", "DocumentBulkUpdateItem", "DocumentBulkIds",
+    "DocumentBulkArchive", "BulkItemResult", "BulkResult",
+    "DocumentImport", "ImportLineError", "ImportResult",
+    "DocumentPartial", "SearchHitPartial", "DOCUMENT_FIELDS", "SUMMARY_FIELDS",
+    "TitleSuggestion", "TagCount", "DocumentTagScore",
+    "DateRange", "SearchFilters", "FacetCount", "SearchFacets",
 ]
 
 # This file is intentionally left empty to make the directory a Python package 
\ No newline at end of file
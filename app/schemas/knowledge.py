@@ -1,6 +1,6 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal, Union
 from datetime import datetime
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, validator
 
 # Document schemas
 class DocumentBase(BaseModel):
@@ -22,22 +22,187 @@ class Document(DocumentBase):
     user_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    ingest_status: Optional[str] = None
+    # Set when this document is a near-duplicate of an earlier one
+    duplicate_of: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+# Fields a list or search response can be narrowed to with `fields`; `id` is always returned
+DOCUMENT_FIELDS = (
+    "title", "content", "file_path", "file_type", "url", "is_archived",
+    "user_id", "created_at", "updated_at", "ingest_status", "duplicate_of",
+)
+# What `view=summary` returns: everything a list UI shows, without the content
+SUMMARY_FIELDS = (
+    "title", "file_type", "url", "is_archived", "created_at", "updated_at", "ingest_status", "duplicate_of",
+)
+
+class DocumentPartial(BaseModel):
+    """A Document of which only the requested fields are present."""
+    id: int
+    title: Optional[str] = None
+    content: Optional[str] = None
+    file_path: Optional[str] = None
+    file_type: Optional[str] = None
+    url: Optional[HttpUrl] = None
+    is_archived: Optional[bool] = None
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    ingest_status: Optional[str] = None
+    duplicate_of: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+# Bulk schemas: items are validated one by one, so that an invalid item is
+# reported in the result instead of rejecting the whole batch
+class DocumentBulkCreate(BaseModel):
+    documents: List[Dict[str, Any]]
+
+class DocumentBulkUpdateItem(DocumentUpdate):
+    id: int
+
+class DocumentBulkUpdate(BaseModel):
+    documents: List[Dict[str, Any]]
+
+class DocumentBulkIds(BaseModel):
+    ids: List[int]
+
+class DocumentBulkArchive(DocumentBulkIds):
+    is_archived: bool = True
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    ok: bool
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+# Import/export schemas
+class DocumentImport(DocumentCreate):
+    # Kept from the export; documents without one are dated at import time
+    created_at: Optional[datetime] = None
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int
+    # Only the first errors are listed
+    errors: List[ImportLineError]
+
 # Search schemas
+class DateRange(BaseModel):
+    gte: Optional[datetime] = None
+    gt: Optional[datetime] = None
+    lte: Optional[datetime] = None
+    lt: Optional[datetime] = None
+
+    class Config:
+        extra = "forbid"
+
+    @validator("gte", "gt", "lte", "lt", pre=True)
+    def date_only(cls, v: Any) -> Any:
+        # A bare date means its midnight
+        if isinstance(v, str) and len(v) == 10:
+            return f"{v}T00:00:00"
+        return v
+
+class SearchFilters(BaseModel):
+    """
+    Conditions on the searched documents, all of which must hold; lists match
+    any of their values, except for tags, which must all be present.
+    Dates without a time zone are UTC.
+    """
+    file_type: Optional[Union[str, List[str]]] = None
+    is_archived: Optional[bool] = None
+    created_at: Optional[DateRange] = None
+    updated_at: Optional[DateRange] = None
+    # Matches URLs on the domain and on its subdomains
+    domain: Optional[Union[str, List[str]]] = None
+    tag: Optional[Union[str, List[str]]] = None
+
+    class Config:
+        extra = "forbid"
+
+    @validator("file_type", "domain", "tag")
+    def not_empty(cls, v: Any) -> Any:
+        if isinstance(v, list) and not v:
+            raise ValueError("must not be an empty list")
+        return v
+
 class SearchQuery(BaseModel):
     query: str
-    filters: Optional[Dict[str, Any]] = None
+    filters: Optional[SearchFilters] = None
     page: int = 1
     limit: int = 20
+    # Set to False to receive snippets only, without the full document content
+    include_content: bool = True
+    # "exact" runs a COUNT, "estimate" uses the planner's row estimate, "none" skips it
+    count: Literal["exact", "estimate", "none"] = "exact"
+    # "recent" (or an empty query) orders by creation date and enables cursor paging
+    sort: Literal["relevance", "recent"] = "relevance"
+    cursor: Optional[str] = None
+    # "summary" returns SUMMARY_FIELDS only; `fields` picks any DOCUMENT_FIELDS
+    view: Literal["full", "summary"] = "full"
+    fields: Optional[List[str]] = None
+    # "semantic" ranks by similarity of meaning, "hybrid" merges it with the keyword ranking
+    mode: Literal["keyword", "semantic", "hybrid"] = "keyword"
+    # Also count the matches per file type, creation month and archived state
+    facets: bool = False
+
+class SearchHit(Document):
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+class SearchHitPartial(DocumentPartial):
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+class TitleSuggestion(BaseModel):
+    id: int
+    title: Optional[str] = None
+    created_at: datetime
+
+class TagCount(BaseModel):
+    name: str
+    documents: int
+
+class DocumentTagScore(BaseModel):
+    name: str
+    score: float
+
+class FacetCount(BaseModel):
+    value: Union[bool, str, None] = None
+    count: int
+
+class SearchFacets(BaseModel):
+    # Most frequent first
+    file_type: List[FacetCount]
+    # "YYYY-MM" in UTC, newest first
+    month: List[FacetCount]
+    # Active (false) first
+    archived: List[FacetCount]
 
 class SearchResult(BaseModel):
-    documents: List[Document]
-    total: int
+    documents: List[SearchHitPartial]
+    # Counts over every match rather than the page; keyword matches in semantic and hybrid mode
+    facets: Optional[SearchFacets] = None
+    total: Optional[int] = None
+    total_is_estimate: bool = False
+    has_more: bool = False
+    next_cursor: Optional[str] = None
     page: int
     limit: int
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
@@ -0,0 +1,32 @@
+from app.core.config import settings
+from app.search.base import SearchBackend
+from app.search.inverted_index import InvertedIndexSearchBackend
+from app.search.postgres import PostgresSearchBackend
+from app.search.semantic import SemanticIndex
+
+
+def create_search_backend(name: str = settings.SEARCH_BACKEND) -> SearchBackend:
+    """
+    Build a backend by name: "postgres", "memory", or "auto" (PostgreSQL
+    full-text search when the database is PostgreSQL, the in-process index otherwise).
+    """
+    if name == "auto":
+        name = "postgres" if settings.SQLALCHEMY_DATABASE_URI.startswith("postgresql") else "memory"
+    if name == "postgres":
+        return PostgresSearchBackend()
+    if name == "memory":
+        return InvertedIndexSearchBackend(max_users=settings.SEARCH_MEMORY_MAX_USERS)
+    raise ValueError(f"Unknown search backend: {name}")
+
+
+search_backend = create_search_backend()
+
+semantic_index = SemanticIndex(
+    max_users=settings.SEARCH_MEMORY_MAX_USERS,
+    ann_min_documents=settings.SEARCH_ANN_MIN_DOCUMENTS,
+)
+
+__all__ = [
+    "SearchBackend", "PostgresSearchBackend", "InvertedIndexSearchBackend",
+    "create_search_backend", "search_backend", "SemanticIndex", "semantic_index",
+]
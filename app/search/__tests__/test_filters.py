@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import select
+from app.models.knowledge import Document
+from app.models.tag import DocumentTag, Tag
+from app.search import filters
+
+
+def test_domain_keys():
+    assert filters.url_domain("https://Docs.Python.org/3/") == "org.python.docs"
+    assert filters.url_domain("not a url") is None
+    assert filters.url_domain(None) is None
+    assert filters.domain_key("*.example.com.") == "com.example"
+
+
+def test_no_filters():
+    assert filters.condition(None, user_id=1) is None
+    assert filters.condition({}, user_id=1) is None
+    assert filters.condition({"file_type": None}, user_id=1) is None
+
+
+@pytest.mark.parametrize("invalid", [
+    {"unknown": 1},
+    {"file_type": []},
+    {"created_at": {"after": "2024-01-01"}},
+    {"created_at": {"gte": "yesterday"}},
+])
+def test_invalid_filters(invalid: Dict[str, Any]):
+    with pytest.raises(ValidationError):
+        filters.condition(invalid, user_id=1)
+
+
+@pytest.fixture
+def library(db: Any, user: Any) -> Dict[str, int]:
+    """Documents of the user by name, with the tags named in their titles."""
+    def utc(*args: int) -> datetime:
+        return datetime(*args, tzinfo=timezone.utc)
+
+    documents = {
+        "pdf": Document(file_type="pdf", url="https://example.com/a", created_at=utc(2024, 1, 15), title="python"),
+        "web": Document(file_type="html", url="https://docs.example.com/b", created_at=utc(2024, 2, 1), title="python web"),
+        "other": Document(file_type="html", url="https://example.org/", created_at=utc(2024, 2, 20), title="web"),
+        "archived": Document(file_type="txt", is_archived=True, created_at=utc(2024, 3, 1), title=""),
+        "legacy": Document(file_type="txt", is_archived=None, created_at=utc(2023, 12, 31, 23), title=""),
+    }
+    for document in documents.values():
+        document.user_id = user.id
+        document.url_domain = filters.url_domain(document.url)
+    db.add_all(documents.values())
+    db.flush()
+    tags = {name: Tag(user_id=user.id, name=name) for name in ("python", "web")}
+    db.add_all(tags.values())
+    db.flush()
+    db.add_all(
+        DocumentTag(document_id=document.id, tag_id=tags[name].id, score=1.0)
+        for document in documents.values() for name in document.title.split()
+    )
+    db.commit()
+    return {name: document.id for name, document in documents.items()}
+
+
+@pytest.mark.parametrize("conditions,expected", [
+    ({"file_type": "html"}, {"web", "other"}),
+    ({"file_type": ["pdf", "txt"]}, {"pdf", "archived", "legacy"}),
+    ({"is_archived": True}, {"archived"}),
+    # NULL counts as active
+    ({"is_archived": False}, {"pdf", "web", "other", "legacy"}),
+    ({"created_at": {"gte": "2024-02-01"}}, {"web", "other", "archived"}),
+    ({"created_at": {"gt": "2024-02-01", "lt": "2024-03-01"}}, {"other"}),
+    # Dates with a time zone are converted to UTC
+    ({"created_at": {"lte": "2024-01-01T00:30:00+01:00"}}, {"legacy"}),
+    ({"domain": "example.com"}, {"pdf", "web"}),
+    ({"domain": "*.example.com"}, {"pdf", "web"}),
+    ({"domain": ["docs.example.com", "example.org"]}, {"web", "other"}),
+    ({"tag": "Python"}, {"pdf", "web"}),
+    # Every tag must be present
+    ({"tag": ["python", "web"]}, {"web"}),
+    ({"tag": "python", "file_type": "html"}, {"web"}),
+    ({"tag": "missing"}, set()),
+])
+def test_matching_ids(db: Any, user: Any, library: Dict[str, int], conditions: Dict[str, Any], expected: set):
+    matched = filters.matching_ids(db, user_id=user.id, filters=conditions)
+
+    assert matched == {library[name] for name in expected}
+
+
+def test_matching_ids_are_per_user(db: Any, user: Any, library: Dict[str, int]):
+    assert filters.matching_ids(db, user_id=user.id + 1000, filters={"file_type": "pdf"}) == set()
+    assert filters.matching_ids(db, user_id=user.id, filters=None) is None
+
+
+def test_count_facets():
+    rows = [
+        ("pdf", datetime(2024, 1, 31, 23, tzinfo=timezone.utc), False),
+        # Months are UTC
+        ("html", datetime(2024, 2, 1, 1, tzinfo=timezone(timedelta(hours=-2))), True),
+        ("pdf", datetime(2024, 2, 5), None),
+    ]
+
+    assert filters.count_facets(rows) == {
+        "file_type": [{"value": "pdf", "count": 2}, {"value": "html", "count": 1}],
+        "month": [{"value": "2024-02", "count": 2}, {"value": "2024-01", "count": 1}],
+        "archived": [{"value": False, "count": 2}, {"value": True, "count": 1}],
+    }
+
+
+def test_facet_counts_agree_with_count_facets(db: Any, user: Any, library: Dict[str, int]):
+    mine = Document.user_id == user.id
+    matched = select(
+        Document.file_type, filters.month_expression(db).label("month"), Document.is_archived
+    ).where(mine).subquery()
+    rows = db.execute(select(Document.file_type, Document.created_at, Document.is_archived).where(mine)).all()
+
+    assert filters.facet_counts(db, matched) == filters.count_facets(rows)
@@ -0,0 +1,92 @@
+from app.search.inverted_index import InvertedIndex
+
+
+def test_search_requires_every_term():
+    index = InvertedIndex()
+    index.add(1, "Cooking pasta", "Boil the water, then add the pasta")
+    index.add(2, "Boiling eggs", "Boil the water, then add the eggs")
+
+    assert set(index.search(["water"])) == {1, 2}
+    assert set(index.search(["water", "pasta"])) == {1}
+    assert index.search(["water", "rice"]) == {}
+    assert index.search([]) == {}
+
+
+def test_rare_terms_and_frequent_terms_rank_higher():
+    index = InvertedIndex()
+    index.add(1, None, "garden " * 5 + "tomato")
+    index.add(2, None, "garden tomato soil")
+    index.add(3, None, "kitchen soil")
+    index.add(4, None, "kitchen table soil")
+
+    scores = index.search(["garden"])
+    assert scores[1] > scores[2]
+    # "tomato" is in fewer documents than "soil", so it weighs more
+    assert index.search(["tomato"])[2] > index.search(["soil"])[2]
+
+
+def test_title_terms_outweigh_content_terms():
+    index = InvertedIndex()
+    index.add(1, "Sourdough", "bread starter flour")
+    index.add(2, "Baking notes", "sourdough bread starter flour")
+
+    scores = index.search(["sourdough"])
+    assert scores[1] > scores[2]
+
+
+def test_shorter_documents_rank_higher():
+    index = InvertedIndex()
+    index.add(1, None, "violin")
+    index.add(2, None, "violin " + "music " * 50)
+
+    scores = index.search(["violin"])
+    assert scores[1] > scores[2]
+
+
+def test_add_replaces_previous_version():
+    index = InvertedIndex()
+    index.add(1, "Draft", "first version")
+    index.add(1, "Draft", "second version")
+
+    assert len(index) == 1
+    assert index.search(["first"]) == {}
+    assert set(index.search(["second"])) == {1}
+
+
+def test_remove():
+    index = InvertedIndex()
+    index.add(1, None, "alpha beta")
+    index.add(2, None, "alpha gamma")
+
+    assert index.remove(1)
+    assert not index.remove(1)
+    assert 1 not in index
+    assert set(index.search(["alpha"])) == {2}
+    assert index.search(["beta"]) == {}
+
+
+def test_compact_after_removals_keeps_scores():
+    index = InvertedIndex()
+    reference = InvertedIndex()
+    for id in range(20):
+        content = f"common word{id % 3} unique{id}"
+        index.add(id, f"Title {id}", content)
+        if id % 2:
+            reference.add(id, f"Title {id}", content)
+    for id in range(0, 20, 2):
+        index.remove(id)
+
+    # Removing half of the documents compacted the index, dropping the dead slots
+    assert index._dead < len(index)
+    assert len(index._slot_doc) < 20
+    assert "unique0" not in index._postings
+    assert len(index) == len(reference) == 10
+    for terms in (["common"], ["word1"], ["unique3"], ["unique4"], ["common", "word2"]):
+        assert index.search(terms) == reference.search(terms)
+
+    # The compacted index keeps taking updates
+    index.add(3, "Title 3", "rewritten")
+    index.add(40, None, "common")
+    assert index.search(["unique3"]) == {}
+    assert set(index.search(["rewritten"])) == {3}
+    assert 40 in index.search(["common"])
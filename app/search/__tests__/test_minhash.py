@@ -0,0 +1,94 @@
+import random
+from app.search import minhash
+
+WORDS = [f"word{n}" for n in range(2000)]
+
+
+def text(rng: random.Random, count: int = 300) -> str:
+    return " ".join(rng.choices(WORDS, k=count))
+
+
+def edited(content: str, rng: random.Random, changes: int) -> str:
+    """content with `changes` words replaced."""
+    words = content.split()
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = "changed"
+    return " ".join(words)
+
+
+def jaccard(a: str, b: str) -> float:
+    a_shingles, b_shingles = minhash.shingles(a), minhash.shingles(b)
+    return len(a_shingles & b_shingles) / len(a_shingles | b_shingles)
+
+
+def test_shingles():
+    assert minhash.shingles("one two three four five six") == {"one two three four five", "two three four five six"}
+    assert minhash.shingles("Too short") == {"too short"}
+    assert minhash.shingles("") == set()
+    assert minhash.shingles(None) == set()
+
+
+def test_signature_falls_back_to_title():
+    assert minhash.signature("A title", None) is not None
+    assert minhash.signature(None, "  ") is None
+    assert (minhash.signature("A title", None) == minhash.signature(None, "a title")).all()
+
+
+def test_similarity_estimates_jaccard():
+    rng = random.Random(0)
+    for changes in (0, 3, 10, 40):
+        original = text(rng)
+        copy = edited(original, rng, changes)
+        estimate = minhash.similarity(minhash.signature(None, original), minhash.signature(None, copy))
+        assert abs(estimate - jaccard(original, copy)) < 0.15
+
+    unrelated = minhash.similarity(minhash.signature(None, text(rng)), minhash.signature(None, text(rng)))
+    assert unrelated < 0.05
+
+
+def test_signature_bytes_round_trip():
+    sig = minhash.signature("Title", "some content to sign")
+    data = minhash.to_bytes(sig)
+
+    assert len(data) == minhash.NUM_PERM * 4
+    assert (minhash.from_bytes(data) == sig).all()
+    assert minhash.from_bytes(None) is None
+    assert minhash.from_bytes(data[:-4]) is None
+
+
+def test_band_hashes():
+    sig = minhash.signature(None, text(random.Random(1)))
+    hashes = minhash.band_hashes(sig)
+
+    assert len(hashes) == minhash.BANDS
+    assert hashes == minhash.band_hashes(sig.copy())
+    # The band number is mixed in: equal bands at different positions hash differently
+    repeated = sig.copy()
+    repeated[minhash.ROWS:2 * minhash.ROWS] = repeated[:minhash.ROWS]
+    first, second = minhash.band_hashes(repeated)[:2]
+    assert first != second
+
+
+def test_band_candidates():
+    rng = random.Random(2)
+    documents = {id: text(rng) for id in range(50)}
+    index = minhash.LshIndex()
+    for id, content in documents.items():
+        index.add(id, minhash.signature(None, content))
+
+    near_duplicate = minhash.signature(None, edited(documents[7], rng, 2))
+    assert 7 in index.candidates(near_duplicate)
+    assert index.candidates(minhash.signature(None, text(rng))) == set()
+
+
+def test_best_match():
+    rng = random.Random(3)
+    original = text(rng)
+    sig = minhash.signature(None, original)
+    close = minhash.signature(None, edited(original, rng, 2))
+    far = minhash.signature(None, edited(original, rng, 60))
+
+    match = minhash.best_match(sig, [(1, far), (2, close)], threshold=0.8)
+    assert match is not None and match[0] == 2 and match[1] >= 0.8
+    assert minhash.best_match(sig, [(1, far)], threshold=0.8) is None
+    assert minhash.best_match(sig, [], threshold=0.0) is None
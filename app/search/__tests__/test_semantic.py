@@ -0,0 +1,43 @@
+import numpy as np
+from app.search.semantic import RRF_K, AnnIndex, reciprocal_rank_fusion
+
+
+def test_rrf_prefers_ids_ranked_by_both():
+    merged = reciprocal_rank_fusion([1, 2, 3], [3, 4, 1])
+
+    assert [id for id, _ in merged] == [1, 3, 2, 4]
+    assert dict(merged)[1] == 1 / (RRF_K + 1) + 1 / (RRF_K + 3)
+    assert dict(merged)[4] == 1 / (RRF_K + 2)
+
+
+def test_rrf_keeps_the_order_of_a_single_ranking():
+    assert [id for id, _ in reciprocal_rank_fusion([5, 3, 9])] == [5, 3, 9]
+    assert reciprocal_rank_fusion([], []) == []
+
+
+def test_rrf_ties_keep_first_seen_order():
+    # 1 and 2 are both first once and absent once
+    assert [id for id, _ in reciprocal_rank_fusion([1], [2])] == [1, 2]
+
+
+def test_rrf_k_flattens_rank_differences():
+    # A document second in both rankings against one first in a single ranking
+    steep = dict(reciprocal_rank_fusion([1, 2], [3, 2], k=0))
+    flat = dict(reciprocal_rank_fusion([1, 2], [3, 2], k=60))
+
+    assert steep[2] == steep[1]
+    assert flat[2] > flat[1]
+
+
+def test_ann_candidates_include_near_vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = AnnIndex(vectors)
+
+    for row in (0, 500, 1999):
+        query = vectors[row] + 0.05 * rng.standard_normal(64).astype(np.float32)
+        candidates = index.candidates(query / np.linalg.norm(query))
+        assert row in candidates
+        # A fraction of the rows, not a full scan
+        assert len(candidates) < len(vectors) // 2
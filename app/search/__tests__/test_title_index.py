@@ -0,0 +1,46 @@
+from app.search.inverted_index import TitleIndex
+
+
+def test_match_prefixes():
+    titles = TitleIndex()
+    titles.add(1, "Python packaging guide")
+    titles.add(2, "Pasta recipes")
+    titles.add(3, "Python typing")
+
+    assert titles.match(["py"]) == {1, 3}
+    assert titles.match(["pa"]) == {1, 2}
+    assert titles.match(["python", "pack"]) == {1}
+    assert titles.match(["python"]) == {1, 3}
+    assert titles.match(["rust"]) == set()
+    assert titles.match(["py", "rust"]) == set()
+
+
+def test_match_is_case_insensitive_on_titles():
+    titles = TitleIndex()
+    titles.add(1, "SQLAlchemy Sessions")
+
+    assert titles.match(["sqla", "sess"]) == {1}
+    assert titles.title(1) == "SQLAlchemy Sessions"
+
+
+def test_add_replaces_and_remove_forgets():
+    titles = TitleIndex()
+    titles.add(1, "Old name")
+    titles.add(2, "Old habits")
+    titles.add(1, "New name")
+
+    assert titles.match(["old"]) == {2}
+    assert titles.match(["new"]) == {1}
+
+    titles.remove(2)
+    titles.remove(2)
+    assert titles.match(["old"]) == set()
+    assert titles._words == ["name", "new"]
+
+
+def test_documents_without_title():
+    titles = TitleIndex()
+    titles.add(1, None)
+
+    assert titles.title(1) is None
+    assert titles.match(["a"]) == set()
@@ -0,0 +1,92 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.knowledge import Document
+
+
+class SearchBackend(ABC):
+    """
+    Interface between CRUDDocument and a full-text search engine.
+
+    `search` returns a dict shaped like schemas.SearchResult. The index hooks
+    are called by CRUDDocument after a write has been committed, with the
+    user's document generation that write left (User.document_generation);
+    engines that read straight from the database can ignore them.
+    """
+
+    name: str
+
+    @abstractmethod
+    def search(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        page: int = 1,
+        limit: int = 20,
+        include_content: bool = True,
+        count: str = "exact",
+        sort: str = "relevance",
+        cursor: Optional[str] = None,
+        facets: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        `filters` follow schemas.SearchFilters (see app.search.filters); with
+        `facets`, the result also has facet counts over all the matches.
+        """
+
+    @abstractmethod
+    def suggest(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        prefix: str,
+        limit: int = 10,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Typeahead: the most recent documents whose title has a word starting
+        with each word of `prefix`, as dicts shaped like schemas.TitleSuggestion.
+        """
+
+    async def prepare_async(self, db: AsyncSession, *, user_id: int) -> None:
+        """
+        Called on the event loop before `search` or `suggest` run under
+        AsyncSession.run_sync, to load the user's in-process state, if any,
+        without blocking the loop.
+        """
+
+    def clear(self) -> None:
+        """Drop the in-process state, if any."""
+
+    def index_document(self, document: Document, *, generation: int) -> None:
+        pass
+
+    def remove_document(self, *, id: int, user_id: int, generation: int) -> None:
+        pass
+
+    def refresh_documents(self, db: Session, *, user_id: int, ids: List[int], generation: int) -> None:
+        """
+        Re-read a batch of one user's documents after a bulk write. No ids
+        means the write changed nothing the index holds (e.g. the ingest
+        status or tags), only the generation.
+        """
+
+
+def search_hit(
+    document: Document, rank: Optional[float], snippet: Optional[str], include_content: bool
+) -> Dict[str, Any]:
+    """Flatten a Document row into a schemas.SearchHit-compatible dict."""
+    hit = {
+        column.key: getattr(document, column.key)
+        for column in Document.__table__.columns
+        if column.key not in ("search_vector", "embedding", "minhash", "url_domain", "ingest_claimed_at", "content")
+    }
+    hit["content"] = document.content if include_content else None
+    hit["rank"] = rank
+    hit["snippet"] = snippet
+    return hit
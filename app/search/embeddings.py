@@ -0,0 +1,67 @@
+"""
+Local document embeddings for semantic search.
+
+A document vector is a feature-hashed bag of its terms and term bigrams (the
+same analysis as the in-process full-text index, see tokenizer.analyze):
+every feature is added, with weight 1 + log(tf) and a sign taken from its
+hash, to two of the `dim` dimensions. This is a sparse random projection of
+the term-frequency vector, so cosine similarity between embeddings tracks
+the overlap of vocabulary between documents. Vectors are L2-normalized and
+stored as float16, `2 * dim` bytes per document.
+"""
+import math
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.search.tokenizer import analyze
+
+# Title features count this many times, as in the in-process full-text index
+TITLE_WEIGHT = 3
+# Longer content is embedded from its beginning only
+MAX_CONTENT_CHARS = 100_000
+
+DTYPE = np.float16
+
+
+@lru_cache(maxsize=200_000)
+def _slots(feature: str, dim: int) -> Tuple[int, float, int, float]:
+    h1 = zlib.crc32(feature.encode())
+    h2 = zlib.crc32(feature.encode(), 0x9E3779B9)
+    return h1 % dim, (1.0 if h1 & 0x80000000 else -1.0), h2 % dim, (1.0 if h2 & 0x80000000 else -1.0)
+
+
+def _features(terms: List[str]) -> List[str]:
+    return terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]
+
+
+def embed(title: Optional[str], content: Optional[str], *, dim: int = settings.SEARCH_EMBEDDING_DIM) -> np.ndarray:
+    """Normalized float32 vector of a document; all zeros if it has no terms."""
+    frequencies = Counter(_features(analyze((content or "")[:MAX_CONTENT_CHARS])))
+    for feature in _features(analyze(title)):
+        frequencies[feature] += TITLE_WEIGHT
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, tf in frequencies.items():
+        weight = 1.0 + math.log(tf)
+        i, sign_i, j, sign_j = _slots(feature, dim)
+        vector[i] += sign_i * weight
+        vector[j] += sign_j * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_query(query: str, *, dim: int = settings.SEARCH_EMBEDDING_DIM) -> np.ndarray:
+    return embed(None, query, dim=dim)
+
+
+def to_bytes(vector: np.ndarray) -> bytes:
+    return vector.astype(DTYPE).tobytes()
+
+
+def from_bytes(data: Optional[bytes], *, dim: int = settings.SEARCH_EMBEDDING_DIM) -> Optional[np.ndarray]:
+    """None for a missing vector or one stored with another dimension."""
+    if data is None or len(data) != dim * np.dtype(DTYPE).itemsize:
+        return None
+    return np.frombuffer(data, dtype=DTYPE).astype(np.float32)
@@ -0,0 +1,159 @@
+"""
+Search filters and facets.
+
+The `filters` of a search request (see schemas.SearchFilters) compile to one
+SQL condition on Document: the PostgreSQL backend adds it to its query, the
+in-process engines turn it into the set of matching ids with one indexed
+query. Facets count the matches per file type, creation month (UTC) and
+archived state, in one aggregated query or, for documents already in
+memory, in one pass.
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from sqlalchemy import String, and_, case, cast, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement, Subquery
+from app.models.knowledge import Document
+from app.models.tag import DocumentTag, Tag
+from app.schemas.knowledge import DateRange, SearchFilters
+from app.search.keyphrases import normalize_tag
+
+_DATE_OPERATORS = {"gte": "__ge__", "gt": "__gt__", "lte": "__le__", "lt": "__lt__"}
+
+
+def url_domain(url: Any) -> Optional[str]:
+    """The value of Document.url_domain for a URL: its host with the labels reversed."""
+    if not url:
+        return None
+    host = urlsplit(str(url)).hostname
+    return domain_key(host) if host else None
+
+
+def domain_key(domain: str) -> str:
+    labels = domain.strip().lower().strip(".").split(".")
+    if labels and labels[0] == "*":
+        labels = labels[1:]
+    return ".".join(reversed(labels))
+
+
+def parse(filters: Optional[Dict[str, Any]]) -> Optional[SearchFilters]:
+    """Validate a filters dict; raises ValueError (a pydantic ValidationError) if it is invalid."""
+    if not filters:
+        return None
+    return filters if isinstance(filters, SearchFilters) else SearchFilters.parse_obj(filters)
+
+
+def condition(filters: Optional[Dict[str, Any]], *, user_id: int) -> Optional[ColumnElement]:
+    """The SQL condition of filters, None when they do not restrict anything."""
+    parsed = parse(filters)
+    if parsed is None:
+        return None
+    clauses = []
+    if parsed.file_type is not None:
+        clauses.append(Document.file_type.in_(_values(parsed.file_type)))
+    if parsed.is_archived is not None:
+        # NULL counts as active, as everywhere else
+        clauses.append(
+            Document.is_archived.is_(True) if parsed.is_archived else Document.is_archived.isnot(True)
+        )
+    for column, dates in ((Document.created_at, parsed.created_at), (Document.updated_at, parsed.updated_at)):
+        if dates is not None:
+            clauses.extend(_date_range(column, dates))
+    if parsed.domain is not None:
+        clauses.append(or_(*(
+            or_(Document.url_domain == key, Document.url_domain.startswith(key + ".", autoescape=True))
+            for key in map(domain_key, _values(parsed.domain))
+        )))
+    if parsed.tag is not None:
+        names = sorted({normalize_tag(name) for name in _values(parsed.tag)})
+        clauses.append(Document.id.in_(
+            select(DocumentTag.document_id)
+            .join(Tag, Tag.id == DocumentTag.tag_id)
+            .where(Tag.user_id == user_id, Tag.name.in_(names))
+            .group_by(DocumentTag.document_id)
+            .having(func.count() == len(names))
+        ))
+    return and_(*clauses) if clauses else None
+
+
+def matching_ids(db: Session, *, user_id: int, filters: Optional[Dict[str, Any]]) -> Optional[Set[int]]:
+    """Ids of the user's documents that pass filters; None when they do not restrict anything."""
+    where = condition(filters, user_id=user_id)
+    if where is None:
+        return None
+    return set(db.scalars(select(Document.id).where(Document.user_id == user_id, where)))
+
+
+def _values(value: Any) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _date_range(column: Any, dates: DateRange) -> List[ColumnElement]:
+    return [
+        getattr(column, operator)(_utc(getattr(dates, name)))
+        for name, operator in _DATE_OPERATORS.items()
+        if getattr(dates, name) is not None
+    ]
+
+
+def _utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def month_expression(db: Session) -> Any:
+    if db.get_bind().dialect.name == "postgresql":
+        return func.to_char(func.timezone("UTC", Document.created_at), "YYYY-MM")
+    return func.strftime("%Y-%m", Document.created_at)
+
+
+def facet_counts(db: Session, matched: Subquery) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Facets of `matched`, a subquery with the columns file_type, month and
+    is_archived, in one statement: the subquery is a CTE scanned once per
+    facet by a UNION ALL of three GROUP BYs.
+    """
+    rows = matched.select().cte("matched")
+    archived = func.coalesce(rows.c.is_archived, False)
+    statement = union_all(*(
+        select(literal(name).label("facet"), cast(value, String).label("value"), func.count().label("count"))
+        .select_from(rows)
+        .group_by(value)
+        for name, value in (
+            ("file_type", rows.c.file_type),
+            ("month", rows.c.month),
+            ("archived", case((archived, "true"), else_="false")),
+        )
+    ))
+    counts: Dict[str, Counter] = {"file_type": Counter(), "month": Counter(), "archived": Counter()}
+    for facet, value, count in db.execute(statement):
+        counts[facet][value == "true" if facet == "archived" else value] += count
+    return _facets(counts)
+
+
+def count_facets(rows: Iterable[Tuple[Optional[str], datetime, bool]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Facets of (file_type, created_at, is_archived) rows held in memory."""
+    counts: Dict[str, Counter] = {"file_type": Counter(), "month": Counter(), "archived": Counter()}
+    for file_type, created_at, is_archived in rows:
+        counts["file_type"][file_type] += 1
+        counts["month"][_utc(created_at).strftime("%Y-%m") if created_at else None] += 1
+        counts["archived"][bool(is_archived)] += 1
+    return _facets(counts)
+
+
+def _facets(counts: Dict[str, Counter]) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        "file_type": [
+            {"value": value, "count": count}
+            for value, count in sorted(counts["file_type"].items(), key=lambda item: (-item[1], item[0] or ""))
+        ],
+        "month": [
+            {"value": value, "count": count}
+            for value, count in sorted(counts["month"].items(), key=lambda item: item[0] or "", reverse=True)
+        ],
+        "archived": [
+            {"value": value, "count": counts["archived"][value]}
+            for value in (False, True) if counts["archived"][value]
+        ],
+    }
@@ -0,0 +1,472 @@
+import heapq
+import math
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.singleflight import SingleFlight, on_event_loop
+from app.db.session import SessionLocal
+from app.db.pagination import decode_cursor, encode_cursor
+from app.models.knowledge import Document
+from app.models.user import User
+from app.search import filters as search_filters
+from app.search.base import SearchBackend, search_hit
+from app.search.tokenizer import analyze, highlight, words
+
+# Title terms count this many times towards term frequency and document length
+TITLE_WEIGHT = 3
+
+
+class InvertedIndex:
+    """
+    Incrementally updatable inverted index with BM25 scoring.
+
+    Every indexed version of a document gets a new internal slot number. Posting
+    lists are pairs of typed arrays (slots, term frequencies) that only ever grow
+    at the end, so they stay sorted by slot. Updating or removing a document
+    just marks its old slot dead; dead slots are skipped while scoring and
+    dropped once they make up a quarter of the index.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._df: Dict[str, int] = {}
+        self._slot_doc = array("q")  # slot -> document id, -1 once dead
+        self._slot_len = array("I")  # slot -> weighted document length
+        self._slot_terms: List[Optional[Tuple[str, ...]]] = []
+        self._doc_slot: Dict[int, int] = {}
+        self._total_len = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_slot)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._doc_slot
+
+    def add(self, doc_id: int, title: Optional[str], content: Optional[str]) -> None:
+        """Index a document, replacing any previous version of it."""
+        self.remove(doc_id)
+        frequencies = Counter(analyze(content))
+        for term in analyze(title):
+            frequencies[term] += TITLE_WEIGHT
+        length = sum(frequencies.values())
+
+        slot = len(self._slot_doc)
+        self._slot_doc.append(doc_id)
+        self._slot_len.append(length)
+        self._slot_terms.append(tuple(frequencies))
+        self._doc_slot[doc_id] = slot
+        self._total_len += length
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(slot)
+            postings[1].append(min(tf, 0xFFFF))
+            self._df[term] = self._df.get(term, 0) + 1
+
+    def remove(self, doc_id: int) -> bool:
+        slot = self._doc_slot.pop(doc_id, None)
+        if slot is None:
+            return False
+        for term in self._slot_terms[slot]:
+            self._df[term] -= 1
+        self._slot_terms[slot] = None
+        self._slot_doc[slot] = -1
+        self._total_len -= self._slot_len[slot]
+        self._dead += 1
+        if self._dead * 4 > len(self._slot_doc):
+            self._compact()
+        return True
+
+    def search(self, terms: List[str]) -> Dict[int, float]:
+        """BM25 scores of the documents containing every one of terms."""
+        unique = sorted(set(terms), key=lambda term: self._df.get(term, 0))
+        if not unique or not self._doc_slot:
+            return {}
+        n = len(self._doc_slot)
+        avg_len = self._total_len / n or 1.0
+        k1, b = self.k1, self.b
+        slot_len = self._slot_len
+        slot_doc = self._slot_doc
+
+        scores: Optional[Dict[int, float]] = None
+        for term in unique:
+            df = self._df.get(term, 0)
+            if not df:
+                return {}
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            slots, tfs = self._postings[term]
+            if scores is None:
+                candidates = zip(slots, tfs)
+            elif len(scores) * 16 < len(slots):
+                # Few candidates left: probe the sorted posting list instead of scanning it
+                candidates = []
+                for slot in scores:
+                    i = bisect_left(slots, slot)
+                    if i < len(slots) and slots[i] == slot:
+                        candidates.append((slot, tfs[i]))
+            else:
+                candidates = ((slot, tf) for slot, tf in zip(slots, tfs) if slot in scores)
+            matched = {}
+            for slot, tf in candidates:
+                if slot_doc[slot] < 0:
+                    continue
+                norm = k1 * (1 - b + b * slot_len[slot] / avg_len)
+                matched[slot] = (scores[slot] if scores else 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            scores = matched
+            if not scores:
+                return {}
+        return {slot_doc[slot]: score for slot, score in scores.items()}
+
+    def _compact(self) -> None:
+        live = [slot for slot, doc_id in enumerate(self._slot_doc) if doc_id >= 0]
+        remap = {old: new for new, old in enumerate(live)}
+        self._slot_doc = array("q", (self._slot_doc[slot] for slot in live))
+        self._slot_len = array("I", (self._slot_len[slot] for slot in live))
+        self._slot_terms = [self._slot_terms[slot] for slot in live]
+        self._doc_slot = {doc_id: remap[slot] for doc_id, slot in self._doc_slot.items()}
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            kept = [(remap[slot], tf) for slot, tf in zip(slots, tfs) if slot in remap]
+            if kept:
+                postings[term] = (array("I", (s for s, _ in kept)), array("H", (t for _, t in kept)))
+        self._postings = postings
+        self._df = {term: df for term, df in self._df.items() if df > 0}
+        self._dead = 0
+
+
+class TitleIndex:
+    """
+    Prefix index over the words of document titles.
+
+    A compact alternative to a trie: the distinct title words are kept in one
+    sorted list, so the words starting with a prefix are a contiguous run
+    found by bisection, and each word maps to the documents whose title
+    contains it.
+    """
+
+    def __init__(self) -> None:
+        self._words: List[str] = []
+        self._docs: Dict[str, set] = {}
+        self._titles: Dict[int, Tuple[Optional[str], Tuple[str, ...]]] = {}
+
+    def title(self, doc_id: int) -> Optional[str]:
+        return self._titles[doc_id][0]
+
+    def add(self, doc_id: int, title: Optional[str]) -> None:
+        self.remove(doc_id)
+        title_words = tuple(set(words(title)))
+        self._titles[doc_id] = (title, title_words)
+        for word in title_words:
+            docs = self._docs.get(word)
+            if docs is None:
+                docs = self._docs[word] = set()
+                insort(self._words, word)
+            docs.add(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        entry = self._titles.pop(doc_id, None)
+        if entry is None:
+            return
+        for word in entry[1]:
+            docs = self._docs[word]
+            docs.discard(doc_id)
+            if not docs:
+                del self._docs[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def match(self, prefixes: List[str]) -> set:
+        """Documents with a title word starting with each of prefixes."""
+        matched: Optional[set] = None
+        for prefix in sorted(set(prefixes), key=len, reverse=True):
+            docs: set = set()
+            i = bisect_left(self._words, prefix)
+            while i < len(self._words) and self._words[i].startswith(prefix):
+                docs |= self._docs[self._words[i]]
+                i += 1
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                return set()
+        return matched or set()
+
+
+class _DocMeta(NamedTuple):
+    created_at: datetime
+    file_type: Optional[str]
+    is_archived: bool
+
+
+class _UserIndex:
+    def __init__(self, generation: int) -> None:
+        # The user's document generation the index reflects
+        self.generation = generation
+        self.lock = threading.RLock()
+        self.index = InvertedIndex()
+        self.titles = TitleIndex()
+        self.meta: Dict[int, _DocMeta] = {}
+
+    def add(self, document: Any) -> None:
+        self.index.add(document.id, document.title, document.content)
+        self.titles.add(document.id, document.title)
+        self.meta[document.id] = _DocMeta(
+            document.created_at, document.file_type, bool(document.is_archived)
+        )
+
+    def remove(self, id: int) -> None:
+        self.index.remove(id)
+        self.titles.remove(id)
+        self.meta.pop(id, None)
+
+    def advance(self, generation: int) -> bool:
+        """
+        Whether a write that left the user at `generation` may be applied in
+        place, moving the index to it. Call with the lock held. Only the next
+        write qualifies (or further changes of that same write): an index
+        that missed writes of other processes is left for the next search to
+        rebuild, and one already rebuilt past the write is left alone.
+        """
+        if generation - 1 <= self.generation <= generation:
+            self.generation = generation
+            return True
+        return False
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """
+    In-process search engine that works on any database, SQLite included.
+
+    A user's index is built from the database on their first search and
+    tagged with their document generation. This process's writes are applied
+    in place by CRUDDocument's write hooks; every search checks the
+    generation, and rebuilds the index when the user's documents were also
+    changed elsewhere (by another worker process or a management command).
+    Async callers build it in `prepare_async`, on a thread. At most
+    SEARCH_MEMORY_MAX_USERS indexes are kept, least recently used first out.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        self._builds = SingleFlight()
+
+    async def prepare_async(self, db: AsyncSession, *, user_id: int) -> None:
+        generation = await db.scalar(select(User.document_generation).where(User.id == user_id)) or 0
+        if self._current(user_id, generation) is None:
+            # Concurrent searches await the one build instead of blocking the loop
+            await self._builds.do_async(
+                (user_id, generation), lambda: run_in_threadpool(self._build_in_session, user_id, generation)
+            )
+
+    def index_document(self, document: Document, *, generation: int) -> None:
+        user_index = self._loaded(document.user_id)
+        if user_index is not None:
+            with user_index.lock:
+                if user_index.advance(generation):
+                    user_index.add(document)
+
+    def remove_document(self, *, id: int, user_id: int, generation: int) -> None:
+        user_index = self._loaded(user_id)
+        if user_index is not None:
+            with user_index.lock:
+                if user_index.advance(generation):
+                    user_index.remove(id)
+
+    def refresh_documents(self, db: Session, *, user_id: int, ids: List[int], generation: int) -> None:
+        user_index = self._loaded(user_id)
+        if user_index is None:
+            return
+        rows = self._index_rows(db).filter(Document.user_id == user_id, Document.id.in_(ids)).all() if ids else []
+        with user_index.lock:
+            if not user_index.advance(generation):
+                return
+            for row in rows:
+                user_index.add(row)
+            for id in set(ids) - {row.id for row in rows}:
+                user_index.remove(id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def search(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        page: int = 1,
+        limit: int = 20,
+        include_content: bool = True,
+        count: str = "exact",
+        sort: str = "relevance",
+        cursor: Optional[str] = None,
+        facets: bool = False,
+    ) -> Dict[str, Any]:
+        terms = analyze(query)
+        by_relevance = bool(terms) and sort == "relevance"
+        if cursor and by_relevance:
+            raise ValueError("Cursors are only supported for recency-ordered results")
+        after = decode_cursor(cursor) if cursor else None
+
+        # Filters are resolved by the database, in one indexed query for the ids passing them
+        allowed = search_filters.matching_ids(db, user_id=user_id, filters=filters)
+
+        user_index = self._user_index(db, user_id)
+        with user_index.lock:
+            if terms:
+                scores = user_index.index.search(terms)
+            else:
+                scores = dict.fromkeys(user_index.meta)
+            matches = [
+                (doc_id, score, user_index.meta[doc_id])
+                for doc_id, score in scores.items()
+                if allowed is None or doc_id in allowed
+            ]
+
+        if by_relevance:
+            matches.sort(key=lambda m: (m[1], m[2].created_at, m[0]), reverse=True)
+        else:
+            matches.sort(key=lambda m: (m[2].created_at, m[0]), reverse=True)
+        total = len(matches) if count != "none" else None
+        all_matches = matches
+
+        if after:
+            matches = [m for m in matches if (m[2].created_at, m[0]) < after]
+        else:
+            matches = matches[(page - 1) * limit:]
+        has_more = len(matches) > limit
+        page_matches = matches[:limit]
+
+        # Only the rows of the requested page are read from the database
+        rows_query = db.query(Document).filter(Document.id.in_([m[0] for m in page_matches]))
+        if not include_content and not terms:
+            rows_query = rows_query.options(defer(Document.content))
+        rows = {document.id: document for document in rows_query}
+
+        documents = []
+        for doc_id, score, _ in page_matches:
+            document = rows.get(doc_id)
+            if document is None:
+                continue
+            snippet = None
+            if terms:
+                snippet = highlight(document.content or "", set(terms), settings.SEARCH_SNIPPET_MAX_WORDS)
+            documents.append(search_hit(document, score, snippet, include_content))
+
+        next_cursor = None
+        if has_more and not by_relevance and page_matches:
+            last_id, _, last_meta = page_matches[-1]
+            next_cursor = encode_cursor(last_meta.created_at, last_id)
+
+        result = {
+            "documents": documents,
+            "total": total,
+            "total_is_estimate": False,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "page": page,
+            "limit": limit,
+        }
+        if facets:
+            result["facets"] = search_filters.count_facets(
+                (meta.file_type, meta.created_at, meta.is_archived) for _, _, meta in all_matches
+            )
+        return result
+
+    def suggest(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        prefix: str,
+        limit: int = 10,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Answered from the user's index alone, without a database query once it is built."""
+        prefixes = words(prefix)
+        if not prefixes:
+            return []
+        user_index = self._user_index(db, user_id)
+        with user_index.lock:
+            matched = [
+                (user_index.meta[doc_id].created_at, doc_id)
+                for doc_id in user_index.titles.match(prefixes)
+                if include_archived or not user_index.meta[doc_id].is_archived
+            ]
+            return [
+                {"id": doc_id, "title": user_index.titles.title(doc_id), "created_at": created_at}
+                for created_at, doc_id in heapq.nlargest(limit, matched)
+            ]
+
+    def _loaded(self, user_id: int) -> Optional[_UserIndex]:
+        with self._lock:
+            return self._users.get(user_id)
+
+    def _user_index(self, db: Session, user_id: int) -> _UserIndex:
+        generation = db.scalar(select(User.document_generation).where(User.id == user_id)) or 0
+        user_index = self._current(user_id, generation)
+        if user_index is not None:
+            return user_index
+        if on_event_loop():
+            # Under run_sync, after prepare_async: only a write committed since by
+            # another process gets here. Waiting on a build would block the loop.
+            user_index = self._build(db, user_id, generation)
+        else:
+            user_index = self._builds.do(
+                (user_id, generation), lambda: self._build(db, user_id, generation)
+            )
+        return self._store(user_id, user_index)
+
+    def _current(self, user_id: int, generation: int) -> Optional[_UserIndex]:
+        with self._lock:
+            user_index = self._users.get(user_id)
+            if user_index is None or user_index.generation != generation:
+                return None
+            self._users.move_to_end(user_id)
+            return user_index
+
+    def _store(self, user_id: int, user_index: _UserIndex) -> _UserIndex:
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None or current.generation <= user_index.generation:
+                self._users[user_id] = user_index
+                self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return user_index
+
+    def _build_in_session(self, user_id: int, generation: int) -> _UserIndex:
+        with SessionLocal() as db:
+            return self._store(user_id, self._build(db, user_id, generation))
+
+    def _build(self, db: Session, user_id: int, generation: int) -> _UserIndex:
+        user_index = _UserIndex(generation)
+        for row in self._index_rows(db).filter(Document.user_id == user_id).yield_per(1000):
+            user_index.add(row)
+        return user_index
+
+    @staticmethod
+    def _index_rows(db: Session) -> Any:
+        return db.query(
+            Document.id,
+            Document.title,
+            Document.content,
+            Document.created_at,
+            Document.file_type,
+            Document.is_archived,
+        )
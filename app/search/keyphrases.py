@@ -0,0 +1,113 @@
+"""
+Offline keyphrase extraction for automatic tagging.
+
+Candidate phrases are found as in RAKE: runs of words broken at stop words,
+punctuation and numbers, of at most MAX_PHRASE_WORDS words (the words of a
+longer run stand alone). Words are weighted by TF-IDF: 1 + log of their
+frequency in the document, times their inverse document frequency in the
+user's library. A phrase scores the sum of its word weights, times 1 + log
+of how often it occurs; the best phrases that share no word with a better
+one become the document's tags. A single word must occur at least twice
+(a title word always does) to be a tag.
+
+Document frequencies come from crud.tag, which keeps them current as
+documents are written, so that tagging a document reads one row per
+distinct term instead of the whole library.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from app.search.tokenizer import iter_words, words
+
+MAX_PHRASE_WORDS = 3
+MAX_TAG_CHARS = 64
+# Longer words (hashes, encoded data) are never tags nor counted
+MAX_WORD_CHARS = 40
+# Title words count this many times, as in the search indexes
+TITLE_WEIGHT = 3
+# Longer content is analyzed from its beginning only
+MAX_CONTENT_CHARS = 100_000
+
+# Punctuation between two words ends a phrase
+_BREAK_RE = re.compile(r"[^\w\s'-]")
+
+
+class DocumentTerms(NamedTuple):
+    # Term -> weighted frequency, for the candidate words only
+    frequencies: Counter
+    # Phrase as a tuple of terms -> occurrences of each of its spellings
+    phrases: Dict[Tuple[str, ...], Counter]
+
+
+def _runs(text: str) -> Iterator[List[Tuple[str, str]]]:
+    """Runs of (word, term) candidate words."""
+    run: List[Tuple[str, str]] = []
+    position = 0
+    for start, end, term in iter_words(text):
+        word = text[start:end].lower()
+        valid = bool(term) and len(word) <= MAX_WORD_CHARS and not word.isdigit()
+        if run and (not valid or _BREAK_RE.search(text, position, start)):
+            yield run
+            run = []
+        if valid:
+            run.append((word, term))
+        position = end
+    if run:
+        yield run
+
+
+def analyze_document(title: Optional[str], content: Optional[str]) -> DocumentTerms:
+    frequencies: Counter = Counter()
+    phrases: Dict[Tuple[str, ...], Counter] = {}
+    for text, weight in ((title or "", TITLE_WEIGHT), ((content or "")[:MAX_CONTENT_CHARS], 1)):
+        for run in _runs(text):
+            for _, term in run:
+                frequencies[term] += weight
+            if len(run) <= MAX_PHRASE_WORDS:
+                candidates = [(tuple(term for _, term in run), " ".join(word for word, _ in run))]
+            else:
+                candidates = [((term,), word) for word, term in run]
+            for key, spelling in candidates:
+                spellings = phrases.get(key)
+                if spellings is None:
+                    spellings = phrases[key] = Counter()
+                spellings[spelling] += weight
+    return DocumentTerms(frequencies, phrases)
+
+
+def extract(
+    document: DocumentTerms, df: Dict[str, int], documents: int, limit: int
+) -> List[Tuple[str, float]]:
+    """The best `limit` (tag, score) pairs, given the library's document frequencies."""
+    weights = {
+        term: (1 + math.log(tf)) * (math.log((1 + documents) / (1 + max(df.get(term, 0), 0))) + 1)
+        for term, tf in document.frequencies.items()
+    }
+    scored = sorted(
+        (
+            (1 + math.log(sum(spellings.values()))) * sum(weights[term] for term in key), key
+        )
+        for key, spellings in document.phrases.items()
+        if len(key) > 1 or sum(spellings.values()) > 1
+    )
+    tags: List[Tuple[str, float]] = []
+    seen = set()
+    used = set()
+    for score, key in reversed(scored):
+        if len(tags) == limit:
+            break
+        if used.intersection(key):
+            continue
+        name = normalize_tag(document.phrases[key].most_common(1)[0][0])
+        if not name or name in seen:
+            continue
+        used.update(key)
+        seen.add(name)
+        tags.append((name, round(score, 4)))
+    return tags
+
+
+def normalize_tag(name: str) -> str:
+    """The stored form of a tag name: lower-cased words separated by single spaces."""
+    return " ".join(words(name))[:MAX_TAG_CHARS].strip()
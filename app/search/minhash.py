@@ -0,0 +1,109 @@
+"""
+MinHash signatures for near-duplicate detection.
+
+A document's content is cut into overlapping shingles of SHINGLE_WORDS
+words. Its signature holds, for each of NUM_PERM random hash functions, the
+smallest hash of any shingle, so the share of equal positions in two
+signatures estimates the Jaccard similarity of their shingle sets.
+
+For lookups, a signature is split into BANDS bands of ROWS values and each
+band is hashed: documents sharing any band hash are candidates. With 16
+bands of 8 rows, pairs at a Jaccard similarity of 0.9 become candidates with
+a probability above 0.99, at 0.8 with 0.95 and at 0.5 with 0.06.
+"""
+import hashlib
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from app.search.tokenizer import words
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+# Longer content is compared on its beginning only
+MAX_CONTENT_CHARS = 200_000
+
+# Hash functions are (a * x + b) mod a Mersenne prime; products stay below 2**62
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)[:, None]
+
+
+def shingles(text: Optional[str]) -> Set[str]:
+    tokens = words((text or "")[:MAX_CONTENT_CHARS])
+    if len(tokens) <= SHINGLE_WORDS:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+
+
+def signature(title: Optional[str], content: Optional[str]) -> Optional[np.ndarray]:
+    """
+    Signature of the content, or of the title for documents without content;
+    None when there is no text at all.
+    """
+    document_shingles = shingles(content) or shingles(title)
+    if not document_shingles:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) % _PRIME for shingle in document_shingles),
+        dtype=np.uint64, count=len(document_shingles),
+    )
+    return ((_A * hashes + _B) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def band_hashes(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit hash per band, with the band number mixed in."""
+    return [
+        int.from_bytes(
+            hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8, salt=bytes([band])).digest(),
+            "big", signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype("<u4").tobytes()
+
+
+def from_bytes(data: Optional[bytes]) -> Optional[np.ndarray]:
+    if data is None or len(data) != NUM_PERM * 4:
+        return None
+    return np.frombuffer(data, dtype="<u4")
+
+
+class LshIndex:
+    """In-memory band index, for batch jobs over a whole library."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[int, List[int]] = defaultdict(list)
+
+    def add(self, id: int, sig: np.ndarray) -> None:
+        for band_hash in band_hashes(sig):
+            self._buckets[band_hash].append(id)
+
+    def candidates(self, sig: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for band_hash in band_hashes(sig):
+            found.update(self._buckets.get(band_hash, ()))
+        return found
+
+
+def best_match(
+    sig: np.ndarray, candidates: Iterable[Tuple[int, np.ndarray]], threshold: float
+) -> Optional[Tuple[int, float]]:
+    """(id, similarity) of the candidate most similar to sig, if at least `threshold`."""
+    best: Optional[Tuple[int, float]] = None
+    for id, candidate in candidates:
+        score = similarity(sig, candidate)
+        if score >= threshold and (best is None or score > best[1]):
+            best = (id, score)
+    return best
@@ -0,0 +1,175 @@
+import json
+from typing import Any, Dict, List, Optional
+from sqlalchemy import cast, func, literal_column
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Query, Session, defer
+from app.core.config import settings
+from app.db.pagination import apply_cursor, cursor_for
+from app.models.knowledge import SEARCH_CONFIG, Document, title_words_expression
+from app.search import filters as search_filters
+from app.search.base import SearchBackend, search_hit
+from app.search.tokenizer import words
+
+# What html.escape replaces, & first so that the other replacements are not escaped again
+HTML_ESCAPES = [("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ('"', "&quot;"), ("'", "&#x27;")]
+
+
+def html_escape_expression(text: Any) -> Any:
+    """SQL counterpart of html.escape."""
+    for character, entity in HTML_ESCAPES:
+        text = func.replace(text, character, entity)
+    return text
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    PostgreSQL full-text search over the stored, GIN-indexed `search_vector`.
+
+    Nothing to do on writes: CRUDDocument maintains the vector in the same
+    transaction as the row itself.
+    """
+
+    name = "postgres"
+
+    def search(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        page: int = 1,
+        limit: int = 20,
+        include_content: bool = True,
+        count: str = "exact",
+        sort: str = "relevance",
+        cursor: Optional[str] = None,
+        facets: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Results are ranked by relevance unless sort is "recent" or there is no
+        query; recency-ordered results can be paged with keyset cursors.
+        """
+        config = cast(SEARCH_CONFIG, REGCONFIG)
+        tsquery = func.plainto_tsquery(config, query)
+
+        # Base query
+        search_query = db.query(Document).filter(Document.user_id == user_id)
+
+        # Add text search if query is provided
+        if query:
+            search_query = search_query.filter(Document.search_vector.op("@@")(tsquery))
+
+        # Add filters if provided
+        where = search_filters.condition(filters, user_id=user_id)
+        if where is not None:
+            search_query = search_query.filter(where)
+
+        # Get total count
+        total = None
+        if count == "exact":
+            total = search_query.count()
+        elif count == "estimate":
+            total = self._estimate_rows(db, search_query)
+
+        # Rank and paginate on ids only; one extra row tells whether there is a next page
+        rank = func.ts_rank_cd(Document.search_vector, tsquery) if query else literal_column("NULL")
+        by_relevance = bool(query) and sort == "relevance"
+        page_query = search_query.with_entities(Document.id.label("id"), rank.label("rank")).order_by(
+            *([rank.desc()] if by_relevance else []), Document.created_at.desc(), Document.id.desc()
+        )
+        if cursor:
+            if by_relevance:
+                raise ValueError("Cursors are only supported for recency-ordered results")
+            page_query = apply_cursor(page_query, Document, cursor)
+        else:
+            page_query = page_query.offset((page - 1) * limit)
+        page_ids = page_query.limit(limit + 1).subquery()
+
+        # Snippets are generated only for the rows of the requested page. They are
+        # HTML: the content is escaped before ts_headline adds the <mark> tags
+        if query:
+            snippet = func.ts_headline(
+                config,
+                html_escape_expression(func.coalesce(Document.content, "")),
+                tsquery,
+                "StartSel=<mark>, StopSel=</mark>, "
+                f"MaxWords={settings.SEARCH_SNIPPET_MAX_WORDS}, "
+                f"MinWords={settings.SEARCH_SNIPPET_MIN_WORDS}, "
+                f"MaxFragments={settings.SEARCH_SNIPPET_MAX_FRAGMENTS}",
+            )
+        else:
+            snippet = literal_column("NULL")
+        rows_query = db.query(Document, page_ids.c.rank, snippet).join(
+            page_ids, Document.id == page_ids.c.id
+        )
+        if not include_content:
+            rows_query = rows_query.options(defer(Document.content))
+        rows = rows_query.order_by(
+            *([page_ids.c.rank.desc()] if by_relevance else []),
+            Document.created_at.desc(),
+            Document.id.desc(),
+        ).all()
+
+        has_more = len(rows) > limit
+        next_cursor = None
+        if has_more and not by_relevance:
+            next_cursor = cursor_for(rows[limit - 1][0])
+        documents = [
+            search_hit(document, rank, snippet, include_content)
+            for document, rank, snippet in rows[:limit]
+        ]
+
+        result = {
+            "documents": documents,
+            "total": total,
+            "total_is_estimate": count == "estimate",
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "page": page,
+            "limit": limit,
+        }
+        if facets:
+            result["facets"] = search_filters.facet_counts(db, search_query.with_entities(
+                Document.file_type,
+                search_filters.month_expression(db).label("month"),
+                Document.is_archived,
+            ).subquery())
+        return result
+
+    def suggest(
+        self,
+        db: Session,
+        *,
+        user_id: int,
+        prefix: str,
+        limit: int = 10,
+        include_archived: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Prefix tsquery against the GIN-indexed title_words_expression."""
+        prefixes = words(prefix)
+        if not prefixes:
+            return []
+        tsquery = func.to_tsquery(
+            literal_column("'simple'::regconfig"), " & ".join(f"'{word}':*" for word in prefixes)
+        )
+        query = db.query(Document.id, Document.title, Document.created_at).filter(
+            Document.user_id == user_id,
+            title_words_expression(Document.title).op("@@")(tsquery),
+        )
+        if not include_archived:
+            query = query.filter(Document.is_archived.isnot(True))
+        rows = query.order_by(Document.created_at.desc(), Document.id.desc()).limit(limit)
+        return [row._asdict() for row in rows]
+
+    @staticmethod
+    def _estimate_rows(db: Session, query: Query) -> int:
+        """Row count as estimated by the PostgreSQL planner, without scanning"""
+        compiled = query.statement.compile(dialect=db.get_bind().dialect)
+        params = compiled.params
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
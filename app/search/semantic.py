@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.singleflight import SingleFlight, on_event_loop
+from app.db.session import SessionLocal
+from app.models.knowledge import Document
+from app.models.user import User
+from app.search import embeddings
+from app.search import filters as search_filters
+
+# Reciprocal rank fusion constant: damps the weight of the very first ranks
+RRF_K = 60
+
+
+class AnnIndex:
+    """
+    Approximate nearest neighbours by random-hyperplane LSH.
+
+    Each of `tables` hash tables keys a vector by which side of `bits` random
+    hyperplanes it lies on, so vectors at a small angle tend to share buckets.
+    A query collects the rows of its own bucket and of the `bits` buckets one
+    hyperplane away in every table (multi-probe); the caller ranks those
+    candidates exactly.
+    """
+
+    def __init__(self, vectors: np.ndarray, *, tables: int = 8, bits: int = 12, seed: int = 0):
+        self.bits = bits
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables, vectors.shape[1], bits)).astype(np.float32)
+        self._weights = 1 << np.arange(bits)
+        codes = self._codes(vectors)
+        self._buckets: List[Dict[int, np.ndarray]] = []
+        for table in range(tables):
+            order = np.argsort(codes[:, table], kind="stable")
+            keys, starts = np.unique(codes[order, table], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self._buckets.append({int(key): order[start:end] for key, start, end in zip(keys, starts, ends)})
+
+    def _codes(self, vectors: np.ndarray) -> np.ndarray:
+        """(rows, tables) bucket keys."""
+        return (np.einsum("nd,tdb->ntb", vectors, self._planes) > 0) @ self._weights
+
+    def candidates(self, vector: np.ndarray) -> np.ndarray:
+        found = []
+        for buckets, code in zip(self._buckets, self._codes(vector[None, :])[0]):
+            for probe in (code, *(code ^ (1 << bit) for bit in range(self.bits))):
+                rows = buckets.get(int(probe))
+                if rows is not None:
+                    found.append(rows)
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+
+
+class _UserVectors:
+    def __init__(self, generation: int, ids: List[int], vectors: np.ndarray, ann_min_documents: int):
+        self.generation = generation
+        self.ids = np.array(ids, dtype=np.int64)
+        self.vectors = vectors
+        self.positions = {id: i for i, id in enumerate(ids)}
+        self.ann = AnnIndex(vectors) if len(ids) >= ann_min_documents else None
+
+    def nearest(
+        self, vector: np.ndarray, *, limit: int, exclude: Optional[int], only: Optional[Set[int]]
+    ) -> List[Tuple[int, float]]:
+        rows = None
+        if only is not None:
+            # Filtered: rank exactly the documents that passed the filters
+            rows = np.array(sorted(self.positions[id] for id in only if id in self.positions), dtype=np.intp)
+        elif self.ann is not None:
+            rows = self.ann.candidates(vector)
+            if len(rows) < limit * 4:
+                # Too few candidates to trust: rank everything exactly
+                rows = None
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        if exclude is not None:
+            rows = rows[self.ids[rows] != exclude]
+        scores = self.vectors[rows] @ vector
+        if len(rows) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [
+            (int(self.ids[rows[i]]), float(scores[i])) for i in order if scores[i] > 0
+        ]
+
+
+class SemanticIndex:
+    """
+    Per-user vector indexes for semantic search, held in process.
+
+    A user's index is built from the stored embeddings (embedding the
+    documents that have none yet on the fly) and tagged with the user's
+    document generation. It is rebuilt on the first query after any write,
+    by any worker, changes the generation; async callers build it in
+    `prepare_async`, on a thread. Users with at least
+    `ann_min_documents` documents are queried through an AnnIndex, smaller
+    ones exactly. At most `max_users` indexes are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, *, max_users: int = 1000, ann_min_documents: int = 2000):
+        self.max_users = max_users
+        self.ann_min_documents = ann_min_documents
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[int, _UserVectors]" = OrderedDict()
+        self._builds = SingleFlight()
+
+    async def prepare_async(self, db: AsyncSession, *, user_id: int) -> None:
+        """
+        Bring the user's index up to date from the event loop, before `nearest`
+        or `vector` run under AsyncSession.run_sync.
+        """
+        generation = await db.scalar(select(User.document_generation).where(User.id == user_id)) or 0
+        if self._current(user_id, generation) is None:
+            # Embedding and building the ANN index are CPU work: keep them off the loop
+            await self._builds.do_async(
+                (user_id, generation), lambda: run_in_threadpool(self._build_in_session, user_id, generation)
+            )
+
+    def nearest(
+        self, db: Session, *, user_id: int, vector: np.ndarray, limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None, exclude: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """(document id, cosine similarity) of the closest documents, best first."""
+        only = search_filters.matching_ids(db, user_id=user_id, filters=filters)
+        return self._user_vectors(db, user_id).nearest(vector, limit=limit, exclude=exclude, only=only)
+
+    def vector(self, db: Session, *, user_id: int, id: int) -> Optional[np.ndarray]:
+        user_vectors = self._user_vectors(db, user_id)
+        position = user_vectors.positions.get(id)
+        return None if position is None else user_vectors.vectors[position]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def _user_vectors(self, db: Session, user_id: int) -> _UserVectors:
+        generation = db.scalar(select(User.document_generation).where(User.id == user_id)) or 0
+        user_vectors = self._current(user_id, generation)
+        if user_vectors is not None:
+            return user_vectors
+        if on_event_loop():
+            # Under run_sync, after prepare_async: only a write committed since
+            # gets here. Waiting on a build would block the loop.
+            user_vectors = self._build(db, user_id, generation)
+        else:
+            user_vectors = self._builds.do(
+                (user_id, generation), lambda: self._build(db, user_id, generation)
+            )
+        return self._store(user_id, user_vectors)
+
+    def _current(self, user_id: int, generation: int) -> Optional[_UserVectors]:
+        with self._lock:
+            user_vectors = self._users.get(user_id)
+            if user_vectors is None or user_vectors.generation != generation:
+                return None
+            self._users.move_to_end(user_id)
+            return user_vectors
+
+    def _store(self, user_id: int, user_vectors: _UserVectors) -> _UserVectors:
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None or current.generation <= user_vectors.generation:
+                self._users[user_id] = user_vectors
+                self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return user_vectors
+
+    def _build_in_session(self, user_id: int, generation: int) -> _UserVectors:
+        with SessionLocal() as db:
+            return self._store(user_id, self._build(db, user_id, generation))
+
+    def _build(self, db: Session, user_id: int, generation: int) -> _UserVectors:
+        rows = db.execute(
+            select(Document.id, Document.embedding)
+            .where(Document.user_id == user_id)
+            .order_by(Document.id)
+        ).all()
+        vectors = {row.id: embeddings.from_bytes(row.embedding) for row in rows}
+        missing = [id for id, vector in vectors.items() if vector is None]
+        for id, title, content in self._documents(db, missing):
+            vectors[id] = embeddings.embed(title, content)
+        return _UserVectors(
+            generation,
+            [row.id for row in rows],
+            np.stack([vectors[row.id] for row in rows]) if rows
+            else np.empty((0, settings.SEARCH_EMBEDDING_DIM), dtype=np.float32),
+            self.ann_min_documents,
+        )
+
+    @staticmethod
+    def _documents(db: Session, ids: Sequence[int], batch_size: int = 500) -> Any:
+        for start in range(0, len(ids), batch_size):
+            yield from db.execute(
+                select(Document.id, Document.title, Document.content)
+                .where(Document.id.in_(ids[start:start + batch_size]))
+            )
+
+
+def reciprocal_rank_fusion(*rankings: Sequence[int], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Merge rankings of document ids into one, scoring each id by sum(1 / (k + rank))."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
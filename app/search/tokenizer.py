@@ -0,0 +1,95 @@
+"""
+Text analysis shared by the in-process search engines.
+
+`analyze` turns text into index terms: lower-cased word tokens with English
+stop words removed and a light suffix-stripping stemmer applied, so that
+"Indexes", "indexing" and "index" end up as the same term.
+"""
+import html
+import re
+from typing import Iterator, List, Set, Tuple
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been
+    before being below between both but by can could did do does doing down during
+    each few for from further had has have having he her here hers herself him
+    himself his how i if in into is it its itself just me more most my myself no
+    nor not now of off on once only or other our ours ourselves out over own same
+    she should so some such than that the their theirs them themselves then there
+    these they this those through to too under until up very was we were what when
+    where which while who whom why will with would you your yours yourself
+    yourselves
+    """.split()
+)
+
+
+def stem(word: str) -> str:
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        return word[:-3]
+    if word.endswith("ed") and len(word) > 4:
+        return word[:-2]
+    return word
+
+
+def term_for(token: str) -> str:
+    """Normalize a single raw token; returns "" for stop words."""
+    token = token.lower()
+    if token in STOPWORDS:
+        return ""
+    return stem(token)
+
+
+def analyze(text: str) -> List[str]:
+    terms = []
+    for match in WORD_RE.finditer(text or ""):
+        term = term_for(match.group())
+        if term:
+            terms.append(term)
+    return terms
+
+
+def words(text: str) -> List[str]:
+    """Lower-cased words, neither stemmed nor stop-word filtered (for prefix matching)."""
+    return [match.group().lower() for match in WORD_RE.finditer(text or "")]
+
+
+def iter_words(text: str) -> Iterator[Tuple[int, int, str]]:
+    """(start, end, term) for every word of text, term being "" for stop words."""
+    for match in WORD_RE.finditer(text or ""):
+        yield match.start(), match.end(), term_for(match.group())
+
+
+def highlight(text: str, terms: Set[str], max_words: int) -> str:
+    """
+    Return a window of at most max_words words around the first word matching
+    one of terms as HTML: the text is escaped and matching words are wrapped
+    in <mark></mark>.
+    """
+    words = list(iter_words(text))
+    if not words:
+        return ""
+    first = next((i for i, (_, _, term) in enumerate(words) if term in terms), 0)
+    start = max(0, min(first - max_words // 3, len(words) - max_words))
+    window = words[start:start + max_words]
+
+    parts = []
+    position = window[0][0]
+    for word_start, word_end, term in window:
+        parts.append(html.escape(text[position:word_start]))
+        if term in terms:
+            parts.append(f"<mark>{html.escape(text[word_start:word_end])}</mark>")
+        else:
+            parts.append(html.escape(text[word_start:word_end]))
+        position = word_end
+    return "".join(parts)
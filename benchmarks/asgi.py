@@ -0,0 +1,127 @@
+"""
+A minimal in-process HTTP client for ASGI applications.
+
+Requests are passed to the application as ASGI calls in the same event
+loop, with no sockets and no HTTP parsing, so that measured latency is the
+application's own.
+"""
+import asyncio
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+
+class Response:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class ASGIClient:
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def startup(self) -> None:
+        await self.app.router.startup()
+
+    async def shutdown(self) -> None:
+        await self.app.router.shutdown()
+
+    async def request(
+        self, method: str, path: str, *, params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None, body: bytes = b""
+    ) -> Response:
+        headers = dict(headers or {})
+        headers.setdefault("host", "bench")
+        headers["content-length"] = str(len(body))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(params or {}).encode(),
+            "root_path": "",
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        sent = False
+        # Waited on once the body is sent: a streaming response listens for a disconnect
+        disconnected = asyncio.get_running_loop().create_future()
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await disconnected
+
+        status = 500
+        response_headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+
+        async def send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update(
+                    (name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            # A server logs the exception and answers 500 (which Starlette has already sent)
+            return Response(500, response_headers, repr(e).encode())
+        finally:
+            disconnected.cancel()
+        return Response(status, response_headers, b"".join(chunks))
+
+    async def get(self, path: str, **kwargs: Any) -> Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post_json(self, path: str, data: Any, *, headers: Optional[Dict[str, str]] = None) -> Response:
+        return await self.request(
+            "POST", path, headers={**(headers or {}), "content-type": "application/json"},
+            body=json.dumps(data).encode(),
+        )
+
+    async def post_form(self, path: str, data: Dict[str, str], *, headers: Optional[Dict[str, str]] = None) -> Response:
+        return await self.request(
+            "POST", path, headers={**(headers or {}), "content-type": "application/x-www-form-urlencoded"},
+            body=urlencode(data).encode(),
+        )
+
+    async def post_file(
+        self, path: str, *, fields: Dict[str, str], filename: str, content: bytes,
+        content_type: str = "text/plain", headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        """POST a multipart form with one file (the `file` field) and text fields."""
+        body, boundary = multipart(fields, filename=filename, content=content, content_type=content_type)
+        return await self.request(
+            "POST", path, headers={**(headers or {}), "content-type": f"multipart/form-data; boundary={boundary}"},
+            body=body,
+        )
+
+
+def multipart(
+    fields: Dict[str, str], *, filename: str, content: bytes, content_type: str
+) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), boundary
@@ -0,0 +1,312 @@
+"""
+Benchmark the API in-process.
+
+Boots app.main:app in this process against a fresh SQLite database (or the
+throwaway database given by --database-url), seeds synthetic users and
+documents (see benchmarks.seed), then sends every operation --requests
+times from --concurrency concurrent clients through an in-process ASGI
+client. Reports throughput and p50/p95/p99 latency per operation as JSON,
+and with --compare exits with status 1 when an operation got slower than
+a saved result by more than --tolerance.
+
+Operations: login, get, list, search, cold_search, upload and bulk. Reads
+run first, as writes invalidate the caches. Every operation cycles through
+all users, after a warm-up of at least one request per user that is not
+measured (it builds the in-process search indexes, for instance).
+cold_search measures what the warm-up hides: every request drops the
+in-process search indexes, then sends concurrent keyword searches, a
+typeahead and a hybrid search for one user, which all wait for the same
+index builds. Its requests run one at a time: the concurrency is within each.
+
+Usage:
+    python -m benchmarks.run                                   # 1k documents on SQLite
+    python -m benchmarks.run --scale 100k --output before.json
+    python -m benchmarks.run --scale 100k --compare before.json
+    python -m benchmarks.run --database-url sqlite:///bench-1m.db --scale 1m --reuse
+    python -m benchmarks.run --database-url postgresql://localhost/nibblify_bench --operations search,list
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+import numpy as np
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+OPERATIONS = ("login", "get", "list", "search", "cold_search", "upload", "bulk")
+# Search terms are drawn from these vocabulary ranks: common words, not the most common ones
+SEARCH_RANKS = (10, 2000)
+
+
+def configure(database_url: str, workdir: str) -> None:
+    """Point the application at the benchmark database and scratch directories; before importing it."""
+    os.environ["SQLALCHEMY_DATABASE_URI"] = database_url
+    # Never read from the replicas of a real deployment configured in .env
+    os.environ["SQLALCHEMY_REPLICA_URIS"] = "[]"
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["SEARCH_CACHE_DIR"] = os.path.join(workdir, "search_cache")
+    os.environ["AUTH_CACHE_INVALIDATION_FILE"] = os.path.join(workdir, "auth_invalidations")
+
+
+def operations(client: Any, seeded: Any, *, rng: random.Random, bulk_size: int) -> Dict[str, Callable[[int], Awaitable[Any]]]:
+    """Request i of each operation, as a coroutine function of i."""
+    from app.core import security
+    from app.core.config import settings
+    from app.search import search_backend, semantic_index
+    from benchmarks import seed as seeding
+
+    api = settings.API_V1_STR
+    words = seeding.vocabulary()
+    tokens = {id: security.create_access_token(id) for id, _ in seeded.users}
+
+    def user(i: int) -> Any:
+        return seeded.users[i % len(seeded.users)]
+
+    def auth(i: int) -> Dict[str, str]:
+        return {"authorization": f"Bearer {tokens[user(i)[0]]}"}
+
+    def text(count: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(count))
+
+    async def login(i: int) -> Any:
+        return await client.post_form(
+            f"{api}/auth/login/access-token", {"username": user(i)[1], "password": seeding.PASSWORD}
+        )
+
+    async def get(i: int) -> Any:
+        ids = seeded.documents[user(i)[0]]
+        id = ids[rng.randrange(len(ids))] if ids else 0
+        return await client.get(f"{api}/knowledge/documents/{id}", headers=auth(i))
+
+    async def list_(i: int) -> Any:
+        return await client.get(f"{api}/knowledge/documents", params={"limit": 20}, headers=auth(i))
+
+    def query() -> str:
+        return " ".join(words[rng.randrange(*SEARCH_RANKS)] for _ in range(rng.randint(1, 2)))
+
+    async def search(i: int) -> Any:
+        return await client.post_json(
+            f"{api}/knowledge/documents/search", {"query": query(), "limit": 20}, headers=auth(i)
+        )
+
+    async def cold_search(i: int) -> Any:
+        search_backend.clear()
+        semantic_index.clear()
+        responses = await asyncio.gather(
+            search(i),
+            search(i),
+            client.get(f"{api}/knowledge/documents/typeahead", params={"q": query()[:3]}, headers=auth(i)),
+            client.post_json(
+                f"{api}/knowledge/documents/search", {"query": query(), "limit": 20, "mode": "hybrid"},
+                headers=auth(i),
+            ),
+        )
+        # The slowest of them is the latency; a failure of any counts as an error
+        return max(responses, key=lambda response: response.status)
+
+    async def upload(i: int) -> Any:
+        return await client.post_file(
+            f"{api}/knowledge/documents/upload", fields={"title": f"Upload {i}"},
+            filename=f"upload-{i}.txt", content=text(200).encode(), headers=auth(i),
+        )
+
+    async def bulk(i: int) -> Any:
+        documents = [{"title": f"Bulk {i}.{n}", "content": text(100)} for n in range(bulk_size)]
+        return await client.post_json(f"{api}/knowledge/documents/bulk", {"documents": documents}, headers=auth(i))
+
+    return {
+        "login": login, "get": get, "list": list_, "search": search, "cold_search": cold_search,
+        "upload": upload, "bulk": bulk,
+    }
+
+
+async def measure(
+    call: Callable[[int], Awaitable[Any]], *, requests: int, concurrency: int, warmup: int
+) -> Dict[str, Any]:
+    for i in range(warmup):
+        await call(i)
+    latencies: List[float] = []
+    errors: List[Any] = []
+    # Shared by the clients: each request index is sent once
+    indexes = iter(range(warmup, warmup + requests))
+
+    async def run_client() -> None:
+        for i in indexes:
+            start = time.perf_counter()
+            response = await call(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status >= 400:
+                errors.append(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    milliseconds = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+    result = {
+        "requests": requests,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(milliseconds.mean()), 2),
+        "max_ms": round(float(milliseconds.max()), 2),
+    }
+    if errors:
+        result["first_error"] = f"{errors[0].status} {errors[0].body[:200].decode(errors='replace')}"
+    return result
+
+
+async def benchmark(args: argparse.Namespace, documents: int) -> Dict[str, Any]:
+    # Imported once configure() has set the environment
+    from sqlalchemy import func, select
+    from app.core.config import settings
+    from app.db.migrate import migrate
+    from app.db.session import engine
+    from app.main import app
+    from app.models.user import User
+    from app.search import search_backend
+    from benchmarks import seed as seeding
+    from benchmarks.asgi import ASGIClient
+
+    migrate(engine)
+    seeded = seeding.load(engine)
+    seed_seconds = None
+    if seeded.users:
+        if not args.reuse:
+            sys.exit("The database already holds benchmark data: pass --reuse to benchmark it again")
+    else:
+        with engine.connect() as conn:
+            if conn.scalar(select(func.count()).select_from(User)):
+                sys.exit("Refusing to seed a database that has users: use a throwaway database")
+        print(f"Seeding {args.users} users and {documents} documents", file=sys.stderr)
+        start = time.perf_counter()
+        seeded = seeding.seed(
+            engine, users=args.users, documents=documents, words_per_document=args.words, seed=args.seed
+        )
+        seed_seconds = round(time.perf_counter() - start, 1)
+
+    client = ASGIClient(app)
+    await client.startup()
+    results: Dict[str, Any] = {}
+    try:
+        calls = operations(client, seeded, rng=random.Random(args.seed), bulk_size=args.bulk_size)
+        for name in args.operations:
+            print(f"Running {name}", file=sys.stderr)
+            results[name] = await measure(
+                calls[name], requests=args.requests,
+                # Each cold_search request is a burst of concurrent ones that must find the indexes empty
+                concurrency=1 if name == "cold_search" else args.concurrency,
+                warmup=max(args.warmup, len(seeded.users)),
+            )
+    finally:
+        await client.shutdown()
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "search_backend": search_backend.name,
+            "search_cache": settings.SEARCH_CACHE_BACKEND,
+            "users": len(seeded.users),
+            "documents": sum(len(ids) for ids in seeded.documents.values()),
+            "seed_seconds": seed_seconds,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "bulk_size": args.bulk_size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Operations whose p95 latency or throughput got worse than the baseline's by more than tolerance."""
+    regressions = []
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+def _commit() -> Any:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process")
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="documents to seed")
+    parser.add_argument("--documents", type=int, help="documents to seed, overrides --scale")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--words", type=int, default=120, help="average words per seeded document")
+    parser.add_argument("--database-url", help="a throwaway database (default: a temporary SQLite file)")
+    parser.add_argument("--reuse", action="store_true", help="benchmark a database seeded by an earlier run")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="comma-separated subset to run")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per operation")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--bulk-size", type=int, default=100, help="documents per bulk request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression")
+    args = parser.parse_args()
+    args.operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    unknown = set(args.operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="nibblify-bench-")
+    try:
+        configure(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}", workdir)
+        results = asyncio.run(benchmark(args, args.documents or SCALES[args.scale]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'operation':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}", file=sys.stderr)
+    for name, result in results["results"].items():
+        print(
+            f"{name:<10}{result['throughput_rps']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['errors']:>8}",
+            file=sys.stderr,
+        )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Synthetic users and documents for the benchmarks.
+
+Rows are inserted with multi-row Core INSERTs, bypassing the CRUD layer, so
+that a million documents take minutes rather than hours: seeded documents
+get no tags, MinHash signatures or embeddings. Keyword search still works:
+the in-process index is built from the rows on first search, and the
+PostgreSQL search vectors are filled in by app.db.reindex.
+
+Words are drawn from a fixed synthetic vocabulary with Zipf-distributed
+frequencies, as in natural text, so that search terms range from very
+common to rare. Everything is derived from the seed: the same arguments
+seed the same data.
+"""
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Tuple
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+from app.core.security import get_password_hash
+from app.db.reindex import reindex_documents
+from app.db.session import SessionLocal
+from app.models.knowledge import Document
+from app.models.user import User
+from app.search.filters import url_domain
+
+PASSWORD = "benchmark-password"
+EMAIL_DOMAIN = "bench.example.com"
+VOCABULARY_SIZE = 20_000
+FILE_TYPES = [None, None, "txt", "md", "pdf", "html"]
+DOMAINS = ["example.com", "docs.example.com", "wiki.example.org", "blog.example.net", "news.example.io"]
+# Documents are created over this period
+HISTORY = timedelta(days=2 * 365)
+
+_SYLLABLES = [
+    consonant + vowel
+    for consonant in "bcdfghjklmnprstvz"
+    for vowel in ("a", "e", "i", "o", "u", "ai", "ou")
+]
+
+
+class Seeded(NamedTuple):
+    # (id, email) of each benchmark user
+    users: List[Tuple[int, str]]
+    # User id -> ids of their documents
+    documents: Dict[int, List[int]]
+
+
+def vocabulary() -> List[str]:
+    """VOCABULARY_SIZE distinct pronounceable words, in rank order (see zipf_probabilities)."""
+    words = []
+    for length in itertools.count(2):
+        for combination in itertools.product(_SYLLABLES, repeat=length):
+            words.append("".join(combination))
+            if len(words) == VOCABULARY_SIZE:
+                rng = random.Random(0)
+                rng.shuffle(words)
+                return words
+
+
+def zipf_probabilities(size: int) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1)
+    return weights / weights.sum()
+
+
+def email(n: int) -> str:
+    return f"user{n}@{EMAIL_DOMAIN}"
+
+
+def seed(
+    engine: Engine, *, users: int, documents: int, words_per_document: int = 120,
+    batch_size: int = 5000, seed: int = 0
+) -> Seeded:
+    """Insert the users and documents; the database must not hold benchmark users yet."""
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary())
+    probabilities = zipf_probabilities(len(words))
+    hashed_password = get_password_hash(PASSWORD)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "email": email(n), "hashed_password": hashed_password, "full_name": f"Benchmark user {n}",
+                "is_active": True, "is_superuser": False, "document_generation": 0,
+            }
+            for n in range(users)
+        ])
+        user_ids = list(conn.execute(
+            select(User.id).where(User.email.like(f"%@{EMAIL_DOMAIN}")).order_by(User.id)
+        ).scalars())
+
+    for start in range(0, documents, batch_size):
+        count = min(batch_size, documents - start)
+        title_lengths = rng.integers(3, 9, size=count)
+        content_lengths = rng.integers(words_per_document // 2, words_per_document * 3 // 2 + 1, size=count)
+        sampled = words[rng.choice(len(words), size=int(title_lengths.sum() + content_lengths.sum()), p=probabilities)]
+        owners = rng.integers(0, len(user_ids), size=count)
+        ages = rng.random(size=count) * HISTORY.total_seconds()
+        kinds = rng.integers(0, len(FILE_TYPES), size=count)
+        domains = rng.integers(-len(DOMAINS), len(DOMAINS), size=count)
+        archived = rng.random(size=count) < 0.1
+        rows = []
+        position = 0
+        for i in range(count):
+            title = " ".join(sampled[position:position + title_lengths[i]]).capitalize()
+            position += title_lengths[i]
+            content = " ".join(sampled[position:position + content_lengths[i]])
+            position += content_lengths[i]
+            # Negative draws leave the document without a URL
+            url = f"https://{DOMAINS[domains[i]]}/{start + i}" if domains[i] >= 0 else None
+            rows.append({
+                "title": title,
+                "content": content,
+                "file_type": FILE_TYPES[kinds[i]],
+                "url": url,
+                "url_domain": url_domain(url),
+                "is_archived": bool(archived[i]),
+                "user_id": user_ids[owners[i]],
+                "created_at": now - timedelta(seconds=float(ages[i])),
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Document), rows)
+
+    if engine.dialect.name == "postgresql":
+        db = SessionLocal(bind=engine)
+        try:
+            reindex_documents(db, batch_size=batch_size)
+        finally:
+            db.close()
+    return load(engine)
+
+
+def load(engine: Engine) -> Seeded:
+    """The benchmark users and their documents, from a seeded database."""
+    with engine.connect() as conn:
+        users = conn.execute(
+            select(User.id, User.email).where(User.email.like(f"%@{EMAIL_DOMAIN}")).order_by(User.id)
+        ).all()
+        documents: Dict[int, List[int]] = {id: [] for id, _ in users}
+        rows = conn.execution_options(yield_per=10_000).execute(
+            select(Document.user_id, Document.id).where(Document.user_id.in_(list(documents)))
+        )
+        for user_id, id in rows:
+            documents[user_id].append(id)
+    return Seeded([(id, email) for id, email in users], documents)